@@ -1,6 +1,23 @@
 from maix import camera, display, image, nn, app, gpio, pinmap, sys, err, uart, time, network
 from maix.touchscreen import TouchScreen
 import socket
+import os
+import sys as pysys
+import time as pytime
+import datetime
+import json
+import queue
+import cProfile
+import hmac
+import hashlib
+import select
+import threading
+import gc
+import mmap
+import struct
+import tracemalloc
+from array import array
+from collections import deque
 
 device_id = sys.device_id()
 
@@ -12,6 +29,42 @@ except Exception as e:
     print(f"Ошибка инициализации TouchScreen: {e}")
     touchscreen = None
 
+# Сообщение OBSTACLE в заранее выделенном буфере
+class ObstaclePacket:
+    """
+    UDP-сообщение в готовом буфере: пересобирается только при изменении данных,
+    цифры SEQ пишутся на место, отправка через заранее сделанные срезы.
+    """
+    def __init__(self, size=128):
+        self.buf = bytearray(size)
+        view = memoryview(self.buf)
+        self.views = [view[:n] for n in range(size + 1)]
+        self.msg_len = 0
+        self.seq_at = 0  # где в пакете начинается номер после ":SEQ:"
+        self.obstacle = None
+        self.count = None
+        self.angle = None
+        self.level = None
+        self.occupied = None
+
+    def set_message(self, msg):
+        msg = msg[:len(self.buf) - 10]
+        self.msg_len = len(msg)
+        msg += b":SEQ:"
+        self.buf[:len(msg)] = msg
+        self.seq_at = len(msg)
+
+    def put_seq(self, v):
+        """Номер дописывается цифрами прямо в буфер, возвращает длину пакета"""
+        n = self.seq_at + (5 if v >= 10000 else 4 if v >= 1000 else 3 if v >= 100 else 2 if v >= 10 else 1)
+        i = n
+        while True:
+            i -= 1
+            self.buf[i] = 48 + v % 10
+            v //= 10
+            if not v:
+                return n
+
 # Настройка Wi-Fi
 class WiFiManager:
     def __init__(self):
@@ -19,7 +72,11 @@ class WiFiManager:
         self.udp_socket = None
         self.esp32_ip = "192.168.4.1"  # IP ESP32 в режиме AP
         self.esp32_port = 8888
+        self.esp32_addr = (self.esp32_ip, self.esp32_port)
         self.connected = False
+        self._packet = ObstaclePacket()  # сообщение пересобирается только при изменении данных
+        self.seq = 0  # номер сообщения: по нему приемник видит потери и перестановки
+        self.send_seq = False  # ":SEQ:n" в конце (AOG_Simulator.py); прошивка ESP32 его не ждет
         
     def connect(self, ssid, password, timeout=30):
         print(f"📡 Подключение к Wi-Fi: {ssid}")
@@ -49,9 +106,17 @@ class WiFiManager:
             return False
             
         try:
-            # Формат: "OBSTACLE:1:COUNT:2:ANGLE:12.5"
-            message = f"OBSTACLE:{1 if has_obstacle else 0}:COUNT:{obstacle_count}:ANGLE:{steering_angle:.1f}"
-            self.udp_socket.sendto(message.encode('utf-8'), (self.esp32_ip, self.esp32_port))
+            # Формат: "OBSTACLE:1:COUNT:2:ANGLE:12.5", с send_seq еще ":SEQ:17"
+            p = self._packet
+            if has_obstacle != p.obstacle or obstacle_count != p.count or steering_angle != p.angle:
+                message = f"OBSTACLE:{1 if has_obstacle else 0}:COUNT:{obstacle_count}:ANGLE:{steering_angle:.1f}"
+                p.set_message(message.encode('utf-8'))
+                p.obstacle = has_obstacle
+                p.count = obstacle_count
+                p.angle = steering_angle
+            self.seq = (self.seq + 1) & 0xFFFF
+            n = p.put_seq(self.seq) if self.send_seq else p.msg_len
+            self.udp_socket.sendto(p.views[n], self.esp32_addr)
             return True
         except Exception as e:
             print(f"❌ Ошибка отправки UDP: {e}")
@@ -59,30 +124,868 @@ class WiFiManager:
 
 # Класс для приема угла от ESP32
 class AngleReceiver:
-    def __init__(self):
-        self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.udp_socket.settimeout(0.1)  # Таймаут 100мс
-        self.udp_socket.bind(("0.0.0.0", 8889))  # Слушаем порт 8889 для приема угла
+    # PGN AgOpenGPS/AgIO: 0x80 0x81 src pgn len данные... crc
+    PGN_HEAD = struct.Struct("<BBBBB")
+    STEER_DATA = struct.Struct("<HBhBBB")     # PGN 254 от AgIO: скорость*10, статус, заданный угол*100, xte, sc1-8, sc9-16
+    FROM_AUTOSTEER = struct.Struct("<hhhBB")  # PGN 253 от модуля руля: фактический угол*100, курс, крен, switch, pwm
+
+    def __init__(self, listen_port=8889, mode="text", pgn_ports=(8888, 9999), angle_source="actual", angle_sign=1):
+        self.mode = mode                  # "text" - ANGLE:x от ESP32, "pgn" - рассылка AgIO напрямую
+        self.timeout = 0.1  # Таймаут 100мс
         self.current_angle = 0.0
+        self.max_drain = 32  # сколько накопившихся пакетов вычитывать за кадр
+
+        # PGN: заданный и фактический угол, скорость
+        self.angle_source = angle_source  # "actual" или "set"
+        self.angle_sign = angle_sign
+        self.set_angle = 0.0
+        self.actual_angle = 0.0
+        self.speed_kmh = 0.0
+        self.steer_status = 0
+        self.last_set_ms = 0
+        self.last_actual_ms = 0
+        self.crc_errors = 0
+        self._buf = bytearray(64)
+
+        if mode == "pgn":
+            self.sockets = []
+            for port in pgn_ports:
+                s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                s.bind(("0.0.0.0", port))
+                s.setblocking(False)
+                self.sockets.append(s)
+            self.udp_socket = self.sockets[0]
+        else:
+            self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.udp_socket.settimeout(self.timeout)
+            self.udp_socket.bind(("0.0.0.0", listen_port))  # Слушаем порт 8889 для приема угла
         
+    def _parse(self, data):
+        try:
+            message = data.decode('utf-8').strip()
+        except UnicodeDecodeError:
+            return False
+        if message.startswith("ANGLE:"):
+            angle_str = message.replace("ANGLE:", "").strip()
+            try:
+                self.current_angle = float(angle_str)
+                return True
+            except ValueError:
+                pass
+        return False
+
     def receive_angle(self):
+        if self.mode == "pgn":
+            return self._receive_pgn()
+        # Первый пакет ждем с таймаутом, потом забираем очередь без ожидания:
+        # если угол приходит чаще кадров, берется самый свежий, а не самый старый
+        received = False
         try:
             data, addr = self.udp_socket.recvfrom(64)
-            message = data.decode('utf-8').strip()
+            received = self._parse(data)
+            self.udp_socket.settimeout(0.0)
+            for _ in range(self.max_drain):
+                data, addr = self.udp_socket.recvfrom(64)
+                received = self._parse(data) or received
+        except (socket.timeout, BlockingIOError):
+            pass
+        except Exception as e:
+            print(f"❌ Ошибка приема угла: {e}")
+        finally:
+            self.udp_socket.settimeout(self.timeout)
             
-            if message.startswith("ANGLE:"):
-                angle_str = message.replace("ANGLE:", "").strip()
+        return received
+
+    def _receive_pgn(self):
+        # ждем пакет на любом из портов PGN, затем забираем очереди всех готовых сокетов
+        received = False
+        try:
+            ready, _, _ = select.select(self.sockets, [], [], self.timeout)
+            for s in ready:
                 try:
-                    self.current_angle = float(angle_str)
-                    return True
-                except ValueError:
+                    for _ in range(self.max_drain):
+                        received = self._parse_pgn(s.recv_into(self._buf)) or received
+                except BlockingIOError:
                     pass
-        except socket.timeout:
+        except Exception as e:
+            print(f"❌ Ошибка приема PGN: {e}")
+        return received
+
+    def _parse_pgn(self, n):
+        buf = self._buf
+        if n < 6:
+            return False
+        h1, h2, _, pgn, length = self.PGN_HEAD.unpack_from(buf, 0)
+        if h1 != 0x80 or h2 != 0x81 or n < length + 6:
+            return False
+        # CRC AgOpenGPS: младший байт суммы от src до последнего байта данных
+        # прямой цикл по буферу: без среза/memoryview на каждый пакет, сумма не выходит за байт
+        crc = 0
+        for i in range(2, 5 + length):
+            crc = (crc + buf[i]) & 0xFF
+        if crc != buf[5 + length]:
+            self.crc_errors += 1
+            return False
+        now = time.ticks_ms()
+        if pgn == 254 and length >= 8:
+            speed, status, angle, _, _, _ = self.STEER_DATA.unpack_from(buf, 5)
+            self.speed_kmh = speed / 10.0
+            self.steer_status = status
+            self.set_angle = self.angle_sign * angle / 100.0
+            self.last_set_ms = now
+        elif pgn == 253 and length >= 8:
+            actual, _, _, _, _ = self.FROM_AUTOSTEER.unpack_from(buf, 5)
+            self.actual_angle = self.angle_sign * actual / 100.0
+            self.last_actual_ms = now
+        else:
+            return False
+        # для зоны - фактический угол, пока модуль руля его шлет, иначе заданный
+        if self.angle_source == "actual" and self.last_actual_ms and now - self.last_actual_ms < 1000:
+            self.current_angle = self.actual_angle
+        elif self.last_set_ms:
+            self.current_angle = self.set_angle
+        else:
+            return False
+        return True
+
+# Класс для пропуска инференса, когда зона статична
+class MotionGate:
+    def __init__(self, grid_w=16, grid_h=12, threshold=4.0, max_skip=5, window=100):
+        self.grid_w = grid_w          # размер уменьшенной копии зоны (блоки)
+        self.grid_h = grid_h
+        self.threshold = threshold    # разница яркости одного блока (0..255), выше - зона изменилась
+        self.max_skip = max_skip      # максимум кадров подряд без инференса
+        self.window = window          # окно для подсчета доли пропусков
+        self.ref = None               # сигнатура последнего кадра с инференсом
+        self._candidate = None        # сигнатура кадра, ожидающего инференса
+        self.skipped_in_row = 0
+        self.last_diff = 0.0
+        self.frames = 0
+        self.skipped = 0
+        self.skip_ratio = 0.0
+
+    def _signature(self, img, x, y, w, h):
+        """Уменьшенная копия зоны в оттенках серого: каждый пиксель - среднее по блоку"""
+        # зона может уйти за край кадра при большом угле: берется только видимая часть
+        W, H = img.width(), img.height()
+        x2 = min(x + w, W)
+        y2 = min(y + h, H)
+        if x >= W or y >= H or x2 <= 0 or y2 <= 0:
+            return None  # зона целиком за кадром - сравнивать нечего
+        x = max(0, x)
+        y = max(0, y)
+        # FIT_FILL: вся зона растягивается на сетку, без черных полей по краям
+        small = img.crop(x, y, x2 - x, y2 - y).resize(self.grid_w, self.grid_h, object_fit=image.Fit.FIT_FILL,
+                                            method=image.ResizeMethod.AREA)
+        return small.to_format(image.Format.FMT_GRAYSCALE).to_bytes()
+
+    def should_skip(self, img, x, y, w, h):
+        """True - зона не изменилась, можно использовать прошлые детекции"""
+        sig = self._signature(img, x, y, w, h)
+        skip = False
+        if sig is not None and self.ref is not None and len(sig) == len(self.ref) and self.skipped_in_row < self.max_skip:
+            # максимум по блокам, а не среднее: человек в одном блоке из 192 не должен растворяться
+            worst = 0
+            for a, b in zip(sig, self.ref):
+                d = a - b if a > b else b - a
+                if d > worst:
+                    worst = d
+            self.last_diff = worst
+            skip = worst < self.threshold
+
+        if skip:
+            self.skipped_in_row += 1
+            self.skipped += 1
+        else:
+            self._candidate = sig
+
+        self.frames += 1
+        if self.frames >= self.window:
+            self.skip_ratio = self.skipped / self.frames
+            self.frames = 0
+            self.skipped = 0
+        return skip
+
+    def mark_inferred(self):
+        """Опорный кадр обновляется только после инференса"""
+        if self._candidate is not None:
+            self.ref = self._candidate
+            self._candidate = None
+        self.skipped_in_row = 0
+
+# Результат кадра без аллокаций в цикле
+class FrameResult:
+    """Детекции кадра в заранее выделенных массивах: один объект на весь цикл, без новых списков"""
+    __slots__ = ("capacity", "count", "zone_count", "dropped", "x", "y", "w", "h",
+                 "class_id", "score", "in_zone", "class_counts")
+
+    def __init__(self, capacity=64, num_classes=80):
+        self.capacity = capacity
+        self.count = 0
+        self.zone_count = 0
+        self.dropped = 0  # объекты сверх capacity: не сохранены, но посчитаны в zone_count / class_counts
+        self.x = array("i", [0]) * capacity
+        self.y = array("i", [0]) * capacity
+        self.w = array("i", [0]) * capacity
+        self.h = array("i", [0]) * capacity
+        self.class_id = array("H", [0]) * capacity
+        self.score = array("f", [0.0]) * capacity
+        self.in_zone = bytearray(capacity)
+        self.class_counts = array("H", [0]) * num_classes  # объектов каждого класса в зоне
+
+    def reset(self):
+        # обнуляем только то, что было занято в прошлом кадре
+        for i in range(self.count):
+            if self.in_zone[i]:
+                self.class_counts[self.class_id[i]] = 0
+                self.in_zone[i] = 0
+        if self.dropped:
+            # классы объектов сверх capacity не сохранены - обнуляем все
+            for c in range(len(self.class_counts)):
+                self.class_counts[c] = 0
+            self.dropped = 0
+        self.count = 0
+        self.zone_count = 0
+
+    def add(self, o, in_zone):
+        i = self.count
+        cid = o.class_id
+        if i >= self.capacity:
+            # массивы заполнены: объект не сохраняется, но попадание в зону не теряется
+            self.dropped += 1
+            if in_zone:
+                self.zone_count += 1
+                self.class_counts[cid] += 1
+            return -1
+        self.x[i] = o.x
+        self.y[i] = o.y
+        self.w[i] = o.w
+        self.h[i] = o.h
+        self.class_id[i] = cid
+        self.score[i] = o.score
+        if in_zone:
+            self.in_zone[i] = 1
+            self.zone_count += 1
+            self.class_counts[cid] += 1
+        self.count = i + 1
+        return i
+
+# Проверка аллокаций основного цикла
+class AllocProbe:
+    """Проверка через tracemalloc: сколько Python-памяти основной цикл выделяет на кадр"""
+    def __init__(self, warmup=100, frames=300, limit_bytes=64, peak_limit_bytes=2048):
+        self.warmup = warmup            # кадров до начала измерения (кэши, буферы)
+        self.frames = frames            # длина измерения
+        self.limit_bytes = limit_bytes  # допустимый прирост памяти на кадр
+        self.peak_limit_bytes = peak_limit_bytes  # допустимый пик временных объектов за кадр (вместе с результатами детектора)
+        self.n = 0
+        self.base = 0
+        self.prev = 0
+        self.peak_max = 0
+        self.snapshot = None
+
+    def on_frame(self):
+        self.n += 1
+        if self.n == self.warmup:
+            tracemalloc.start()
+            self.snapshot = tracemalloc.take_snapshot()
+            self.base = self.prev = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        elif self.warmup < self.n <= self.warmup + self.frames:
+            cur, peak = tracemalloc.get_traced_memory()
+            self.peak_max = max(self.peak_max, peak - self.prev)  # временные объекты за кадр
+            self.prev = cur
+            tracemalloc.reset_peak()
+            if self.n == self.warmup + self.frames:
+                self._report(cur)
+
+    def _report(self, cur):
+        per_frame = (cur - self.base) / self.frames
+        own = (tracemalloc.Filter(False, tracemalloc.__file__),)
+        top = tracemalloc.take_snapshot().filter_traces(own).compare_to(self.snapshot.filter_traces(own), "lineno")[:3]
+        tracemalloc.stop()
+        if per_frame > self.limit_bytes:
+            verdict = "❌ РОСТ ПАМЯТИ"
+        elif self.peak_max > self.peak_limit_bytes:
+            verdict = "❌ ВРЕМЕННЫЕ ОБЪЕКТЫ"
+        else:
+            verdict = "✅ OK"
+        print(f"🧪 Аллокации: {per_frame:.1f} Б/кадр прирост, пик временных {self.peak_max} Б/кадр "
+              f"за {self.frames} кадров | {verdict}")
+        for stat in top:
+            print(f"   {stat}")
+
+# Экспорт детекций в общую память для других процессов на камере
+class DetectionExport:
+    """
+    Кольцо кадров в общей памяти (mmap файла в /dev/shm) для других процессов на камере.
+    Раскладка фиксированная, читатель без блокировок - AOG_ShmReader.py:
+      заголовок 64 Б: magic, версия, слотов, размер слота, макс. детекций, макс. зон, последний seq,
+                      поколение (новое при каждом запуске писателя: seq снова с 1)
+      слот: seq_begin, время, угол, канал, решение, зоны (4 точки), детекции, seq_end
+    Слот валиден, если seq_end == seq_begin == ожидаемому seq (писатель пишет begin -> данные -> end).
+    """
+    MAGIC = b"AOGS"
+    VERSION = 2
+    HEADER = struct.Struct("<4sHHIHHQ")         # magic, version, slots, slot_size, max_dets, max_zones, write_seq
+    HEADER_SIZE = 64
+    WRITE_SEQ_OFFSET = 16
+    GENERATION_OFFSET = 24
+    SEQ = struct.Struct("<Q")
+    SLOT_HEAD = struct.Struct("<QdfBBBBHH")     # seq_begin, t (monotonic), angle, channel, obstacle, level, zones, count, dets
+    ZONE = struct.Struct("<BxH8h")              # level, count, A..D (x,y)
+    DET = struct.Struct("<hhhhHBxf")            # x, y, w, h, class_id, zone (level; 1 in AOG_MaixCam), score
+
+    def __init__(self, path, slots=16, max_dets=64, max_zones=4):
+        self.path = path
+        self.slots = slots
+        self.max_dets = max_dets
+        self.max_zones = max_zones
+        self.slot_size = (self.SLOT_HEAD.size + max_zones * self.ZONE.size +
+                          max_dets * self.DET.size + self.SEQ.size)
+        self.zones_offset = self.SLOT_HEAD.size
+        self.dets_offset = self.zones_offset + max_zones * self.ZONE.size
+        self.end_offset = self.dets_offset + max_dets * self.DET.size
+        self.seq = 0
+        self.base = 0
+        self.zone_n = 0
+        self.mm = None
+
+    def open(self):
+        size = self.HEADER_SIZE + self.slots * self.slot_size
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                # файл только растет: читатель может еще держать отображение прошлого запуска
+                # (кольцо было больше), а обращение за концом укороченного файла - это SIGBUS
+                if os.fstat(fd).st_size < size:
+                    os.ftruncate(fd, size)
+                self.mm = mmap.mmap(fd, size)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            print(f"❌ Общая память {self.path}: {e}")
+            return False
+        # magic пишется последним: читатель не увидит наполовину записанный заголовок
+        self.mm[:self.HEADER_SIZE] = bytes(self.HEADER_SIZE)
+        self.HEADER.pack_into(self.mm, 0, b"\0\0\0\0", self.VERSION, self.slots, self.slot_size,
+                              self.max_dets, self.max_zones, 0)
+        self.SEQ.pack_into(self.mm, self.GENERATION_OFFSET, pytime.time_ns())
+        self.mm[0:4] = self.MAGIC
+        print(f"🧠 Экспорт детекций: {self.path} ({self.slots} x {self.slot_size} Б)")
+        return True
+
+    def begin(self):
+        self.seq += 1
+        self.base = self.HEADER_SIZE + (self.seq % self.slots) * self.slot_size
+        self.SEQ.pack_into(self.mm, self.base, self.seq)
+        self.zone_n = 0
+
+    def zone(self, level, count, quad):
+        if self.zone_n >= self.max_zones:
+            return
+        (ax, ay), (bx, by), (cx, cy), (dx, dy) = quad
+        self.ZONE.pack_into(self.mm, self.base + self.zones_offset + self.zone_n * self.ZONE.size,
+                            level, count, ax, ay, bx, by, cx, cy, dx, dy)
+        self.zone_n += 1
+
+    def end(self, result, steering_angle, has_obstacle, count, level=0, channel=0):
+        mm = self.mm
+        base = self.base
+        n = min(result.count, self.max_dets)
+        off = base + self.dets_offset
+        pack = self.DET.pack_into
+        size = self.DET.size
+        for i in range(n):
+            pack(mm, off, result.x[i], result.y[i], result.w[i], result.h[i],
+                 result.class_id[i], result.in_zone[i], result.score[i])
+            off += size
+        self.SLOT_HEAD.pack_into(mm, base, self.seq, pytime.monotonic(), steering_angle, channel,
+                                 1 if has_obstacle else 0, level, self.zone_n, count, n)
+        self.SEQ.pack_into(mm, base + self.end_offset, self.seq)
+        self.SEQ.pack_into(mm, self.WRITE_SEQ_OFFSET, self.seq)
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+
+# Класс для трансляции видео на планшет в кабине
+class PreviewStreamer:
+    """MJPEG-поток аннотированных кадров по HTTP: http://<IP камеры>:<port>/"""
+    BOUNDARY = "aogframe"
+
+    def __init__(self, port=8080, fps=5, quality=60, max_clients=3):
+        self.port = port
+        self.fps = fps
+        self.quality = quality
+        self.max_clients = max_clients
+        self.clients = 0
+        self.sent_frames = 0
+        self._slot = None        # последний аннотированный кадр (один слот)
+        self._jpeg = None        # последний закодированный JPEG
+        self._jpeg_seq = 0
+        self._last_offer = 0
+        self._cond = threading.Condition()
+        self._server = None
+        self._running = False
+
+    def start(self):
+        try:
+            self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._server.bind(("0.0.0.0", self.port))
+            self._server.listen(self.max_clients)
+        except Exception as e:
+            print(f"❌ Ошибка запуска видеопотока: {e}")
+            return False
+        self._running = True
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        threading.Thread(target=self._encode_loop, daemon=True).start()
+        print(f"🎥 Видеопоток: порт {self.port}, {self.fps} к/с, качество {self.quality}")
+        return True
+
+    def offer(self, img):
+        """Из основного цикла: кладет копию кадра в слот (не чаще fps), кодирование в потоке"""
+        if not self._running or self.clients == 0:
+            return False
+        now = time.ticks_ms()
+        if now - self._last_offer < 1000 // self.fps:
+            return False
+        self._last_offer = now
+        # копия: буфер кадра может переиспользоваться камерой / дорисовываться, пока поток кодирует
+        frame = img.copy()
+        with self._cond:
+            self._slot = frame  # неотправленный старый кадр просто вытесняется
+            self._cond.notify_all()
+        return True
+
+    def _encode_loop(self):
+        while self._running:
+            with self._cond:
+                while self._slot is None and self._running:
+                    self._cond.wait(1.0)
+                img = self._slot
+                self._slot = None
+            if img is None:
+                continue
+            try:
+                data = img.to_jpeg(quality=self.quality).to_bytes()
+            except Exception as e:
+                print(f"❌ Ошибка кодирования JPEG: {e}")
+                continue
+            with self._cond:
+                self._jpeg = data
+                self._jpeg_seq += 1
+                self._cond.notify_all()
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                conn, addr = self._server.accept()
+            except OSError as e:
+                if not self._running or self._server.fileno() < 0:
+                    break  # сокет закрыт - поток приема завершается, а не крутится впустую
+                print(f"❌ Ошибка приема клиента видеопотока: {e}")
+                pytime.sleep(1.0)  # пауза, чтобы повторяющаяся ошибка не отнимала CPU у детекции
+                continue
+            with self._cond:
+                if self.clients >= self.max_clients:
+                    conn.close()
+                    continue
+                self.clients += 1
+            print(f"🎥 Клиент видеопотока подключен: {addr[0]}")
+            threading.Thread(target=self._client_loop, args=(conn, addr), daemon=True).start()
+
+    def _client_loop(self, conn, addr):
+        try:
+            conn.settimeout(2.0)  # клиент, который не успевает забирать кадры, отключается
+            conn.recv(1024)       # HTTP-запрос не разбираем: отдаем поток на любой путь
+            conn.sendall(("HTTP/1.0 200 OK\r\n"
+                          "Cache-Control: no-cache\r\n"
+                          f"Content-Type: multipart/x-mixed-replace; boundary={self.BOUNDARY}\r\n\r\n").encode("ascii"))
+            last_seq = self._jpeg_seq
+            while self._running:
+                with self._cond:
+                    while self._jpeg_seq == last_seq and self._running:
+                        self._cond.wait(1.0)
+                    # медленный клиент получает только самый свежий кадр, промежуточные пропускаются
+                    data = self._jpeg
+                    last_seq = self._jpeg_seq
+                if data is None:
+                    continue
+                head = f"--{self.BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(data)}\r\n\r\n"
+                conn.sendall(head.encode("ascii"))
+                conn.sendall(data)
+                conn.sendall(b"\r\n")
+                self.sent_frames += 1
+        except Exception:
             pass
+        finally:
+            conn.close()
+            with self._cond:
+                self.clients -= 1
+            print(f"🎥 Клиент видеопотока отключен: {addr[0]}")
+
+# Снимки препятствий на диск для последующего разбора
+class SnapshotRecorder:
+    """
+    Снимки препятствий для разбора: JPEG аннотированного кадра + JSON рядом (детекции, угол, зона).
+    Снимок при появлении препятствия и не чаще interval_ms, пока оно держится.
+    Основной цикл только кладет кадр в ограниченную очередь (полная - кадр пропускается),
+    кодирование, запись и квота диска - в фоновом потоке.
+    """
+    def __init__(self, directory, interval_ms=2000, quality=85, queue_size=4, quota_mb=200):
+        self.directory = directory
+        self.interval_ms = interval_ms
+        self.quality = quality
+        self.quota_bytes = quota_mb * 1024 * 1024
+        self.saved = 0
+        self.dropped = 0     # очередь была полна
+        self.deleted = 0     # удалено по квоте
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._active = {}    # канал -> препятствие было на прошлом кадре
+        self._last = {}      # канал -> время последнего снимка
+        self._seq = 0
+        self._files = deque()  # (имя без расширения, байт) от старых к новым
+        self._total = 0
+        self._running = False
+
+    def start(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            self._scan()
+        except OSError as e:
+            print(f"❌ Папка снимков {self.directory}: {e}")
+            return False
+        self._running = True
+        threading.Thread(target=self._worker, daemon=True).start()
+        print(f"📸 Снимки препятствий: {self.directory}, квота {self.quota_bytes // (1024 * 1024)} МБ, "
+              f"занято {self._total // 1024} КБ")
+        return True
+
+    def _scan(self):
+        # имена начинаются с даты и времени - сортировка по имени = от старых к новым
+        sizes = {}
+        for name in os.listdir(self.directory):
+            base, ext = os.path.splitext(name)
+            if ext in (".jpg", ".json"):
+                sizes[base] = sizes.get(base, 0) + os.path.getsize(os.path.join(self.directory, name))
+        for base in sorted(sizes):
+            self._files.append((base, sizes[base]))
+            self._total += sizes[base]
+
+    def due(self, has_obstacle, channel=0):
+        """Из основного цикла: нужен ли снимок этого кадра (начало препятствия или прошел interval_ms)"""
+        if not self._running:
+            return False
+        if not has_obstacle:
+            self._active[channel] = False
+            return False
+        now = time.ticks_ms()
+        if self._active.get(channel) and now - self._last.get(channel, 0) < self.interval_ms:
+            return False
+        self._last[channel] = now
+        return True
+
+    def submit(self, img, meta, channel=0):
+        """Кладет кадр и метаданные в очередь без ожидания; onset = первый снимок этого препятствия"""
+        meta["onset"] = not self._active.get(channel)
+        self._active[channel] = True
+        self._seq += 1
+        if self._queue.full():
+            self.dropped += 1  # очередь полна - не тратим время на копию
+            return False
+        try:
+            # копия: камера переиспользует буфер кадра, а поток пишет JPEG позже
+            self._queue.put_nowait((pytime.time(), self._seq, img.copy(), meta))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    @staticmethod
+    def detections(result, class_names):
+        """Копия детекций из FrameResult (он переиспользуется на следующем кадре)"""
+        return [{"class": class_names.get(result.class_id[i], str(result.class_id[i])),
+                 "score": round(result.score[i], 3),
+                 "box": [result.x[i], result.y[i], result.w[i], result.h[i]],
+                 "zone": result.in_zone[i]} for i in range(result.count)]
+
+    def _worker(self):
+        while self._running:
+            try:
+                t, seq, img, meta = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            stamp = datetime.datetime.fromtimestamp(t)
+            base = f"{stamp.strftime('%Y%m%d_%H%M%S')}_{stamp.microsecond // 1000:03d}_{seq:05d}"
+            meta["time"] = stamp.isoformat(timespec="milliseconds")
+            meta["dropped"] = self.dropped
+            try:
+                data = img.to_jpeg(quality=self.quality).to_bytes()
+                size = 0
+                for ext, payload in ((".jpg", data), (".json", json.dumps(meta, ensure_ascii=False).encode("utf-8"))):
+                    with open(os.path.join(self.directory, base + ext), "wb") as f:
+                        f.write(payload)
+                    size += len(payload)
+            except Exception as e:
+                print(f"❌ Ошибка записи снимка: {e}")
+                continue
+            self._files.append((base, size))
+            self._total += size
+            self.saved += 1
+            self._enforce_quota()
+            print(f"📸 Снимок {base}.jpg ({size // 1024} КБ, пропущено {self.dropped})")
+
+    def _enforce_quota(self):
+        # самые старые снимки удаляются первыми, последний записанный остается всегда
+        while self._total > self.quota_bytes and len(self._files) > 1:
+            base, size = self._files.popleft()
+            for ext in (".jpg", ".json"):
+                try:
+                    os.remove(os.path.join(self.directory, base + ext))
+                except OSError:
+                    pass
+            self._total -= size
+            self.deleted += 1
+
+# Класс для профилирования основного цикла по запросу
+class LoopProfiler:
+    """
+    Профилирование основного цикла на PROFILE_FRAMES кадров, потом выключается само.
+    "sample":   фоновый поток снимает стек основного потока каждые interval_ms,
+                результат - collapsed stacks (.folded) для flamegraph.pl / speedscope
+    "cprofile": cProfile на время N кадров, .pstats записывается в фоновом потоке
+    """
+    def __init__(self, out_dir="/root/profiles", frames=300, interval_ms=5, mode="sample"):
+        self.out_dir = out_dir
+        self.frames = frames
+        self.interval_ms = interval_ms
+        self.mode = mode
+        self.active = False
+        self.frames_left = 0
+        self._prof = None
+        self._stop = None  # Event своего запуска: поток прошлого запуска не подхватит новый
+        self.path = None
+        self.error = None  # причина последнего отказа start()
+        self._thread_id = threading.main_thread().ident
+
+    def start(self, mode=None):
+        if self.active:
+            return False
+        mode = mode or self.mode
+        if mode not in ("sample", "cprofile"):
+            self.error = "mode"
+            return False
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        try:
+            os.makedirs(self.out_dir, exist_ok=True)
+            if mode == "sample":
+                path = os.path.join(self.out_dir, f"loop-{stamp}.folded")
+                stop = threading.Event()
+                threading.Thread(target=self._sample_loop, args=(path, stop), daemon=True).start()
+                self._stop = stop
+            else:
+                path = os.path.join(self.out_dir, f"loop-{stamp}.pstats")
+                prof = cProfile.Profile()
+                prof.enable()  # ValueError, если уже работает другой профилировщик
+                self._prof = prof
+        except (OSError, RuntimeError, ValueError) as e:
+            print(f"❌ Профилирование не запущено: {e}")
+            self.error = type(e).__name__
+            return False
+        self.frames_left = self.frames
+        self.active = True
+        self.error = None
+        self.path = path
+        print(f"🔬 Профилирование ({mode}) на {self.frames} кадров -> {path}")
+        return True
+
+    def on_frame(self):
+        if not self.active:
+            return
+        self.frames_left -= 1
+        if self.frames_left > 0:
+            return
+        self.active = False
+        if self._stop is not None:
+            self._stop.set()  # поток сэмплирования сам запишет файл своего запуска
+            self._stop = None
+        if self._prof is not None:
+            prof, self._prof = self._prof, None
+            prof.disable()
+            threading.Thread(target=self._dump_pstats, args=(prof, self.path), daemon=True).start()
+
+    def _sample_loop(self, path, stop):
+        stacks = {}
+        samples = 0
+        interval = self.interval_ms / 1000.0
+        while not stop.is_set():
+            frame = pysys._current_frames().get(self._thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            if names:
+                key = ";".join(reversed(names))
+                stacks[key] = stacks.get(key, 0) + 1
+                samples += 1
+            stop.wait(interval)
+        try:
+            with open(path, "w") as f:
+                for key, count in stacks.items():
+                    f.write(f"{key} {count}\n")
+            print(f"🔬 Профиль записан: {path} ({samples} сэмплов)")
         except Exception as e:
-            print(f"❌ Ошибка приема угла: {e}")
-            
-        return False
+            print(f"❌ Ошибка записи профиля: {e}")
+
+    def _dump_pstats(self, prof, path):
+        try:
+            prof.dump_stats(path)
+            print(f"🔬 Профиль записан: {path}")
+        except Exception as e:
+            print(f"❌ Ошибка записи профиля: {e}")
+
+# Класс для изменения параметров по UDP без перезапуска
+class TuningControl:
+    """
+    Настройка параметров на ходу по UDP. Пакет: "<nonce>:<команда>:<подпись>", подпись -
+    первые 16 hex-символов HMAC-SHA256(ключ, "<nonce>:<команда>"), nonce - растущее число
+    (например, время клиента в мс): повтор или старый пакет отклоняется. Последний принятый
+    nonce хранится в nonce_path: пакеты, записанные до перезагрузки, тоже остаются старыми.
+    Команды: "GET" | "GET имя" | "SET имя=значение[,имя=значение...]" и зарегистрированные
+    через register_command (например, "PROFILE [sample|cprofile]").
+    Ответ отправителю: "OK имя=значение ..." с действующими значениями или "ERR причина".
+    """
+    def __init__(self, secret, port=8890, nonce_path="/root/tuning_nonce"):
+        self.secret = secret.encode("utf-8")
+        self.port = port
+        self.nonce_path = nonce_path
+        self.tunables = {}  # имя -> ([(объект, атрибут), ...], тип, мин, макс)
+        self.commands = {}  # COMMAND -> callback(arg) -> reply
+        self.last_nonce = self._load_nonce()
+        self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp_socket.setblocking(False)
+        self.udp_socket.bind(("0.0.0.0", port))
+
+    def register(self, name, targets, kind, lo, hi):
+        self.tunables[name] = (targets, kind, lo, hi)
+
+    def register_command(self, name, callback):
+        self.commands[name.upper()] = callback
+
+    def poll(self, max_packets=4):
+        # вызывается между кадрами: изменения действуют со следующего кадра
+        for _ in range(max_packets):
+            try:
+                data, addr = self.udp_socket.recvfrom(512)
+            except (BlockingIOError, socket.timeout):
+                return
+            except Exception as e:
+                print(f"❌ Ошибка приема команды: {e}")
+                return
+            reply = self._handle(data)
+            try:
+                self.udp_socket.sendto(reply.encode("utf-8"), addr)
+            except Exception as e:
+                print(f"❌ Ошибка ответа на команду: {e}")
+
+    def _handle(self, data):
+        try:
+            nonce_s, cmd, sig = data.decode("utf-8").strip().split(":", 2)
+            nonce = int(nonce_s)
+        except ValueError:
+            return "ERR format"
+        # подпись - hex нужной длины, сравнивается как байты
+        if len(sig) != 16 or any(ch not in "0123456789abcdef" for ch in sig):
+            return "ERR auth"
+        expected = hmac.new(self.secret, f"{nonce_s}:{cmd}".encode("utf-8"), hashlib.sha256).hexdigest()[:16]
+        if not hmac.compare_digest(sig.encode("ascii"), expected.encode("ascii")):
+            return "ERR auth"
+        if nonce <= self.last_nonce:
+            return "ERR nonce"
+        self.last_nonce = nonce
+        self._save_nonce()
+
+        # ошибка команды (например, OSError у PROFILE) не должна дойти до основного цикла
+        try:
+            return self._dispatch(cmd)
+        except Exception as e:
+            print(f"❌ Ошибка команды {cmd!r}: {e}")
+            return f"ERR failed {type(e).__name__}"
+
+    def _dispatch(self, cmd):
+        parts = cmd.strip().split(None, 1)
+        op = parts[0].upper() if parts else ""
+        if op in self.commands:
+            return self.commands[op](parts[1] if len(parts) > 1 else "")
+        if op == "GET":
+            if len(parts) == 1:
+                return "OK " + " ".join(self._format(n) for n in self.tunables)
+            if parts[1] not in self.tunables:
+                return f"ERR unknown {parts[1]}"
+            return "OK " + self._format(parts[1])
+        if op == "SET" and len(parts) == 2:
+            changes = []
+            for item in parts[1].split(","):
+                name, _, value = item.partition("=")
+                name = name.strip()
+                if name not in self.tunables:
+                    return f"ERR unknown {name}"
+                targets, kind, lo, hi = self.tunables[name]
+                try:
+                    v = kind(value)
+                except ValueError:
+                    return f"ERR value {name}"
+                if not (lo <= v <= hi):
+                    return f"ERR range {name} [{lo}..{hi}]"
+                changes.append((name, targets, v))
+            # все или ничего: при ошибке в любом параметре ничего не применяется
+            for name, targets, v in changes:
+                for obj, attr in targets:
+                    setattr(obj, attr, v)
+            applied = " ".join(self._format(name) for name, _, _ in changes)
+            print(f"🔧 Параметры изменены: {applied}")
+            return "OK " + applied
+        return "ERR command"
+
+    def _load_nonce(self):
+        try:
+            with open(self.nonce_path) as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _save_nonce(self):
+        # временный файл + fsync файла и каталога: после отключения питания останется
+        # старое или новое значение, и принятый nonce не откатится назад
+        tmp = self.nonce_path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                f.write(str(self.last_nonce))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.nonce_path)
+            dir_fd = os.open(os.path.dirname(os.path.abspath(self.nonce_path)), os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)  # сама запись о переименовании
+            finally:
+                os.close(dir_fd)
+        except OSError as e:
+            print(f"⚠ nonce не сохранен ({self.nonce_path}): {e}")
+
+    def _format(self, name):
+        obj, attr = self.tunables[name][0][0]
+        return f"{name}={getattr(obj, attr)}"
+
+# Параметры детекции, которые можно менять на ходу
+class RuntimeParams:
+    def __init__(self, conf_th=0.5, iou_th=0.45):
+        self.conf_th = conf_th
+        self.iou_th = iou_th
 
 # Класс для калибровки TouchScreen
 class TouchCalibrator:
@@ -111,21 +1014,40 @@ class ZoneConfig:
         self.y1_ratio = 0.2
         self.y2_ratio = 0.9
         self.max_shift_ratio = 0.3
+        self.max_steer_for_max = 45.0  # угол, при котором сдвиг зоны максимальный
         self.edit_mode = False
         self.selected_corner = None
         self.touch_threshold = 50
         self.last_touch_time = 0
         self.touch_cooldown = 100
         self.obstacle_detection_enabled = True  # Флаг включения обнаружения препятствий
+        # зона пересчитывается только при изменении угла или параметров
+        self._zone_angle = None
+        self._zone_version = -1
+        self._zone = None
+
+    _params_version = 0  # растет при любом изменении публичного атрибута (настройка, касание)
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name[0] != "_":
+            object.__setattr__(self, "_params_version", self._params_version + 1)
         
     def get_zone(self, steering_angle=0):
+        if steering_angle != self._zone_angle or self._params_version != self._zone_version:
+            self._zone = self._compute_zone(steering_angle)
+            self._zone_angle = steering_angle
+            self._zone_version = self._params_version
+        return self._zone
+
+    def _compute_zone(self, steering_angle):
         base_x1 = int(self.width * self.x1_ratio)
         base_x2 = int(self.width * self.x2_ratio)
         base_y1 = int(self.height * self.y1_ratio)
         base_y2 = int(self.height * self.y2_ratio)
         
         max_shift = int(self.width * self.max_shift_ratio)
-        max_angle = 45.0
+        max_angle = self.max_steer_for_max
         clamped_angle = max(-max_angle, min(steering_angle, max_angle))
         shift = int((clamped_angle / max_angle) * max_shift)  # ДИНАМИЧЕСКИЙ СДВИГ
         
@@ -263,23 +1185,108 @@ class_names = {
     7: "Truck", 17: "Horse", 18: "Sheep", 19: "Cow"
 }
 
+# Цвета и подписи готовятся заранее, чтобы не собирать строки в каждом кадре
+class_colors = {cid: image.COLOR_GREEN if cid == 0 else
+                     image.COLOR_BLUE if cid in [1, 2, 3, 7] else
+                     image.COLOR_YELLOW for cid in class_names}
+score_labels = {cid: tuple(f"{name}: {p / 100:.2f}" for p in range(101)) for cid, name in class_names.items()}
+frame = FrameResult()
+
 # Инициализация Wi-Fi
 wifi_manager = WiFiManager()
 
 # Настройки Wi-Fi
 SSID = "AOG4"
 PASSWORD = "12345678"
+UDP_SEND_SEQ = False  # True - ":SEQ:n" в каждом сообщении, для AOG_Simulator.py с реальной камерой
+wifi_manager.send_seq = UDP_SEND_SEQ
 
 # Подключаемся к Wi-Fi
 wifi_connected = wifi_manager.connect(SSID, PASSWORD)
 
+# Пропуск инференса при неподвижной картинке в зоне
+MOTION_GATE_ENABLED = True
+MOTION_THRESHOLD = 12.0  # разница яркости самого изменившегося блока, ниже - кадр считается тем же
+MOTION_MAX_SKIP = 5     # не реже чем раз в 6 кадров - свежий инференс
+motion_gate = MotionGate(threshold=MOTION_THRESHOLD, max_skip=MOTION_MAX_SKIP)
+
+# Видеопоток для планшета (MJPEG по HTTP), кодирование в отдельном потоке
+STREAM_ENABLED = False
+STREAM_PORT = 8080
+STREAM_FPS = 5
+STREAM_QUALITY = 60
+preview_streamer = PreviewStreamer(STREAM_PORT, STREAM_FPS, STREAM_QUALITY)
+if STREAM_ENABLED:
+    preview_streamer.start()
+
+# Экспорт каждого кадра в общую память для логгера / моста / диагностики (AOG_ShmReader.py)
+SHM_EXPORT_ENABLED = False
+SHM_PATH = "/dev/shm/aog_detections"
+SHM_SLOTS = 16
+shm_export = None
+if SHM_EXPORT_ENABLED:
+    shm_export = DetectionExport(SHM_PATH, SHM_SLOTS, max_dets=frame.capacity, max_zones=1)
+    if not shm_export.open():
+        shm_export = None
+
+# Снимки препятствий (JPEG + JSON) для проверки ложных срабатываний, запись в фоне
+SNAPSHOT_ENABLED = False
+SNAPSHOT_DIR = "/root/snapshots"
+SNAPSHOT_INTERVAL_MS = 2000  # пока препятствие держится - не чаще
+SNAPSHOT_QUOTA_MB = 200      # старые снимки удаляются первыми
+snapshot_recorder = None
+if SNAPSHOT_ENABLED:
+    snapshot_recorder = SnapshotRecorder(SNAPSHOT_DIR, SNAPSHOT_INTERVAL_MS, quota_mb=SNAPSHOT_QUOTA_MB)
+    if not snapshot_recorder.start():
+        snapshot_recorder = None
+
+# Проверка аллокаций основного цикла (tracemalloc), результат в консоль
+ALLOC_CHECK = False
+alloc_probe = AllocProbe() if ALLOC_CHECK else None
+
 # Инициализация приемника угла
-angle_receiver = AngleReceiver()
+# "text": ANGLE:x от ESP32 на порт 8889
+# "pgn":  рассылка AgIO напрямую - PGN 254 (данные руля) на 8888, PGN 253 (статус модуля руля) на 9999
+ANGLE_INPUT = "text"
+ANGLE_PGN_SOURCE = "actual"  # "actual" (PGN 253, без него - заданный) или "set" (PGN 254)
+ANGLE_PGN_SIGN = 1           # -1, если зона уходит не в ту сторону по сравнению с режимом text
+angle_receiver = AngleReceiver(mode=ANGLE_INPUT, angle_source=ANGLE_PGN_SOURCE, angle_sign=ANGLE_PGN_SIGN)
 
 # Инициализация конфигуратора зоны и калибратора
 zone_config = ZoneConfig(cam.width(), cam.height())
 touch_calibrator = TouchCalibrator(cam.width(), cam.height())
 
+# Профилирование цикла: кнопка PROF на экране или команда PROFILE на порт управления
+PROFILE_MODE = "sample"        # "sample" (стеки, .folded) или "cprofile" (.pstats)
+PROFILE_FRAMES = 300
+PROFILE_DIR = "/root/profiles"
+profiler = LoopProfiler(PROFILE_DIR, PROFILE_FRAMES, mode=PROFILE_MODE)
+prof_button = (0, 45, 48, 26)  # x, y, w, h - слева под кнопкой зоны
+
+def profile_command(arg):
+    if not profiler.start(arg.strip().lower() or None):
+        return "ERR busy" if profiler.active else f"ERR {profiler.error}"
+    return f"OK profile frames={profiler.frames} file={profiler.path}"
+
+# Параметры, меняемые на ходу, и порт управления (рядом с портом угла 8889)
+runtime_params = RuntimeParams(conf_th=0.5, iou_th=0.45)
+CONTROL_ENABLED = False
+CONTROL_PORT = 8890
+CONTROL_SECRET = "change-me"  # общий ключ с AOG_Tune.py
+tuning = None
+if CONTROL_ENABLED:
+    tuning = TuningControl(CONTROL_SECRET, CONTROL_PORT)
+    tuning.register("conf_th", [(runtime_params, "conf_th")], float, 0.05, 0.95)
+    tuning.register("iou_th", [(runtime_params, "iou_th")], float, 0.05, 0.95)
+    tuning.register("max_shift_ratio", [(zone_config, "max_shift_ratio")], float, 0.0, 0.5)
+    tuning.register("max_steer_for_max", [(zone_config, "max_steer_for_max")], float, 5.0, 90.0)
+    tuning.register("touch_threshold", [(zone_config, "touch_threshold")], int, 10, 200)
+    tuning.register("touch_cooldown", [(zone_config, "touch_cooldown")], int, 0, 1000)
+    tuning.register("motion_threshold", [(motion_gate, "threshold")], float, 0.0, 255.0)
+    tuning.register("motion_max_skip", [(motion_gate, "max_skip")], int, 0, 100)
+    tuning.register_command("PROFILE", profile_command)
+    print(f"🔧 Порт управления параметрами: {CONTROL_PORT}")
+
 print(f"📱 Разрешение дисплея: {cam.width()}x{cam.height()}")
 print("✅ Система запущена! Детекция объектов и передача по Wi-Fi...")
 
@@ -288,20 +1295,34 @@ touch_count = 0
 last_obstacle_print = 0
 last_angle_print = 0
 steering_angle = 0.0  # Угол по умолчанию
+objs = []
+stats_time = -1000
+stats_text = ""
+
+# Все объекты инициализации - в постоянное поколение, сборщик мусора их больше не обходит
+gc.collect()
+gc.freeze()
 
 while not app.need_exit():
     img = cam.read()
-    objs = detector.detect(img, conf_th=0.5, iou_th=0.45)
-    
-    target_objects = [obj for obj in objs if obj.class_id in class_names]
+
+    # --- Инференс только если зона изменилась (или давно не обновляли) ---
+    gx1, gy1, gx2, gy2 = zone_config.get_zone(steering_angle)
+    if not (MOTION_GATE_ENABLED and motion_gate.should_skip(img, gx1, gy1, gx2 - gx1, gy2 - gy1)):
+        objs = detector.detect(img, conf_th=runtime_params.conf_th, iou_th=runtime_params.iou_th)
+        motion_gate.mark_inferred()
     
-    # --- ПРИЕМ УГЛА ОТ ESP32 ---
+    # --- ПРИЕМ УГЛА ОТ ESP32 (или PGN от AgIO) ---
     if angle_receiver.receive_angle():
         steering_angle = angle_receiver.current_angle
         # Для отладки - выводим угол раз в секунду
         current_time = time.ticks_ms()
         if current_time - last_angle_print > 1000:
-            print(f"📥 Получен угол от ESP32: {steering_angle}°")
+            if angle_receiver.mode == "pgn":
+                print(f"📥 PGN: угол {steering_angle}° (задан {angle_receiver.set_angle}°, "
+                      f"факт {angle_receiver.actual_angle}°), скорость {angle_receiver.speed_kmh} км/ч")
+            else:
+                print(f"📥 Получен угол от ESP32: {steering_angle}°")
             last_angle_print = current_time
     
     # --- Обработка касаний TouchScreen ---
@@ -318,7 +1339,11 @@ while not app.need_exit():
                     print(f"👆 Касание #{touch_count}: raw({raw_x}, {raw_y}) -> display({display_x}, {display_y})")
                 
                 if pressed == 1:
-                    zone_config.handle_touch(display_x, display_y, pressed)
+                    bx, by, bw, bh = prof_button
+                    if not zone_config.edit_mode and bx <= display_x <= bx + bw and by <= display_y <= by + bh:
+                        profiler.start()
+                    else:
+                        zone_config.handle_touch(display_x, display_y, pressed)
                     
         except Exception as e:
             print(f"❌ Ошибка чтения TouchScreen: {e}")
@@ -326,37 +1351,42 @@ while not app.need_exit():
     # --- Получение ДИНАМИЧЕСКОЙ зоны с учетом угла ---
     x1, y1, x2, y2 = zone_config.get_zone(steering_angle)
 
-    # --- Объекты в зоне ---
-    objects_in_zone = []
-    for obj in target_objects:
-        cx = obj.x + obj.w // 2
-        cy = obj.y + obj.h // 2
-        if x1 <= cx <= x2 and y1 <= cy <= y2:
-            objects_in_zone.append(obj)
+    # --- Объекты классов из class_names и попадание в зону (счетчики по классам ведутся сразу) ---
+    frame.reset()
+    for obj in objs:
+        if obj.class_id in class_names:
+            cx = obj.x + obj.w // 2
+            cy = obj.y + obj.h // 2
+            frame.add(obj, x1 <= cx <= x2 and y1 <= cy <= y2)
 
     # --- Отправка сигнала о препятствии по Wi-Fi ---
-    has_obstacle = len(objects_in_zone) > 0 and zone_config.obstacle_detection_enabled
+    has_obstacle = frame.zone_count > 0 and zone_config.obstacle_detection_enabled
     
     if wifi_connected and zone_config.obstacle_detection_enabled:
-        wifi_manager.send_obstacle_data(has_obstacle, len(objects_in_zone), steering_angle)
+        wifi_manager.send_obstacle_data(has_obstacle, frame.zone_count, steering_angle)
+
+    # --- Кадр в общую память: зона как у трапеции (A,B,C,D), уровень 3 = стоп ---
+    if shm_export:
+        shm_export.begin()
+        shm_export.zone(3, frame.zone_count, ((x2, y2), (x2, y1), (x1, y1), (x1, y2)))
+        shm_export.end(frame, steering_angle, has_obstacle, frame.zone_count, 3 if frame.zone_count else 0)
     
     # Вывод в консоль при обнаружении препятствия
     current_time = time.ticks_ms()
     if has_obstacle and current_time - last_obstacle_print > 2000:
-        detected = [f"{class_names[oid]}: {len([o for o in objects_in_zone if o.class_id == oid])}"
-                   for oid in class_names if any(o.class_id == oid for o in objects_in_zone)]
+        detected = [f"{class_names[oid]}: {frame.class_counts[oid]}"
+                   for oid in class_names if frame.class_counts[oid] > 0]
         status = "📡 Отправлено по Wi-Fi" if wifi_connected else "❌ Wi-Fi не подключен"
         print(f"🚨 ПРЕПЯТСТВИЕ: {', '.join(detected)} | Угол: {steering_angle}° | {status}")
         last_obstacle_print = current_time
 
     # --- Визуализация ---
-    for obj in target_objects:
-        color = image.COLOR_GREEN if obj.class_id == 0 else \
-                image.COLOR_BLUE if obj.class_id in [1,2,3,7] else \
-                image.COLOR_YELLOW
-        img.draw_rect(obj.x, obj.y, obj.w, obj.h, color=color, thickness=2)
-        msg = f"{class_names[obj.class_id]}: {obj.score:.2f}"
-        img.draw_string(obj.x, obj.y - 15, msg, color=color, scale=1.2)
+    for i in range(frame.count):
+        cid = frame.class_id[i]
+        color = class_colors[cid]
+        img.draw_rect(frame.x[i], frame.y[i], frame.w[i], frame.h[i], color=color, thickness=2)
+        msg = score_labels[cid][int(frame.score[i] * 100 + 0.5)]
+        img.draw_string(frame.x[i], frame.y[i] - 15, msg, color=color, scale=1.2)
 
     # --- Отрисовка ДИНАМИЧЕСКОЙ зоны ---
     if zone_config.obstacle_detection_enabled:
@@ -407,10 +1437,19 @@ while not app.need_exit():
     obstacle_text_y = obstacle_button_y + 8
     img.draw_string(obstacle_text_x, obstacle_text_y, obstacle_button_text, color=obstacle_button_color, scale=0.8)
 
+    # --- Кнопка профилирования (СЛЕВА, под кнопкой зоны) ---
+    if not zone_config.edit_mode:
+        bx, by, bw, bh = prof_button
+        prof_color = image.COLOR_RED if profiler.active else image.COLOR_WHITE
+        img.draw_rect(bx, by, bw, bh, color=prof_color, thickness=2)
+        img.draw_string(bx + 6, by + 7, "PROF", color=prof_color, scale=0.7)
+
     # --- Статистика на экране (ВНИЗУ) ---
     wifi_status = "Wi-Fi: ON" if wifi_connected else "Wi-Fi: OFF"
     detect_status = "DETECT: ON" if zone_config.obstacle_detection_enabled else "DETECT: OFF"
-    stats_text = f"Objects: {len(target_objects)} | Zone: {len(objects_in_zone)} | Angle: {steering_angle:.1f} | {wifi_status}"
+    if current_time - stats_time >= 200:  # строка пересобирается 5 раз в секунду, а не на каждом кадре
+        stats_text = f"Objects: {frame.count} | Zone: {frame.zone_count} | Angle: {steering_angle:.1f} | Skip: {motion_gate.skip_ratio * 100:.0f}% | {wifi_status}"
+        stats_time = current_time
     
     y_pos = zone_config.height - 10  # Внизу экрана
     img.draw_rect(5, y_pos - 2, len(stats_text) * 6 + 10, 18, color=image.COLOR_BLACK, thickness=-1)
@@ -431,5 +1470,27 @@ while not app.need_exit():
         status_text = "OBSTACLE DETECTION DISABLED"
         img.draw_rect(cam.width()//2 - 120, 50, 240, 25, color=image.COLOR_GRAY, thickness=-1)
         img.draw_string(cam.width()//2 - 110, 53, status_text, color=image.COLOR_WHITE, scale=0.7)
+
+    # --- Снимок препятствия: в цикле только очередь, JPEG и диск в фоне ---
+    if snapshot_recorder and snapshot_recorder.due(has_obstacle):
+        snapshot_recorder.submit(img, {
+            "angle": round(steering_angle, 1),
+            "count": frame.zone_count,
+            "zone": [x1, y1, x2, y2],
+            "detections": SnapshotRecorder.detections(frame, class_names),
+        })
        
-    disp.show(img)
\ No newline at end of file
+    preview_streamer.offer(img)
+    disp.show(img)
+
+    # --- Команды настройки: применяются между кадрами ---
+    if tuning:
+        try:
+            tuning.poll()
+        except Exception as e:
+            print(f"❌ Ошибка команд настройки: {e}")
+
+    if alloc_probe:
+        alloc_probe.on_frame()
+
+    profiler.on_frame()
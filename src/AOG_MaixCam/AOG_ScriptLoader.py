@@ -0,0 +1,50 @@
+# Загрузка отдельных классов / функций из AOG_MaixCam.py и AOG_Trapez.py на обычном ПК.
+# Скрипты камеры при импорте подключают maix, открывают камеру и запускают цикл,
+# поэтому из исходника берутся только нужные определения (и import, кроме maix).
+
+import ast
+import os
+import types
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def script_path(name):
+    """"AOG_Trapez.py" -> полный путь рядом с этим файлом"""
+    return name if os.path.isabs(name) else os.path.join(SCRIPT_DIR, name)
+
+
+def load_definitions(path, names, **namespace):
+    """
+    Выполняет из скрипта только определения classes/functions (и присваивания констант) с именами из names.
+    namespace - то, что в скрипте берется из maix (например, time=...), если нужно.
+    """
+    path = script_path(path)
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+
+    body = []
+    found = set()
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            if all(not a.name.startswith("maix") for a in node.names):
+                body.append(node)
+        elif isinstance(node, ast.ImportFrom):
+            if not (node.module or "").startswith("maix"):
+                body.append(node)
+        elif isinstance(node, (ast.ClassDef, ast.FunctionDef)) and node.name in names:
+            body.append(node)
+            found.add(node.name)
+        elif (isinstance(node, ast.Assign) and len(node.targets) == 1 and
+              isinstance(node.targets[0], ast.Name) and node.targets[0].id in names):
+            body.append(node)  # константа уровня модуля: class_names = {...}, ZONE_PRESETS = [...]
+            found.add(node.targets[0].id)
+
+    missing = [n for n in names if n not in found]
+    if missing:
+        raise ImportError(f"{os.path.basename(path)}: нет определений {', '.join(missing)}")
+
+    ns = dict(namespace)
+    ns["__name__"] = "aog_" + os.path.splitext(os.path.basename(path))[0].lower()
+    exec(compile(ast.Module(body=body, type_ignores=[]), path, "exec"), ns)
+    return types.SimpleNamespace(**{n: ns[n] for n in names})
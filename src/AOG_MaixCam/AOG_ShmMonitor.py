@@ -0,0 +1,82 @@
+# Пример потребителя общей памяти (AOG_ShmReader.py): кадры и решения камеры в консоль.
+# Запуск на самой камере рядом с AOG_Trapez.py / AOG_MaixCam.py (SHM_EXPORT_ENABLED = True):
+#   python AOG_ShmMonitor.py
+#   python AOG_ShmMonitor.py --channel 1 --dets
+# Запись сессии для AOG_Sweep.py (JSONL, одна строка на кадр; "label" размечается потом: 1/0):
+#   python AOG_ShmMonitor.py --record session1.jsonl --every 1000
+
+import argparse
+import json
+import time
+from collections import defaultdict
+
+from AOG_ShmReader import SHM_PATH, ShmReader
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Кадры камеры из общей памяти")
+    parser.add_argument("--path", default=SHM_PATH)
+    parser.add_argument("--channel", type=int, default=None, help="только эта камера")
+    parser.add_argument("--dets", action="store_true", help="печатать каждую детекцию")
+    parser.add_argument("--every", type=int, default=1, help="печатать каждый N-й кадр")
+    parser.add_argument("--record", help="писать кадры в JSONL для AOG_Sweep.py")
+    a = parser.parse_args()
+
+    reader = ShmReader(a.path)
+    print(f"🧠 {a.path}: {reader.slots} слотов x {reader.slot_size} Б, "
+          f"до {reader.max_dets} детекций / {reader.max_zones} зон")
+
+    seq = reader.latest_seq()
+    shown = 0
+    per_channel = defaultdict(int)
+    ages = []
+    last_report = time.monotonic()
+    record = open(a.record, "a", encoding="utf-8") if a.record else None
+    try:
+        while True:
+            for frame in reader.wait(seq):
+                seq = frame.seq
+                ages.append((time.monotonic() - frame.t) * 1000.0)
+                per_channel[frame.channel] += 1
+                if a.channel is not None and frame.channel != a.channel:
+                    continue
+                if record:
+                    record.write(json.dumps({
+                        "t": round(frame.t, 4),
+                        "ch": frame.channel,
+                        "angle": round(frame.angle, 2),
+                        "obstacle": int(frame.has_obstacle),  # решение камеры при записи
+                        "dets": [[x, y, w, h, cid, round(score, 4)] for x, y, w, h, cid, _, score in frame.dets],
+                        "label": None,
+                    }) + "\n")
+                shown += 1
+                if shown % a.every:
+                    continue
+                zones = " ".join(f"L{lv}:{cnt}" for lv, cnt, _ in frame.zones)
+                mark = "🚨" if frame.has_obstacle else "  "
+                print(f"{mark} #{frame.seq} ch={frame.channel} angle={frame.angle:6.1f} "
+                      f"level={frame.level} count={frame.count} zones[{zones}] dets={len(frame.dets)}")
+                if a.dets:
+                    for x, y, w, h, cid, level, score in frame.dets:
+                        print(f"     class={cid} score={score:.2f} box=({x},{y},{w},{h}) zone={level}")
+
+            now = time.monotonic()
+            if now - last_report >= 5.0:
+                rates = " ".join(f"ch{ch}:{n / (now - last_report):.1f}/s" for ch, n in sorted(per_channel.items()))
+                age = sorted(ages)[len(ages) // 2] if ages else 0.0
+                print(f"⏱ {rates or 'нет кадров'} | задержка p50 {age:.2f} мс | "
+                      f"потеряно {reader.lost}, порвано {reader.torn}, перезапусков камеры {reader.restarts}")
+                per_channel.clear()
+                ages.clear()
+                last_report = now
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
+        if record:
+            record.close()
+            print(f"💾 Записано в {a.record}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+# Чтение кольца кадров из общей памяти (DetectionExport в AOG_MaixCam.py / AOG_Trapez.py).
+# Для других процессов на камере: логгер, мост к другому контроллеру, диагностика.
+# Без блокировок и сокетов: файл /dev/shm отображается в память, слот проверяется по seq в начале
+# и в конце (писатель мог перезаписать его во время чтения). read() / poll() копируют значения слота
+# в Frame (кортежи Python); без копирования - view(seq) и разбор на месте, затем is_current(seq).
+# Перезапуск камеры (новое поколение в заголовке или seq пошел назад) poll() замечает сам и
+# продолжает с нового кольца.
+#
+#   reader = ShmReader()
+#   seq = 0
+#   while True:
+#       for frame in reader.poll(seq):
+#           seq = frame.seq
+#           ...
+
+import mmap
+import os
+import time
+
+from AOG_ScriptLoader import load_definitions
+
+SHM_PATH = "/dev/shm/aog_detections"
+
+# раскладка берется из самого скрипта камеры, чтобы не разойтись с писателем
+DetectionExport = load_definitions("AOG_Trapez.py", ["DetectionExport"]).DetectionExport
+
+
+class Frame:
+    """Один кадр одной камеры. zones: (level, count, (A, B, C, D)), dets: (x, y, w, h, class_id, level, score)"""
+    __slots__ = ("seq", "t", "angle", "channel", "has_obstacle", "level", "count", "zones", "dets")
+
+    def __init__(self, seq, t, angle, channel, has_obstacle, level, count, zones, dets):
+        self.seq = seq
+        self.t = t                # time.monotonic() писателя: в том же устройстве сравнимо с нашим
+        self.angle = angle
+        self.channel = channel
+        self.has_obstacle = has_obstacle
+        self.level = level
+        self.count = count
+        self.zones = zones
+        self.dets = dets
+
+    def __repr__(self):
+        return (f"Frame(seq={self.seq}, ch={self.channel}, angle={self.angle:.1f}, "
+                f"obstacle={int(self.has_obstacle)}, level={self.level}, count={self.count}, dets={len(self.dets)})")
+
+
+class ShmReader:
+    def __init__(self, path=SHM_PATH):
+        self.path = path
+        self.mm = None
+        self._attach()
+        self.lost = 0      # кадры, перезаписанные до того, как их прочитали
+        self.torn = 0      # слоты, перезаписанные во время чтения
+        self.restarts = 0  # перезапуски писателя, после которых чтение продолжилось с нового кольца
+        self._restart = False
+
+    def _attach(self):
+        """Отобразить файл и разобрать заголовок (при старте и после перезапуска писателя)"""
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            mm = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+
+        L = DetectionExport
+        magic, version, slots, slot_size, max_dets, max_zones, _ = L.HEADER.unpack_from(mm, 0)
+        if magic != L.MAGIC:
+            mm.close()
+            raise ValueError(f"{self.path}: не кольцо детекций (magic {magic!r})")
+        if version != L.VERSION:
+            mm.close()
+            raise ValueError(f"{self.path}: версия {version}, ожидается {L.VERSION}")
+
+        zones_offset = L.SLOT_HEAD.size
+        dets_offset = zones_offset + max_zones * L.ZONE.size
+        end_offset = dets_offset + max_dets * L.DET.size
+        if end_offset + L.SEQ.size != slot_size or len(mm) < L.HEADER_SIZE + slots * slot_size:
+            mm.close()
+            raise ValueError(f"{self.path}: размер слота не совпадает с раскладкой")
+
+        if self.mm is not None:
+            try:
+                self.mm.close()
+            except BufferError:
+                pass  # на старое кольцо еще есть view(): закроется, когда его отпустят
+        self.mm = mm
+        self.slots, self.slot_size, self.max_dets, self.max_zones = slots, slot_size, max_dets, max_zones
+        self.zones_offset, self.dets_offset, self.end_offset = zones_offset, dets_offset, end_offset
+        self.generation = L.SEQ.unpack_from(mm, L.GENERATION_OFFSET)[0]
+
+    def close(self):
+        self.mm.close()
+
+    def _check_writer(self):
+        """
+        False - писатель как раз пишет заголовок (magic еще нет), читать нечего.
+        Новое поколение - писатель перезапущен: файл отображается заново (размер кольца мог измениться).
+        """
+        L = DetectionExport
+        if self.mm[0:4] != L.MAGIC:
+            return False
+        if L.SEQ.unpack_from(self.mm, L.GENERATION_OFFSET)[0] != self.generation:
+            try:
+                self._attach()
+            except (OSError, ValueError):
+                return False  # заголовок еще пишется - в следующий раз
+            self.restarts += 1
+            self._restart = True
+        return True
+
+    def latest_seq(self):
+        return DetectionExport.SEQ.unpack_from(self.mm, DetectionExport.WRITE_SEQ_OFFSET)[0]
+
+    def _base(self, seq):
+        return DetectionExport.HEADER_SIZE + (seq % self.slots) * self.slot_size
+
+    def view(self, seq):
+        """
+        Слот как memoryview, без копирования (read() копирует значения в Frame).
+        Данные действительны, только если после разбора is_current(seq) все еще True.
+        """
+        base = self._base(seq)
+        return memoryview(self.mm)[base:base + self.slot_size]
+
+    def is_current(self, seq):
+        base = self._base(seq)
+        L = DetectionExport
+        return (L.SEQ.unpack_from(self.mm, base + self.end_offset)[0] == seq and
+                L.SEQ.unpack_from(self.mm, base)[0] == seq)
+
+    def read(self, seq):
+        """Копия кадра seq в Frame или None, если слот уже занят другим кадром / пишется прямо сейчас"""
+        L = DetectionExport
+        mm = self.mm
+        base = self._base(seq)
+        if L.SEQ.unpack_from(mm, base + self.end_offset)[0] != seq:
+            return None
+
+        _, t, angle, channel, obstacle, level, zone_n, count, det_n = L.SLOT_HEAD.unpack_from(mm, base)
+        zone_n = min(zone_n, self.max_zones)
+        det_n = min(det_n, self.max_dets)
+        zones = []
+        off = base + self.zones_offset
+        for _ in range(zone_n):
+            z_level, z_count, ax, ay, bx, by, cx, cy, dx, dy = L.ZONE.unpack_from(mm, off)
+            zones.append((z_level, z_count, ((ax, ay), (bx, by), (cx, cy), (dx, dy))))
+            off += L.ZONE.size
+        dets = []
+        off = base + self.dets_offset
+        for _ in range(det_n):
+            dets.append(L.DET.unpack_from(mm, off))
+            off += L.DET.size
+
+        # seq_begin читается последним: если писатель начал этот слот заново, кадр порван
+        if L.SEQ.unpack_from(mm, base)[0] != seq:
+            self.torn += 1
+            return None
+        return Frame(seq, t, angle, channel, bool(obstacle), level, count, zones, dets)
+
+    def poll(self, last_seq):
+        """
+        Все кадры после last_seq, которые еще есть в кольце (по порядку).
+        После перезапуска писателя - все кадры нового кольца, какой бы ни был last_seq.
+        """
+        if not self._check_writer():
+            return []
+        latest = self.latest_seq()
+        if latest < last_seq and not self._restart:
+            self.restarts += 1  # seq пошел назад: перезапуск, которого не видно по поколению
+            self._restart = True
+        if self._restart:
+            if latest == 0:
+                return []
+            self._restart = False
+            first = max(1, latest - self.slots + 1)
+        elif latest == last_seq:
+            return []
+        else:
+            first = max(last_seq + 1, latest - self.slots + 1)
+            if last_seq:
+                self.lost += first - last_seq - 1
+        frames = []
+        for seq in range(first, latest + 1):
+            frame = self.read(seq)
+            if frame is not None:
+                frames.append(frame)
+            else:
+                self.lost += 1
+        return frames
+
+    def wait(self, last_seq, timeout=1.0, interval=0.002):
+        """Как poll, но ждет новый кадр до timeout секунд"""
+        deadline = time.monotonic() + timeout
+        while True:
+            frames = self.poll(last_seq)
+            if frames or time.monotonic() >= deadline:
+                return frames
+            time.sleep(interval)
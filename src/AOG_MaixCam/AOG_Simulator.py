@@ -0,0 +1,479 @@
+# Стенд вместо ESP32 / AgOpenGPS для нагрузочной проверки камеры, обычный CPython на Linux.
+# Шлет угол руля на камеру ("ANGLE:12.5" на порт 8889 или PGN AgIO 254/253 на 8888/9999)
+# с заданной частотой, джиттером, потерями, пачками и битыми пакетами, принимает
+# "OBSTACLE:...:SEQ:n" на порт 8888 и считает частоту, паузы, ошибки последовательности
+# и задержку угол -> ответ камеры. На реальной камере для SEQ нужно UDP_SEND_SEQ = True.
+#
+# Всё на одном хосте через loopback (вместо камеры - AngleReceiver/WiFiManager из скрипта):
+#   python AOG_Simulator.py --loopback --script AOG_Trapez.py --pattern sine --rate 50 --duration 20
+# Задержка text (PGN -> ретранслятор-ESP32 -> ANGLE), text напрямую и PGN напрямую, loopback:
+#   python AOG_Simulator.py --loopback --compare --rate 10 --relay-ms 10 --duration 20
+# С реальной камерой (ПК в сети AOG4 с адресом ESP32 192.168.4.1):
+#   python AOG_Simulator.py --camera 192.168.4.2 --pattern replay --replay angles.csv
+#   python AOG_Simulator.py --camera 192.168.4.2 --input pgn   (на камере ANGLE_INPUT = "pgn")
+
+import argparse
+import collections
+import math
+import random
+import socket
+import struct
+import threading
+import time
+import types
+
+from AOG_ScriptLoader import load_definitions
+
+MALFORMED = [
+    b"ANGLE:",
+    b"ANGLE:abc",
+    b"ANGLE:1.2.3",
+    b"ANGLE",
+    b"angle:5.0",
+    b"\xff\xfe\xfd\xfc",
+    b"ANGLE:" + b"9" * 120,  # длиннее буфера приема (64 байта)
+]
+
+
+def pgn_packet(pgn, payload, src=0x7F):
+    """Пакет AgOpenGPS: 0x80 0x81 src pgn len данные crc (crc - сумма байт от src до данных)"""
+    body = bytes((src, pgn, len(payload))) + payload
+    return b"\x80\x81" + body + bytes((sum(body) & 0xFF,))
+
+
+STEER_DATA = struct.Struct("<HBhBBB")     # PGN 254 (AgIO -> модули)
+FROM_AUTOSTEER = struct.Struct("<hhhBB")  # PGN 253 (модуль руля -> AgIO)
+
+
+def steer_data_packet(angle, speed_kmh=8.0, status=1):
+    return pgn_packet(254, STEER_DATA.pack(int(round(speed_kmh * 10)), status, int(round(angle * 100)), 0, 0, 0))
+
+
+def autosteer_packet(angle):
+    return pgn_packet(253, FROM_AUTOSTEER.pack(int(round(angle * 100)), 0, 0, 0, 0), src=0x7E)
+
+
+MALFORMED_PGN = [
+    steer_data_packet(5.0)[:-1] + b"\x00",  # неверный CRC
+    steer_data_packet(5.0)[:9],              # обрезан
+    b"\x80\x81",
+    pgn_packet(200, b"\x01\x02"),            # чужой PGN
+    b"\x81\x80" + steer_data_packet(5.0)[2:],
+]
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+class AngleSource:
+    """Угол руля по времени: sine / step / ramp / const / replay (CSV: "угол" или "время_с,угол")"""
+    def __init__(self, pattern="sine", amplitude=30.0, period=4.0, replay=None, rate=20.0):
+        self.pattern = pattern
+        self.amplitude = amplitude
+        self.period = period
+        self.rows = []
+        if pattern == "replay":
+            with open(replay) as f:
+                for i, line in enumerate(f):
+                    parts = [p.strip() for p in line.split(",") if p.strip()]
+                    try:
+                        if len(parts) >= 2:
+                            self.rows.append((float(parts[0]), float(parts[1])))
+                        elif parts:
+                            self.rows.append((i / rate, float(parts[0])))
+                    except ValueError:
+                        continue  # заголовок / комментарий
+            if not self.rows:
+                raise ValueError(f"{replay}: нет строк с углом")
+
+    def value(self, t):
+        if self.pattern == "sine":
+            return self.amplitude * math.sin(2 * math.pi * t / self.period)
+        if self.pattern == "step":
+            return self.amplitude if int(t / (self.period / 2)) % 2 == 0 else -self.amplitude
+        if self.pattern == "ramp":
+            phase = (t % self.period) / self.period
+            return -self.amplitude + 2 * self.amplitude * phase
+        if self.pattern == "replay":
+            t0 = self.rows[0][0]
+            span = self.rows[-1][0] - t0
+            t = t0 + (t % span if span > 0 else 0)  # запись проигрывается по кругу
+            angle = self.rows[0][1]
+            for ts, a in self.rows:
+                if ts > t:
+                    break
+                angle = a
+            return angle
+        return self.amplitude  # const
+
+
+class AngleSender:
+    """
+    Поток отправки угла. sent_log - (время, "12.5") для каждого нового значения угла.
+    mode "text" - ANGLE:x на addr, "pgn" - PGN 254 на addr и PGN 253 на status_addr (если задан).
+    """
+    def __init__(self, addr, source, rate=20.0, jitter_ms=0.0, loss=0.0, malformed=0.0,
+                 burst=0, burst_every=0.0, flood=False, mode="text", status_addr=None, speed_kmh=8.0):
+        self.addr = addr
+        self.mode = mode
+        self.status_addr = status_addr
+        self.speed_kmh = speed_kmh
+        self.source = source
+        self.rate = rate
+        self.jitter_ms = jitter_ms
+        self.loss = loss
+        self.malformed = malformed
+        self.burst = burst
+        self.burst_every = burst_every
+        self.flood = flood
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+        self.sent_log = collections.deque()
+        self.log_lock = threading.Lock()
+        self.sent = 0
+        self.dropped = 0
+        self.bad = 0
+        self.bursts = 0
+        self.elapsed = 0.0  # длительность отправки, с (без ожидания ответов)
+        self._last_value = None
+
+    def _send_angle(self, t):
+        value = f"{self.source.value(t):.1f}"
+        if value != self._last_value:
+            with self.log_lock:
+                self.sent_log.append((time.monotonic(), value))
+            self._last_value = value
+        if random.random() < self.loss:
+            self.dropped += 1  # имитация потери в сети: пакет не отправляется
+            return
+        if self.mode == "pgn":
+            angle = float(value)
+            self.sock.sendto(steer_data_packet(angle, self.speed_kmh), self.addr)
+            if self.status_addr:
+                self.sock.sendto(autosteer_packet(angle), self.status_addr)  # руль "успевает" за заданным
+        else:
+            self.sock.sendto(f"ANGLE:{value}".encode("utf-8"), self.addr)
+        self.sent += 1
+
+    def run(self, duration, stop):
+        t0 = time.monotonic()
+        next_burst = self.burst_every
+        try:
+            while not stop.is_set():
+                t = time.monotonic() - t0
+                if t >= duration:
+                    break
+                if self.malformed > 0 and random.random() < self.malformed:
+                    self.sock.sendto(random.choice(MALFORMED_PGN if self.mode == "pgn" else MALFORMED), self.addr)
+                    self.bad += 1
+                else:
+                    self._send_angle(t)
+                if self.burst and self.burst_every and t >= next_burst:
+                    for _ in range(self.burst):
+                        self._send_angle(time.monotonic() - t0)
+                    self.bursts += 1
+                    next_burst += self.burst_every
+                if not self.flood:
+                    delay = 1.0 / self.rate + random.uniform(-self.jitter_ms, self.jitter_ms) / 1000.0
+                    time.sleep(max(0.0, delay))
+        finally:
+            self.elapsed = time.monotonic() - t0  # и при Ctrl+C
+
+
+class ObstacleMonitor:
+    """Прием "OBSTACLE:1:COUNT:2:ANGLE:12.5[:CH:n]:SEQ:n": частота, паузы, SEQ, задержка"""
+    def __init__(self, port, sender, gap_ms=200.0):
+        self.sender = sender
+        self.gap_ms = gap_ms
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("0.0.0.0", port))
+        self.sock.settimeout(0.2)
+
+        self.received = 0
+        self.parse_errors = 0
+        self.per_channel = collections.Counter()
+        self.gaps = []             # мс между сообщениями одного канала
+        self.latencies = []        # мс от отправки нового угла до первого ответа с ним
+        self.superseded = 0        # значения угла, которые камера так и не вернула
+        self.seq_lost = 0
+        self.seq_reordered = 0     # дубли и перестановки
+        self.first_rx = None
+        self.last_rx = None
+        self._last_seq = None
+        self._last_time = {}
+        self._last_angle = {}
+
+    def close(self):
+        self.sock.close()
+
+    def _check_seq(self, seq):
+        if self._last_seq is not None:
+            diff = (seq - self._last_seq) & 0xFFFF
+            if diff == 0 or diff > 0x8000:
+                self.seq_reordered += 1
+                return
+            self.seq_lost += diff - 1
+        self._last_seq = seq
+
+    def _match_latency(self, angle, now):
+        # ищем значение в журнале отправки; все, что было отправлено раньше, камера пропустила
+        with self.sender.log_lock:
+            log = self.sender.sent_log
+            for i, (ts, value) in enumerate(log):
+                if value == angle:
+                    for _ in range(i + 1):
+                        log.popleft()
+                    self.superseded += i
+                    self.latencies.append((now - ts) * 1000.0)
+                    return
+
+    def run(self, stop):
+        while not stop.is_set():
+            try:
+                data, _ = self.sock.recvfrom(256)
+            except socket.timeout:
+                continue
+            now = time.monotonic()
+            try:
+                parts = data.decode("utf-8").strip().split(":")
+                fields = dict(zip(parts[0::2], parts[1::2]))
+                angle = f"{float(fields['ANGLE']):.1f}"
+                channel = int(fields.get("CH", 0))
+                seq = int(fields["SEQ"]) if "SEQ" in fields else None
+            except (UnicodeDecodeError, KeyError, ValueError):
+                self.parse_errors += 1
+                continue
+
+            self.received += 1
+            self.per_channel[channel] += 1
+            self.first_rx = self.first_rx or now
+            self.last_rx = now
+            if channel in self._last_time:
+                self.gaps.append((now - self._last_time[channel]) * 1000.0)
+            self._last_time[channel] = now
+            if seq is not None:
+                self._check_seq(seq)
+            if self._last_angle.get(channel) != angle:
+                self._match_latency(angle, now)
+                self._last_angle[channel] = angle
+
+
+class EspRelay:
+    """
+    Вместо ESP32 в режиме text: принимает PGN 254 от "AgIO" и раз в period_ms
+    пересылает последний угол камере как ANGLE:x - лишнее звено, которое убирает режим pgn
+    """
+    def __init__(self, listen_port, camera_addr, period_ms=10.0):
+        self.camera_addr = camera_addr
+        self.period_ms = period_ms
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", listen_port))
+        self.sock.setblocking(False)
+        self.out = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.forwarded = 0
+
+    def run(self, stop):
+        angle = None
+        while not stop.is_set():
+            time.sleep(self.period_ms / 1000.0)  # цикл loop() прошивки
+            try:
+                while True:
+                    data = self.sock.recv(64)
+                    if len(data) >= 14 and data[:2] == b"\x80\x81" and data[3] == 254:
+                        angle = STEER_DATA.unpack_from(data, 5)[2] / 100.0
+            except BlockingIOError:
+                pass
+            if angle is not None:
+                self.out.sendto(f"ANGLE:{angle:.1f}".encode("utf-8"), self.camera_addr)
+                self.forwarded += 1
+                angle = None
+
+    def close(self):
+        self.sock.close()
+        self.out.close()
+
+
+class _LoopbackWifi:
+    # вместо maix.network.wifi.Wifi: "подключение" всегда успешно
+    def connect(self, ssid, password, wait=True, timeout=30):
+        return 0
+
+    def get_ip(self):
+        return "127.0.0.1"
+
+
+class LoopbackCamera:
+    """Камера на этом же хосте: настоящие AngleReceiver и WiFiManager из скрипта, вместо детекции - пауза"""
+    def __init__(self, script, angle_port, obstacle_port, work_ms, input_mode="text", pgn_ports=(8888, 9999)):
+        network = type("network", (), {"wifi": type("wifi", (), {"Wifi": _LoopbackWifi})})
+        maix_time = types.SimpleNamespace(ticks_ms=lambda: int(time.monotonic() * 1000))
+        defs = load_definitions(script, ["ObstaclePacket", "WiFiManager", "AngleReceiver"],
+                                network=network, time=maix_time)
+        self.receiver = defs.AngleReceiver(listen_port=angle_port, mode=input_mode, pgn_ports=pgn_ports)
+        self.wifi = defs.WiFiManager()
+        self.wifi.esp32_ip = "127.0.0.1"
+        self.wifi.esp32_port = obstacle_port
+        self.wifi.esp32_addr = ("127.0.0.1", obstacle_port)
+        self.wifi.connect("loopback", "")
+        self.wifi.send_seq = True
+        self.work_ms = work_ms
+        self.frames = 0
+        self.elapsed = 0.0
+
+    def run(self, stop):
+        angle = 0.0
+        t0 = time.monotonic()
+        while not stop.is_set():
+            time.sleep(self.work_ms / 1000.0)  # "детекция"
+            if self.receiver.receive_angle():
+                angle = self.receiver.current_angle
+            self.wifi.send_obstacle_data(False, 0, angle)
+            self.frames += 1
+        self.elapsed = time.monotonic() - t0
+
+    def close(self):
+        for s in getattr(self.receiver, "sockets", [self.receiver.udp_socket]):
+            s.close()
+        self.wifi.udp_socket.close()
+
+
+def report(sender, monitor, camera=None):
+    rx_span = (monitor.last_rx - monitor.first_rx) if monitor.received > 1 else 0.0
+    print("=== Отправка угла ===")
+    print(f"  пакетов: {sender.sent} ({sender.sent / max(sender.elapsed, 1e-9):.1f}/с), потеряно специально: {sender.dropped}, "
+          f"битых: {sender.bad}, пачек: {sender.bursts}")
+    print("=== Сообщения OBSTACLE ===")
+    rate = monitor.received / rx_span if rx_span > 0 else 0.0
+    channels = ", ".join(f"CH{ch}={n}" for ch, n in sorted(monitor.per_channel.items()))
+    print(f"  принято: {monitor.received} ({rate:.1f}/с) [{channels}], ошибок разбора: {monitor.parse_errors}")
+    long_gaps = sum(1 for g in monitor.gaps if g > monitor.gap_ms)
+    print(f"  паузы, мс: p50={percentile(monitor.gaps, 50):.1f} p99={percentile(monitor.gaps, 99):.1f} "
+          f"max={max(monitor.gaps, default=0.0):.1f}, дольше {monitor.gap_ms:.0f} мс: {long_gaps}")
+    print(f"  SEQ: пропущено {monitor.seq_lost}, дубли/перестановки {monitor.seq_reordered}")
+    print("=== Задержка угол -> ответ камеры ===")
+    print(f"  n={len(monitor.latencies)} p50={percentile(monitor.latencies, 50):.1f} "
+          f"p95={percentile(monitor.latencies, 95):.1f} max={max(monitor.latencies, default=0.0):.1f} мс, "
+          f"значений угла не дошло до ответа: {monitor.superseded}")
+    if camera is not None:
+        print(f"  кадров loopback-камеры: {camera.frames} ({camera.frames / max(camera.elapsed, 1e-9):.1f}/с)")
+        if camera.receiver.mode == "pgn":
+            print(f"  PGN: ошибок CRC {camera.receiver.crc_errors}, скорость {camera.receiver.speed_kmh:.1f} км/ч")
+
+
+def run_session(a, input_mode, relay_ms):
+    """Один прогон: отправка угла, камера (для --loopback), прием OBSTACLE. -> (sender, monitor, camera)"""
+    stop = threading.Event()
+    source = AngleSource(a.pattern, a.amplitude, a.period, a.replay, a.rate)
+    # loopback: монитор OBSTACLE уже занял 8888, PGN камеры слушает на смещенных портах
+    pgn_ports = (a.pgn_port, a.pgn_status_port)
+    if a.loopback:
+        pgn_ports = (a.pgn_port + 20000, a.pgn_status_port + 20000)
+
+    relay = None
+    if input_mode == "pgn":
+        sender_mode, addr, status_addr = "pgn", (a.camera, pgn_ports[0]), (a.camera, pgn_ports[1])
+    elif relay_ms > 0:
+        # AgIO -> ESP32 -> камера: PGN 254 на ретранслятор, он шлет ANGLE:x
+        relay = EspRelay(a.relay_port, (a.camera, a.angle_port), relay_ms)
+        sender_mode, addr, status_addr = "pgn", ("127.0.0.1", a.relay_port), None
+    else:
+        sender_mode, addr, status_addr = "text", (a.camera, a.angle_port), None
+    sender = AngleSender(addr, source, a.rate, a.jitter_ms, a.loss, a.malformed,
+                         a.burst, a.burst_every, a.flood, sender_mode, status_addr, a.speed)
+    monitor = ObstacleMonitor(a.listen_port, sender, a.gap_ms)
+    threads = [threading.Thread(target=monitor.run, args=(stop,), daemon=True)]
+
+    camera = None
+    if a.loopback:
+        camera = LoopbackCamera(a.script, a.angle_port, a.listen_port, a.cam_work_ms, input_mode, pgn_ports)
+        threads.append(threading.Thread(target=camera.run, args=(stop,), daemon=True))
+    if relay:
+        threads.append(threading.Thread(target=relay.run, args=(stop,), daemon=True))
+
+    for t in threads:
+        t.start()
+    hop = f" через ретранслятор {relay_ms:.0f} мс" if relay else ""
+    print(f"▶ {a.pattern} {a.rate:.0f}/с, вход {input_mode}{hop} -> {addr[0]}:{addr[1]}, "
+          f"прием на {a.listen_port}, {a.duration:.0f} с")
+    try:
+        sender.run(a.duration, stop)
+        time.sleep(0.5)  # дождаться последних ответов
+    except KeyboardInterrupt:
+        pass
+    stop.set()
+    for t in threads:
+        t.join(timeout=1.0)
+    monitor.close()
+    for part in (camera, relay):
+        if part:
+            part.close()
+    return sender, monitor, camera
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Стенд ESP32/AgOpenGPS: поток угла + прием OBSTACLE")
+    parser.add_argument("--camera", default="127.0.0.1", help="IP камеры")
+    parser.add_argument("--angle-port", type=int, default=8889)
+    parser.add_argument("--listen-port", type=int, default=8888, help="порт приема OBSTACLE")
+    parser.add_argument("--pattern", choices=["sine", "step", "ramp", "const", "replay"], default="sine")
+    parser.add_argument("--amplitude", type=float, default=30.0, help="градусы")
+    parser.add_argument("--period", type=float, default=4.0, help="секунды")
+    parser.add_argument("--replay", help="CSV для --pattern replay")
+    parser.add_argument("--rate", type=float, default=20.0, help="пакетов угла в секунду")
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--loss", type=float, default=0.0, help="доля потерянных пакетов 0..1")
+    parser.add_argument("--malformed", type=float, default=0.0, help="доля битых пакетов 0..1")
+    parser.add_argument("--burst", type=int, default=0, help="пакетов в пачке")
+    parser.add_argument("--burst-every", type=float, default=0.0, help="секунды между пачками")
+    parser.add_argument("--flood", action="store_true", help="слать без пауз")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--gap-ms", type=float, default=200.0, help="порог длинной паузы")
+    parser.add_argument("--loopback", action="store_true", help="поднять камеру-заглушку на этом хосте")
+    parser.add_argument("--script", default="AOG_Trapez.py", help="скрипт для --loopback")
+    parser.add_argument("--cam-work-ms", type=float, default=30.0, help="время 'детекции' в --loopback")
+    parser.add_argument("--input", choices=["text", "pgn"], default="text",
+                        help="вход угла камеры: ANGLE:x или PGN AgIO (ANGLE_INPUT в скрипте)")
+    parser.add_argument("--pgn-port", type=int, default=8888, help="PGN 254 (данные руля)")
+    parser.add_argument("--pgn-status-port", type=int, default=9999, help="PGN 253 (статус модуля руля)")
+    parser.add_argument("--speed", type=float, default=8.0, help="скорость в PGN 254, км/ч")
+    parser.add_argument("--relay-ms", type=float, default=0.0,
+                        help="text через ретранслятор-ESP32 с таким периодом цикла (только --loopback)")
+    parser.add_argument("--relay-port", type=int, default=28890)
+    parser.add_argument("--compare", action="store_true",
+                        help="--loopback: text через ретранслятор, text и pgn напрямую, сравнить задержку")
+    a = parser.parse_args()
+    if (a.relay_ms > 0 or a.compare) and not a.loopback:
+        parser.error("--relay-ms и --compare только с --loopback")
+
+    if not a.compare:
+        report(*run_session(a, a.input, a.relay_ms))
+        return
+
+    relay_ms = a.relay_ms or 10.0
+    results = []
+    # text напрямую отделяет стоимость разбора от лишнего звена ESP32
+    runs = ((f"text через ESP32 ({relay_ms:.0f} мс)", "text", relay_ms),
+            ("text напрямую", "text", 0.0),
+            ("pgn напрямую", "pgn", 0.0))
+    for name, mode, hop in runs:
+        sender, monitor, camera = run_session(a, mode, hop)
+        report(sender, monitor, camera)
+        results.append((name, monitor.latencies))
+        time.sleep(0.2)
+    print("=== Сравнение входа угла (угол -> ответ камеры, мс) ===")
+    for name, lat in results:
+        print(f"  {name:24} n={len(lat):4d} p50={percentile(lat, 50):6.1f} p95={percentile(lat, 95):6.1f} "
+              f"max={max(lat, default=0.0):6.1f}")
+    p50_relay = percentile(results[0][1], 50)
+    p50_pgn = percentile(results[2][1], 50)
+    print(f"  pgn быстрее text через ESP32 на {p50_relay - p50_pgn:.1f} мс (p50; в loopback без эфира Wi-Fi "
+          f"между ESP32 и камерой)")
+
+
+if __name__ == "__main__":
+    main()
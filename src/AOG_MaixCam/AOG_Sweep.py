@@ -0,0 +1,267 @@
+# Перебор параметров зоны / порогов по записанным сессиям, обычный CPython (несколько процессов).
+# Логика зоны и решения "препятствие" берется из AOG_MaixCam.py и AOG_Trapez.py (AOG_ScriptLoader),
+# детекции - из записи AOG_ShmMonitor.py --record, разметка - поле "label" (1 = препятствие есть).
+#
+#   python AOG_Sweep.py session1.jsonl session2.jsonl \
+#       --grid conf_th=0.4,0.5,0.6 --grid iou_th=0.3,0.45 --grid max_shift_ratio=0.2:0.5:0.1
+#   python AOG_Sweep.py sessions/*.jsonl --script AOG_Trapez.py --grid stop.shift_far_k=0.8,1.0,1.3
+#
+# Параметры: conf_th, iou_th и любой атрибут ZoneConfig скрипта ("name" - все зоны,
+# "<зона>.name" - одна зона AOG_Trapez). Параметр, которого нет у скрипта, для него не перебирается.
+# Запись содержит детекции после conf_th / NMS камеры: перебирать имеет смысл conf_th не ниже,
+# а iou_th не выше, чем были при записи (для записи - conf_th=0.05 через AOG_Tune.py).
+
+import argparse
+import itertools
+import json
+import os
+import time
+import types
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from AOG_ScriptLoader import load_definitions
+
+SCRIPTS = ("AOG_MaixCam.py", "AOG_Trapez.py")
+SCRIPT_DEFS = {
+    "AOG_MaixCam.py": ["FrameResult", "ZoneConfig", "class_names"],
+    "AOG_Trapez.py": ["FrameResult", "ZoneConfig", "ZoneSet", "quad_edge_coefficients", "clamp",
+                      "make_zones", "ZONE_PRESETS", "class_names"],
+}
+DEFAULTS = {"conf_th": 0.5, "iou_th": 0.45}
+
+# в каждом процессе пула: загруженные скрипты и сессии (один раз, не на каждую задачу)
+_defs = {}
+_streams = []
+
+
+def parse_grid(items):
+    """["conf_th=0.4,0.5", "x=0.2:0.5:0.1"] -> {"conf_th": [0.4, 0.5], "x": [0.2, 0.3, 0.4, 0.5]}"""
+    grid = {}
+    for item in items:
+        name, _, values = item.partition("=")
+        if ":" in values:
+            lo, hi, step = (float(v) for v in values.split(":"))
+            n = int(round((hi - lo) / step)) + 1
+            grid[name.strip()] = [round(lo + i * step, 6) for i in range(n)]
+        else:
+            grid[name.strip()] = [float(v) for v in values.split(",") if v.strip()]
+    return grid
+
+
+def load_sessions(paths):
+    """JSONL -> потоки кадров по (файл, камера): [(t, angle, [obj], label), ...]"""
+    streams = defaultdict(list)
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                rec = json.loads(line)
+                objs = [types.SimpleNamespace(x=x, y=y, w=w, h=h, class_id=cid, score=score)
+                        for x, y, w, h, cid, score in rec["dets"]]
+                label = rec.get("label")
+                streams[(os.path.basename(path), rec.get("ch", 0))].append(
+                    (rec["t"], rec["angle"], objs, None if label is None else bool(label)))
+    return list(streams.values())
+
+
+def _init_worker(paths):
+    global _streams
+    _streams = load_sessions(paths)
+    for script, names in SCRIPT_DEFS.items():
+        _defs[script] = load_definitions(script, names, time=types.SimpleNamespace(ticks_ms=lambda: 0))
+
+
+def _iou(a, b):
+    ix = min(a.x + a.w, b.x + b.w) - max(a.x, b.x)
+    iy = min(a.y + a.h, b.y + b.h) - max(a.y, b.y)
+    if ix <= 0 or iy <= 0:
+        return 0.0
+    inter = ix * iy
+    return inter / (a.w * a.h + b.w * b.h - inter)
+
+
+def filter_nms(objs, conf_th, iou_th):
+    """conf_th + NMS по классам, как у детектора (по убыванию score)"""
+    kept = []
+    for o in sorted((o for o in objs if o.score >= conf_th), key=lambda o: -o.score):
+        if all(k.class_id != o.class_id or _iou(k, o) <= iou_th for k in kept):
+            kept.append(o)
+    return kept
+
+
+def _decider(script, params, width, height):
+    """
+    Функция кадра (objs, angle) -> has_obstacle с той же логикой и в том же порядке, что в основном
+    цикле скрипта: область motion gate по углу прошлого кадра, затем новый угол и проверка зоны.
+    """
+    d = _defs[script]
+    class_names = d.class_names
+    result = d.FrameResult()
+    if script == "AOG_MaixCam.py":
+        zone = d.ZoneConfig(width, height)
+        for name, value in params.items():
+            setattr(zone, name, value)
+        gate_angle = 0.0
+
+        def decide(objs, angle):
+            nonlocal gate_angle
+            zone.get_zone(gate_angle)  # motion gate
+            gate_angle = angle
+            x1, y1, x2, y2 = zone.get_zone(angle)
+            result.reset()
+            for obj in objs:
+                if obj.class_id in class_names:
+                    cx = obj.x + obj.w // 2
+                    cy = obj.y + obj.h // 2
+                    result.add(obj, x1 <= cx <= x2 and y1 <= cy <= y2)
+            return result.zone_count > 0
+        return decide
+
+    zones = d.make_zones(width, height)
+    for name, value in params.items():
+        zone_name, _, attr = name.rpartition(".")
+        for z in zones.zones:
+            if not zone_name or z.name == zone_name:
+                setattr(z, attr, value)
+
+    gate_angle = 0.0
+
+    def decide(objs, angle):
+        nonlocal gate_angle
+        zones.get_bbox(gate_angle)  # motion gate
+        gate_angle = angle
+        zones.evaluate(objs, result, class_names, angle)
+        return zones.stop_count > 0
+    return decide
+
+
+def applicable(script, name):
+    d = _defs[script]
+    if name in DEFAULTS:
+        return True
+    zone_name, _, attr = name.rpartition(".")
+    if script == "AOG_MaixCam.py":
+        return not zone_name and hasattr(d.ZoneConfig(320, 224), attr)
+    if zone_name and zone_name not in [p["name"] for p in d.ZONE_PRESETS]:
+        return False
+    return hasattr(d.ZoneConfig(320, 224), attr)
+
+
+def evaluate(job):
+    """Одна точка сетки для одного скрипта по всем сессиям -> метрики"""
+    script, params, width, height = job
+    conf_th = params.get("conf_th", DEFAULTS["conf_th"])
+    iou_th = params.get("iou_th", DEFAULTS["iou_th"])
+    zone_params = {k: v for k, v in params.items() if k not in DEFAULTS}
+
+    m = {"frames": 0, "labelled": 0, "events": 0, "missed": 0, "miss_frames": 0,
+         "false_alarms": 0, "false_frames": 0, "toggles": 0, "seconds": 0.0, "ns": 0}
+    for stream in _streams:
+        decide = _decider(script, zone_params, width, height)  # свое состояние зоны на каждый поток
+        prev = False
+        prev_label = None
+        event_hit = False
+        for i, (t, angle, objs, label) in enumerate(stream):
+            kept = filter_nms(objs, conf_th, iou_th)
+            t0 = time.perf_counter_ns()
+            obstacle = decide(kept, angle)
+            m["ns"] += time.perf_counter_ns() - t0
+            m["frames"] += 1
+
+            if obstacle != prev and i > 0:    # первый кадр потока не сравнивается с чужим
+                m["toggles"] += 1
+            if label:
+                if not prev_label:            # начало препятствия по разметке
+                    m["events"] += 1
+                    event_hit = False
+                event_hit = event_hit or obstacle
+                if not obstacle:
+                    m["miss_frames"] += 1
+            elif prev_label and not event_hit:
+                m["missed"] += 1              # препятствие кончилось, ни одного срабатывания
+            if label is not None:
+                m["labelled"] += 1
+                if not label and obstacle:
+                    m["false_frames"] += 1
+                    if not prev:              # срабатывание началось на чистом кадре
+                        m["false_alarms"] += 1
+            prev = obstacle
+            prev_label = label
+        if prev_label and not event_hit:
+            m["missed"] += 1
+        if len(stream) > 1:
+            m["seconds"] += stream[-1][0] - stream[0][0]
+    return script, params, m
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перебор параметров зоны по записанным сессиям")
+    parser.add_argument("sessions", nargs="+", help="JSONL от AOG_ShmMonitor.py --record с разметкой label")
+    parser.add_argument("--grid", action="append", default=[], help="имя=a,b,c или имя=от:до:шаг")
+    parser.add_argument("--script", choices=SCRIPTS, action="append", help="по умолчанию оба")
+    parser.add_argument("--width", type=int, default=320, help="размер кадра детектора")
+    parser.add_argument("--height", type=int, default=224)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--max-missed", type=int, default=0, help="цель: пропущенных препятствий не больше")
+    parser.add_argument("--max-us", type=float, default=None, help="цель: мкс на кадр не больше")
+    parser.add_argument("--top", type=int, default=10)
+    a = parser.parse_args()
+
+    grid = parse_grid(a.grid)
+    _init_worker(a.sessions)  # в главном процессе: проверка параметров и сводка по сессиям
+    frames = sum(len(s) for s in _streams)
+    labelled = sum(1 for s in _streams for f in s if f[3] is not None)
+    print(f"📂 Сессий/камер: {len(_streams)}, кадров: {frames}, размечено: {labelled}")
+    if not labelled:
+        print("⚠ Нет разметки (label): пропуски и ложные срабатывания не считаются, только мерцание и время")
+
+    jobs = []
+    for script in a.script or SCRIPTS:
+        names = [n for n in grid if applicable(script, n)]
+        skipped = [n for n in grid if n not in names]
+        if skipped:
+            print(f"   {script}: нет параметров {', '.join(skipped)} - не перебираются")
+        for values in itertools.product(*(grid[n] for n in names)):
+            jobs.append((script, dict(zip(names, values)), a.width, a.height))
+    print(f"▶ Точек сетки: {len(jobs)}, процессов: {a.workers}")
+
+    t0 = time.monotonic()
+    with ProcessPoolExecutor(max_workers=a.workers, initializer=_init_worker, initargs=(a.sessions,)) as pool:
+        results = list(pool.map(evaluate, jobs, chunksize=max(1, len(jobs) // (4 * a.workers))))
+    print(f"⏱ {time.monotonic() - t0:.1f} с")
+
+    by_script = defaultdict(list)
+    for script, params, m in results:
+        us = m["ns"] / 1000.0 / max(1, m["frames"])
+        minutes = m["seconds"] / 60.0
+        row = {
+            "params": params,
+            "missed": m["missed"],
+            "events": m["events"],
+            "miss_pct": 100.0 * m["miss_frames"] / max(1, m["labelled"]),
+            "false_alarms": m["false_alarms"],
+            "false_pct": 100.0 * m["false_frames"] / max(1, m["labelled"]),
+            "flicker": m["toggles"] / minutes if minutes > 0 else float(m["toggles"]),
+            "us": us,
+        }
+        row["ok"] = row["missed"] <= a.max_missed and (a.max_us is None or us <= a.max_us)
+        by_script[script].append(row)
+
+    for script, rows in by_script.items():
+        # сначала подходящие под цели, затем меньше ложных, меньше мерцания
+        rows.sort(key=lambda r: (not r["ok"], r["missed"], r["false_alarms"], r["flicker"], r["us"]))
+        ok = sum(1 for r in rows if r["ok"])
+        print(f"=== {script}: подходят {ok} из {len(rows)} ===")
+        print(f"  {'':2} {'пропущено':>10} {'кадров%':>8} {'ложных':>7} {'кадров%':>8} {'мерц/мин':>9} "
+              f"{'мкс/кадр':>9}  параметры")
+        for r in rows[:a.top]:
+            params = " ".join(f"{k}={v:g}" for k, v in r["params"].items()) or "(по умолчанию)"
+            mark = "✅" if r["ok"] else "❌"
+            print(f"  {mark} {r['missed']:>4}/{r['events']:<5} {r['miss_pct']:>8.1f} {r['false_alarms']:>7} "
+                  f"{r['false_pct']:>8.1f} {r['flicker']:>9.1f} {r['us']:>9.1f}  {params}")
+
+
+if __name__ == "__main__":
+    main()
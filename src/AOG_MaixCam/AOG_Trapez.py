@@ -4,9 +4,26 @@
 #   Handle B (left-top = C):    X -> BC (top width),    Y -> AB + vertical position of BC
 # AB and CD are symmetric automatically.
 
-from maix import camera, display, image, nn, app, sys, time, network
+from maix import camera, display, image, nn, app, gpio, pinmap, sys, time, network
 from maix.touchscreen import TouchScreen
 import socket
+import os
+import sys as pysys
+import time as pytime
+import datetime
+import json
+import queue
+import cProfile
+import hmac
+import hashlib
+import select
+import threading
+import gc
+import mmap
+import struct
+import tracemalloc
+from array import array
+from collections import deque
 
 device_id = sys.device_id()
 
@@ -23,13 +40,53 @@ except Exception as e:
 # =========================
 # Wi-Fi manager
 # =========================
+class ObstaclePacket:
+    """
+    UDP message of one camera channel in a preallocated buffer: rebuilt only when its data
+    changes, the SEQ digits are written in place, sent through slices made once.
+    """
+    def __init__(self, size=128):
+        self.buf = bytearray(size)
+        view = memoryview(self.buf)
+        self.views = [view[:n] for n in range(size + 1)]
+        self.msg_len = 0
+        self.seq_at = 0  # where the number after ":SEQ:" starts
+        self.obstacle = None
+        self.count = None
+        self.angle = None
+        self.level = None
+        self.occupied = None
+
+    def set_message(self, msg):
+        msg = msg[:len(self.buf) - 10]
+        self.msg_len = len(msg)
+        msg += b":SEQ:"
+        self.buf[:len(msg)] = msg
+        self.seq_at = len(msg)
+
+    def put_seq(self, v):
+        """Writes the sequence digits straight into the buffer, returns the packet length"""
+        n = self.seq_at + (5 if v >= 10000 else 4 if v >= 1000 else 3 if v >= 100 else 2 if v >= 10 else 1)
+        i = n
+        while True:
+            i -= 1
+            self.buf[i] = 48 + v % 10
+            v //= 10
+            if not v:
+                return n
+
 class WiFiManager:
     def __init__(self):
         self.wifi = network.wifi.Wifi()
         self.udp_socket = None
         self.esp32_ip = "192.168.4.1"
         self.esp32_port = 8888
+        self.esp32_addr = (self.esp32_ip, self.esp32_port)
         self.connected = False
+        # one packet per channel: cameras alternate, so a single cache would be rebuilt every frame
+        self._packets = {}
+        self.seq = 0  # номер сообщения: по нему приемник видит потери и перестановки
+        self.send_seq = False  # ":SEQ:n" at the end (AOG_Simulator.py); the ESP32 firmware does not expect it
 
     def connect(self, ssid, password, timeout=30):
         print(f"📡 Подключение к Wi-Fi: {ssid}")
@@ -48,12 +105,34 @@ class WiFiManager:
             print(f"❌ Ошибка настройки Wi-Fi: {e}")
             return False
 
-    def send_obstacle_data(self, has_obstacle, obstacle_count, steering_angle):
+    def send_obstacle_data(self, has_obstacle, obstacle_count, steering_angle, channel=None, zones=None):
         if (not self.connected) or (self.udp_socket is None):
             return False
         try:
-            msg = f"OBSTACLE:{1 if has_obstacle else 0}:COUNT:{obstacle_count}:ANGLE:{steering_angle:.1f}"
-            self.udp_socket.sendto(msg.encode("utf-8"), (self.esp32_ip, self.esp32_port))
+            p = self._packets.get(channel)
+            if p is None:
+                p = self._packets[channel] = ObstaclePacket()
+            graded = zones is not None and zones.n > 1
+            level = zones.level if graded else 0
+            occupied = zones.occupied if graded else 0
+            if (has_obstacle != p.obstacle or obstacle_count != p.count or steering_angle != p.angle
+                    or level != p.level or occupied != p.occupied):
+                msg = f"OBSTACLE:{1 if has_obstacle else 0}:COUNT:{obstacle_count}:ANGLE:{steering_angle:.1f}"
+                if channel is not None:
+                    msg += f":CH:{channel}"  # несколько камер: канал = индекс камеры
+                if graded:
+                    # несколько зон: максимальный уровень + занятость зон в порядке ZONE_PRESETS
+                    flags = ",".join("1" if zones.occupied >> i & 1 else "0" for i in range(zones.n))
+                    msg += f":LEVEL:{zones.level}:ZONES:{flags}"
+                p.set_message(msg.encode("utf-8"))
+                p.obstacle = has_obstacle
+                p.count = obstacle_count
+                p.angle = steering_angle
+                p.level = level
+                p.occupied = occupied
+            self.seq = (self.seq + 1) & 0xFFFF
+            n = p.put_seq(self.seq) if self.send_seq else p.msg_len
+            self.udp_socket.sendto(p.views[n], self.esp32_addr)
             return True
         except Exception as e:
             print(f"❌ Ошибка отправки UDP: {e}")
@@ -63,28 +142,818 @@ class WiFiManager:
 # Angle receiver
 # =========================
 class AngleReceiver:
-    def __init__(self, listen_port=8889):
-        self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.udp_socket.settimeout(0.02)
-        self.udp_socket.bind(("0.0.0.0", listen_port))
+    # PGN AgOpenGPS/AgIO: 0x80 0x81 src pgn len данные... crc
+    PGN_HEAD = struct.Struct("<BBBBB")
+    STEER_DATA = struct.Struct("<HBhBBB")     # PGN 254 от AgIO: скорость*10, статус, заданный угол*100, xte, sc1-8, sc9-16
+    FROM_AUTOSTEER = struct.Struct("<hhhBB")  # PGN 253 от модуля руля: фактический угол*100, курс, крен, switch, pwm
+
+    def __init__(self, listen_port=8889, mode="text", pgn_ports=(8888, 9999), angle_source="actual", angle_sign=1):
+        self.mode = mode                  # "text" - ANGLE:x от ESP32, "pgn" - рассылка AgIO напрямую
+        self.timeout = 0.02
         self.current_angle = 0.0
+        self.max_drain = 32  # queued packets read per frame at most
+
+        # PGN: заданный и фактический угол, скорость
+        self.angle_source = angle_source  # "actual" или "set"
+        self.angle_sign = angle_sign
+        self.set_angle = 0.0
+        self.actual_angle = 0.0
+        self.speed_kmh = 0.0
+        self.steer_status = 0
+        self.last_set_ms = 0
+        self.last_actual_ms = 0
+        self.crc_errors = 0
+        self._buf = bytearray(64)
+
+        if mode == "pgn":
+            self.sockets = []
+            for port in pgn_ports:
+                s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                s.bind(("0.0.0.0", port))
+                s.setblocking(False)
+                self.sockets.append(s)
+            self.udp_socket = self.sockets[0]
+        else:
+            self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.udp_socket.settimeout(self.timeout)
+            self.udp_socket.bind(("0.0.0.0", listen_port))
+
+    def _parse(self, data):
+        try:
+            msg = data.decode("utf-8").strip()
+        except UnicodeDecodeError:
+            return False
+        if msg.startswith("ANGLE:"):
+            s = msg.replace("ANGLE:", "").strip()
+            try:
+                self.current_angle = float(s)
+                return True
+            except ValueError:
+                return False
+        return False
 
     def receive_angle(self):
+        if self.mode == "pgn":
+            return self._receive_pgn()
+        # wait for the first packet (timeout), then drain the queue without waiting:
+        # when angles arrive faster than frames the newest one wins, not the oldest
+        received = False
         try:
             data, _ = self.udp_socket.recvfrom(64)
-            msg = data.decode("utf-8").strip()
-            if msg.startswith("ANGLE:"):
-                s = msg.replace("ANGLE:", "").strip()
+            received = self._parse(data)
+            self.udp_socket.settimeout(0.0)
+            for _ in range(self.max_drain):
+                data, _ = self.udp_socket.recvfrom(64)
+                received = self._parse(data) or received
+        except (socket.timeout, BlockingIOError):
+            pass
+        except Exception as e:
+            print(f"❌ Ошибка приема угла: {e}")
+        finally:
+            self.udp_socket.settimeout(self.timeout)
+        return received
+
+    def _receive_pgn(self):
+        # ждем пакет на любом из портов PGN, затем забираем очереди всех готовых сокетов
+        received = False
+        try:
+            ready, _, _ = select.select(self.sockets, [], [], self.timeout)
+            for s in ready:
                 try:
-                    self.current_angle = float(s)
-                    return True
-                except ValueError:
-                    return False
-        except socket.timeout:
+                    for _ in range(self.max_drain):
+                        received = self._parse_pgn(s.recv_into(self._buf)) or received
+                except BlockingIOError:
+                    pass
+        except Exception as e:
+            print(f"❌ Ошибка приема PGN: {e}")
+        return received
+
+    def _parse_pgn(self, n):
+        buf = self._buf
+        if n < 6:
+            return False
+        h1, h2, _, pgn, length = self.PGN_HEAD.unpack_from(buf, 0)
+        if h1 != 0x80 or h2 != 0x81 or n < length + 6:
+            return False
+        # CRC AgOpenGPS: младший байт суммы от src до последнего байта данных
+        # прямой цикл по буферу: без среза/memoryview на каждый пакет, сумма не выходит за байт
+        crc = 0
+        for i in range(2, 5 + length):
+            crc = (crc + buf[i]) & 0xFF
+        if crc != buf[5 + length]:
+            self.crc_errors += 1
+            return False
+        now = time.ticks_ms()
+        if pgn == 254 and length >= 8:
+            speed, status, angle, _, _, _ = self.STEER_DATA.unpack_from(buf, 5)
+            self.speed_kmh = speed / 10.0
+            self.steer_status = status
+            self.set_angle = self.angle_sign * angle / 100.0
+            self.last_set_ms = now
+        elif pgn == 253 and length >= 8:
+            actual, _, _, _, _ = self.FROM_AUTOSTEER.unpack_from(buf, 5)
+            self.actual_angle = self.angle_sign * actual / 100.0
+            self.last_actual_ms = now
+        else:
             return False
+        # для зоны - фактический угол, пока модуль руля его шлет, иначе заданный
+        if self.angle_source == "actual" and self.last_actual_ms and now - self.last_actual_ms < 1000:
+            self.current_angle = self.actual_angle
+        elif self.last_set_ms:
+            self.current_angle = self.set_angle
+        else:
+            return False
+        return True
+
+# =========================
+# Per-frame result reused across frames (no allocations in the loop)
+# =========================
+class FrameResult:
+    """Детекции кадра в заранее выделенных массивах: один объект на весь цикл, без новых списков"""
+    __slots__ = ("capacity", "count", "zone_count", "dropped", "x", "y", "w", "h",
+                 "class_id", "score", "in_zone", "class_counts")
+
+    def __init__(self, capacity=64, num_classes=80):
+        self.capacity = capacity
+        self.count = 0
+        self.zone_count = 0
+        self.dropped = 0  # объекты сверх capacity: не сохранены, но посчитаны в zone_count / class_counts
+        self.x = array("i", [0]) * capacity
+        self.y = array("i", [0]) * capacity
+        self.w = array("i", [0]) * capacity
+        self.h = array("i", [0]) * capacity
+        self.class_id = array("H", [0]) * capacity
+        self.score = array("f", [0.0]) * capacity
+        self.in_zone = bytearray(capacity)
+        self.class_counts = array("H", [0]) * num_classes  # объектов каждого класса в зоне
+
+    def reset(self):
+        # обнуляем только то, что было занято в прошлом кадре
+        for i in range(self.count):
+            if self.in_zone[i]:
+                self.class_counts[self.class_id[i]] = 0
+                self.in_zone[i] = 0
+        if self.dropped:
+            # классы объектов сверх capacity не сохранены - обнуляем все
+            for c in range(len(self.class_counts)):
+                self.class_counts[c] = 0
+            self.dropped = 0
+        self.count = 0
+        self.zone_count = 0
+
+    def add(self, o, in_zone):
+        i = self.count
+        cid = o.class_id
+        if i >= self.capacity:
+            # массивы заполнены: объект не сохраняется, но попадание в зону не теряется
+            self.dropped += 1
+            if in_zone:
+                self.zone_count += 1
+                self.class_counts[cid] += 1
+            return -1
+        self.x[i] = o.x
+        self.y[i] = o.y
+        self.w[i] = o.w
+        self.h[i] = o.h
+        self.class_id[i] = cid
+        self.score[i] = o.score
+        if in_zone:
+            self.in_zone[i] = 1
+            self.zone_count += 1
+            self.class_counts[cid] += 1
+        self.count = i + 1
+        return i
+
+# =========================
+# Allocation check for the main loop (tracemalloc)
+# =========================
+class AllocProbe:
+    """Проверка через tracemalloc: сколько Python-памяти основной цикл выделяет на кадр"""
+    def __init__(self, warmup=100, frames=300, limit_bytes=64, peak_limit_bytes=2048):
+        self.warmup = warmup            # кадров до начала измерения (кэши, буферы)
+        self.frames = frames            # длина измерения
+        self.limit_bytes = limit_bytes  # допустимый прирост памяти на кадр
+        self.peak_limit_bytes = peak_limit_bytes  # допустимый пик временных объектов за кадр (вместе с результатами детектора)
+        self.n = 0
+        self.base = 0
+        self.prev = 0
+        self.peak_max = 0
+        self.snapshot = None
+
+    def on_frame(self):
+        self.n += 1
+        if self.n == self.warmup:
+            tracemalloc.start()
+            self.snapshot = tracemalloc.take_snapshot()
+            self.base = self.prev = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        elif self.warmup < self.n <= self.warmup + self.frames:
+            cur, peak = tracemalloc.get_traced_memory()
+            self.peak_max = max(self.peak_max, peak - self.prev)  # временные объекты за кадр
+            self.prev = cur
+            tracemalloc.reset_peak()
+            if self.n == self.warmup + self.frames:
+                self._report(cur)
+
+    def _report(self, cur):
+        per_frame = (cur - self.base) / self.frames
+        own = (tracemalloc.Filter(False, tracemalloc.__file__),)
+        top = tracemalloc.take_snapshot().filter_traces(own).compare_to(self.snapshot.filter_traces(own), "lineno")[:3]
+        tracemalloc.stop()
+        if per_frame > self.limit_bytes:
+            verdict = "❌ РОСТ ПАМЯТИ"
+        elif self.peak_max > self.peak_limit_bytes:
+            verdict = "❌ ВРЕМЕННЫЕ ОБЪЕКТЫ"
+        else:
+            verdict = "✅ OK"
+        print(f"🧪 Аллокации: {per_frame:.1f} Б/кадр прирост, пик временных {self.peak_max} Б/кадр "
+              f"за {self.frames} кадров | {verdict}")
+        for stat in top:
+            print(f"   {stat}")
+
+# =========================
+# Shared-memory export of per-frame detections (/dev/shm ring)
+# =========================
+class DetectionExport:
+    """
+    Кольцо кадров в общей памяти (mmap файла в /dev/shm) для других процессов на камере.
+    Раскладка фиксированная, читатель без блокировок - AOG_ShmReader.py:
+      заголовок 64 Б: magic, версия, слотов, размер слота, макс. детекций, макс. зон, последний seq,
+                      поколение (новое при каждом запуске писателя: seq снова с 1)
+      слот: seq_begin, время, угол, канал, решение, зоны (4 точки), детекции, seq_end
+    Слот валиден, если seq_end == seq_begin == ожидаемому seq (писатель пишет begin -> данные -> end).
+    """
+    MAGIC = b"AOGS"
+    VERSION = 2
+    HEADER = struct.Struct("<4sHHIHHQ")         # magic, version, slots, slot_size, max_dets, max_zones, write_seq
+    HEADER_SIZE = 64
+    WRITE_SEQ_OFFSET = 16
+    GENERATION_OFFSET = 24
+    SEQ = struct.Struct("<Q")
+    SLOT_HEAD = struct.Struct("<QdfBBBBHH")     # seq_begin, t (monotonic), angle, channel, obstacle, level, zones, count, dets
+    ZONE = struct.Struct("<BxH8h")              # level, count, A..D (x,y)
+    DET = struct.Struct("<hhhhHBxf")            # x, y, w, h, class_id, zone (level; 1 in AOG_MaixCam), score
+
+    def __init__(self, path, slots=16, max_dets=64, max_zones=4):
+        self.path = path
+        self.slots = slots
+        self.max_dets = max_dets
+        self.max_zones = max_zones
+        self.slot_size = (self.SLOT_HEAD.size + max_zones * self.ZONE.size +
+                          max_dets * self.DET.size + self.SEQ.size)
+        self.zones_offset = self.SLOT_HEAD.size
+        self.dets_offset = self.zones_offset + max_zones * self.ZONE.size
+        self.end_offset = self.dets_offset + max_dets * self.DET.size
+        self.seq = 0
+        self.base = 0
+        self.zone_n = 0
+        self.mm = None
+
+    def open(self):
+        size = self.HEADER_SIZE + self.slots * self.slot_size
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                # файл только растет: читатель может еще держать отображение прошлого запуска
+                # (кольцо было больше), а обращение за концом укороченного файла - это SIGBUS
+                if os.fstat(fd).st_size < size:
+                    os.ftruncate(fd, size)
+                self.mm = mmap.mmap(fd, size)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            print(f"❌ Общая память {self.path}: {e}")
+            return False
+        # magic пишется последним: читатель не увидит наполовину записанный заголовок
+        self.mm[:self.HEADER_SIZE] = bytes(self.HEADER_SIZE)
+        self.HEADER.pack_into(self.mm, 0, b"\0\0\0\0", self.VERSION, self.slots, self.slot_size,
+                              self.max_dets, self.max_zones, 0)
+        self.SEQ.pack_into(self.mm, self.GENERATION_OFFSET, pytime.time_ns())
+        self.mm[0:4] = self.MAGIC
+        print(f"🧠 Экспорт детекций: {self.path} ({self.slots} x {self.slot_size} Б)")
+        return True
+
+    def begin(self):
+        self.seq += 1
+        self.base = self.HEADER_SIZE + (self.seq % self.slots) * self.slot_size
+        self.SEQ.pack_into(self.mm, self.base, self.seq)
+        self.zone_n = 0
+
+    def zone(self, level, count, quad):
+        if self.zone_n >= self.max_zones:
+            return
+        (ax, ay), (bx, by), (cx, cy), (dx, dy) = quad
+        self.ZONE.pack_into(self.mm, self.base + self.zones_offset + self.zone_n * self.ZONE.size,
+                            level, count, ax, ay, bx, by, cx, cy, dx, dy)
+        self.zone_n += 1
+
+    def end(self, result, steering_angle, has_obstacle, count, level=0, channel=0, det_levels=None):
+        mm = self.mm
+        base = self.base
+        n = min(result.count, self.max_dets)
+        off = base + self.dets_offset
+        pack = self.DET.pack_into
+        size = self.DET.size
+        zone = det_levels if det_levels is not None else result.in_zone
+        for i in range(n):
+            pack(mm, off, result.x[i], result.y[i], result.w[i], result.h[i],
+                 result.class_id[i], zone[i], result.score[i])
+            off += size
+        self.SLOT_HEAD.pack_into(mm, base, self.seq, pytime.monotonic(), steering_angle, channel,
+                                 1 if has_obstacle else 0, level, self.zone_n, count, n)
+        self.SEQ.pack_into(mm, base + self.end_offset, self.seq)
+        self.SEQ.pack_into(mm, self.WRITE_SEQ_OFFSET, self.seq)
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+
+# =========================
+# Preview stream for the cab tablet (MJPEG over HTTP)
+# =========================
+class PreviewStreamer:
+    """MJPEG-поток аннотированных кадров по HTTP: http://<IP камеры>:<port>/"""
+    BOUNDARY = "aogframe"
+
+    def __init__(self, port=8080, fps=5, quality=60, max_clients=3):
+        self.port = port
+        self.fps = fps
+        self.quality = quality
+        self.max_clients = max_clients
+        self.clients = 0
+        self.sent_frames = 0
+        self._slot = None        # последний аннотированный кадр (один слот)
+        self._jpeg = None        # последний закодированный JPEG
+        self._jpeg_seq = 0
+        self._last_offer = 0
+        self._cond = threading.Condition()
+        self._server = None
+        self._running = False
+
+    def start(self):
+        try:
+            self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._server.bind(("0.0.0.0", self.port))
+            self._server.listen(self.max_clients)
         except Exception as e:
-            print(f"❌ Ошибка приема угла: {e}")
+            print(f"❌ Ошибка запуска видеопотока: {e}")
+            return False
+        self._running = True
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        threading.Thread(target=self._encode_loop, daemon=True).start()
+        print(f"🎥 Видеопоток: порт {self.port}, {self.fps} к/с, качество {self.quality}")
+        return True
+
+    def offer(self, img):
+        """Из основного цикла: кладет копию кадра в слот (не чаще fps), кодирование в потоке"""
+        if not self._running or self.clients == 0:
             return False
+        now = time.ticks_ms()
+        if now - self._last_offer < 1000 // self.fps:
+            return False
+        self._last_offer = now
+        # копия: буфер кадра может переиспользоваться камерой / дорисовываться, пока поток кодирует
+        frame = img.copy()
+        with self._cond:
+            self._slot = frame  # неотправленный старый кадр просто вытесняется
+            self._cond.notify_all()
+        return True
+
+    def _encode_loop(self):
+        while self._running:
+            with self._cond:
+                while self._slot is None and self._running:
+                    self._cond.wait(1.0)
+                img = self._slot
+                self._slot = None
+            if img is None:
+                continue
+            try:
+                data = img.to_jpeg(quality=self.quality).to_bytes()
+            except Exception as e:
+                print(f"❌ Ошибка кодирования JPEG: {e}")
+                continue
+            with self._cond:
+                self._jpeg = data
+                self._jpeg_seq += 1
+                self._cond.notify_all()
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                conn, addr = self._server.accept()
+            except OSError as e:
+                if not self._running or self._server.fileno() < 0:
+                    break  # сокет закрыт - поток приема завершается, а не крутится впустую
+                print(f"❌ Ошибка приема клиента видеопотока: {e}")
+                pytime.sleep(1.0)  # пауза, чтобы повторяющаяся ошибка не отнимала CPU у детекции
+                continue
+            with self._cond:
+                if self.clients >= self.max_clients:
+                    conn.close()
+                    continue
+                self.clients += 1
+            print(f"🎥 Клиент видеопотока подключен: {addr[0]}")
+            threading.Thread(target=self._client_loop, args=(conn, addr), daemon=True).start()
+
+    def _client_loop(self, conn, addr):
+        try:
+            conn.settimeout(2.0)  # клиент, который не успевает забирать кадры, отключается
+            conn.recv(1024)       # HTTP-запрос не разбираем: отдаем поток на любой путь
+            conn.sendall(("HTTP/1.0 200 OK\r\n"
+                          "Cache-Control: no-cache\r\n"
+                          f"Content-Type: multipart/x-mixed-replace; boundary={self.BOUNDARY}\r\n\r\n").encode("ascii"))
+            last_seq = self._jpeg_seq
+            while self._running:
+                with self._cond:
+                    while self._jpeg_seq == last_seq and self._running:
+                        self._cond.wait(1.0)
+                    # медленный клиент получает только самый свежий кадр, промежуточные пропускаются
+                    data = self._jpeg
+                    last_seq = self._jpeg_seq
+                if data is None:
+                    continue
+                head = f"--{self.BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(data)}\r\n\r\n"
+                conn.sendall(head.encode("ascii"))
+                conn.sendall(data)
+                conn.sendall(b"\r\n")
+                self.sent_frames += 1
+        except Exception:
+            pass
+        finally:
+            conn.close()
+            with self._cond:
+                self.clients -= 1
+            print(f"🎥 Клиент видеопотока отключен: {addr[0]}")
+
+# =========================
+# Obstacle snapshots to disk (background JPEG + JSON sidecar)
+# =========================
+class SnapshotRecorder:
+    """
+    Снимки препятствий для разбора: JPEG аннотированного кадра + JSON рядом (детекции, угол, зона).
+    Снимок при появлении препятствия и не чаще interval_ms, пока оно держится.
+    Основной цикл только кладет кадр в ограниченную очередь (полная - кадр пропускается),
+    кодирование, запись и квота диска - в фоновом потоке.
+    """
+    def __init__(self, directory, interval_ms=2000, quality=85, queue_size=4, quota_mb=200):
+        self.directory = directory
+        self.interval_ms = interval_ms
+        self.quality = quality
+        self.quota_bytes = quota_mb * 1024 * 1024
+        self.saved = 0
+        self.dropped = 0     # очередь была полна
+        self.deleted = 0     # удалено по квоте
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._active = {}    # канал -> препятствие было на прошлом кадре
+        self._last = {}      # канал -> время последнего снимка
+        self._seq = 0
+        self._files = deque()  # (имя без расширения, байт) от старых к новым
+        self._total = 0
+        self._running = False
+
+    def start(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            self._scan()
+        except OSError as e:
+            print(f"❌ Папка снимков {self.directory}: {e}")
+            return False
+        self._running = True
+        threading.Thread(target=self._worker, daemon=True).start()
+        print(f"📸 Снимки препятствий: {self.directory}, квота {self.quota_bytes // (1024 * 1024)} МБ, "
+              f"занято {self._total // 1024} КБ")
+        return True
+
+    def _scan(self):
+        # имена начинаются с даты и времени - сортировка по имени = от старых к новым
+        sizes = {}
+        for name in os.listdir(self.directory):
+            base, ext = os.path.splitext(name)
+            if ext in (".jpg", ".json"):
+                sizes[base] = sizes.get(base, 0) + os.path.getsize(os.path.join(self.directory, name))
+        for base in sorted(sizes):
+            self._files.append((base, sizes[base]))
+            self._total += sizes[base]
+
+    def due(self, has_obstacle, channel=0):
+        """Из основного цикла: нужен ли снимок этого кадра (начало препятствия или прошел interval_ms)"""
+        if not self._running:
+            return False
+        if not has_obstacle:
+            self._active[channel] = False
+            return False
+        now = time.ticks_ms()
+        if self._active.get(channel) and now - self._last.get(channel, 0) < self.interval_ms:
+            return False
+        self._last[channel] = now
+        return True
+
+    def submit(self, img, meta, channel=0):
+        """Кладет кадр и метаданные в очередь без ожидания; onset = первый снимок этого препятствия"""
+        meta["onset"] = not self._active.get(channel)
+        self._active[channel] = True
+        self._seq += 1
+        if self._queue.full():
+            self.dropped += 1  # очередь полна - не тратим время на копию
+            return False
+        try:
+            # копия: камера переиспользует буфер кадра, а поток пишет JPEG позже
+            self._queue.put_nowait((pytime.time(), self._seq, img.copy(), meta))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    @staticmethod
+    def detections(result, class_names, det_levels=None):
+        """Копия детекций из FrameResult (он переиспользуется на следующем кадре), zone - уровень зоны"""
+        zone = det_levels if det_levels is not None else result.in_zone
+        return [{"class": class_names.get(result.class_id[i], str(result.class_id[i])),
+                 "score": round(result.score[i], 3),
+                 "box": [result.x[i], result.y[i], result.w[i], result.h[i]],
+                 "zone": zone[i]} for i in range(result.count)]
+
+    def _worker(self):
+        while self._running:
+            try:
+                t, seq, img, meta = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            stamp = datetime.datetime.fromtimestamp(t)
+            base = f"{stamp.strftime('%Y%m%d_%H%M%S')}_{stamp.microsecond // 1000:03d}_{seq:05d}"
+            meta["time"] = stamp.isoformat(timespec="milliseconds")
+            meta["dropped"] = self.dropped
+            try:
+                data = img.to_jpeg(quality=self.quality).to_bytes()
+                size = 0
+                for ext, payload in ((".jpg", data), (".json", json.dumps(meta, ensure_ascii=False).encode("utf-8"))):
+                    with open(os.path.join(self.directory, base + ext), "wb") as f:
+                        f.write(payload)
+                    size += len(payload)
+            except Exception as e:
+                print(f"❌ Ошибка записи снимка: {e}")
+                continue
+            self._files.append((base, size))
+            self._total += size
+            self.saved += 1
+            self._enforce_quota()
+            print(f"📸 Снимок {base}.jpg ({size // 1024} КБ, пропущено {self.dropped})")
+
+    def _enforce_quota(self):
+        # самые старые снимки удаляются первыми, последний записанный остается всегда
+        while self._total > self.quota_bytes and len(self._files) > 1:
+            base, size = self._files.popleft()
+            for ext in (".jpg", ".json"):
+                try:
+                    os.remove(os.path.join(self.directory, base + ext))
+                except OSError:
+                    pass
+            self._total -= size
+            self.deleted += 1
+
+# =========================
+# On-demand loop profiler
+# =========================
+class LoopProfiler:
+    """
+    Профилирование основного цикла на PROFILE_FRAMES кадров, потом выключается само.
+    "sample":   фоновый поток снимает стек основного потока каждые interval_ms,
+                результат - collapsed stacks (.folded) для flamegraph.pl / speedscope
+    "cprofile": cProfile на время N кадров, .pstats записывается в фоновом потоке
+    """
+    def __init__(self, out_dir="/root/profiles", frames=300, interval_ms=5, mode="sample"):
+        self.out_dir = out_dir
+        self.frames = frames
+        self.interval_ms = interval_ms
+        self.mode = mode
+        self.active = False
+        self.frames_left = 0
+        self._prof = None
+        self._stop = None  # Event своего запуска: поток прошлого запуска не подхватит новый
+        self.path = None
+        self.error = None  # причина последнего отказа start()
+        self._thread_id = threading.main_thread().ident
+
+    def start(self, mode=None):
+        if self.active:
+            return False
+        mode = mode or self.mode
+        if mode not in ("sample", "cprofile"):
+            self.error = "mode"
+            return False
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        try:
+            os.makedirs(self.out_dir, exist_ok=True)
+            if mode == "sample":
+                path = os.path.join(self.out_dir, f"loop-{stamp}.folded")
+                stop = threading.Event()
+                threading.Thread(target=self._sample_loop, args=(path, stop), daemon=True).start()
+                self._stop = stop
+            else:
+                path = os.path.join(self.out_dir, f"loop-{stamp}.pstats")
+                prof = cProfile.Profile()
+                prof.enable()  # ValueError, если уже работает другой профилировщик
+                self._prof = prof
+        except (OSError, RuntimeError, ValueError) as e:
+            print(f"❌ Профилирование не запущено: {e}")
+            self.error = type(e).__name__
+            return False
+        self.frames_left = self.frames
+        self.active = True
+        self.error = None
+        self.path = path
+        print(f"🔬 Профилирование ({mode}) на {self.frames} кадров -> {path}")
+        return True
+
+    def on_frame(self):
+        if not self.active:
+            return
+        self.frames_left -= 1
+        if self.frames_left > 0:
+            return
+        self.active = False
+        if self._stop is not None:
+            self._stop.set()  # поток сэмплирования сам запишет файл своего запуска
+            self._stop = None
+        if self._prof is not None:
+            prof, self._prof = self._prof, None
+            prof.disable()
+            threading.Thread(target=self._dump_pstats, args=(prof, self.path), daemon=True).start()
+
+    def _sample_loop(self, path, stop):
+        stacks = {}
+        samples = 0
+        interval = self.interval_ms / 1000.0
+        while not stop.is_set():
+            frame = pysys._current_frames().get(self._thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            if names:
+                key = ";".join(reversed(names))
+                stacks[key] = stacks.get(key, 0) + 1
+                samples += 1
+            stop.wait(interval)
+        try:
+            with open(path, "w") as f:
+                for key, count in stacks.items():
+                    f.write(f"{key} {count}\n")
+            print(f"🔬 Профиль записан: {path} ({samples} сэмплов)")
+        except Exception as e:
+            print(f"❌ Ошибка записи профиля: {e}")
+
+    def _dump_pstats(self, prof, path):
+        try:
+            prof.dump_stats(path)
+            print(f"🔬 Профиль записан: {path}")
+        except Exception as e:
+            print(f"❌ Ошибка записи профиля: {e}")
+
+# =========================
+# Runtime tuning control (UDP, authenticated)
+# =========================
+class TuningControl:
+    """
+    Runtime tuning over UDP. Packet: "<nonce>:<command>:<sig>", where sig is the first
+    16 hex chars of HMAC-SHA256(secret, "<nonce>:<command>") and nonce is an increasing
+    integer (e.g. client time in ms) - replayed or stale packets are rejected. The last
+    accepted nonce is kept in nonce_path, so packets captured before a reboot stay stale.
+    Commands: "GET" | "GET name" | "SET name=value[,name=value...]" plus the ones added
+    with register_command (e.g. "PROFILE [sample|cprofile]").
+    Reply to the sender: "OK name=value ..." with the active values, or "ERR reason".
+    """
+    def __init__(self, secret, port=8890, nonce_path="/root/tuning_nonce"):
+        self.secret = secret.encode("utf-8")
+        self.port = port
+        self.nonce_path = nonce_path
+        self.tunables = {}  # name -> ([(obj, attr), ...], type, lo, hi)
+        self.commands = {}  # COMMAND -> callback(arg) -> reply
+        self.last_nonce = self._load_nonce()
+        self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp_socket.setblocking(False)
+        self.udp_socket.bind(("0.0.0.0", port))
+
+    def register(self, name, targets, kind, lo, hi):
+        self.tunables[name] = (targets, kind, lo, hi)
+
+    def register_command(self, name, callback):
+        self.commands[name.upper()] = callback
+
+    def poll(self, max_packets=4):
+        # called between frames: changes apply from the next frame on
+        for _ in range(max_packets):
+            try:
+                data, addr = self.udp_socket.recvfrom(512)
+            except (BlockingIOError, socket.timeout):
+                return
+            except Exception as e:
+                print(f"❌ Ошибка приема команды: {e}")
+                return
+            reply = self._handle(data)
+            try:
+                self.udp_socket.sendto(reply.encode("utf-8"), addr)
+            except Exception as e:
+                print(f"❌ Ошибка ответа на команду: {e}")
+
+    def _handle(self, data):
+        try:
+            nonce_s, cmd, sig = data.decode("utf-8").strip().split(":", 2)
+            nonce = int(nonce_s)
+        except ValueError:
+            return "ERR format"
+        # hex signature of the expected length, compared as bytes
+        if len(sig) != 16 or any(ch not in "0123456789abcdef" for ch in sig):
+            return "ERR auth"
+        expected = hmac.new(self.secret, f"{nonce_s}:{cmd}".encode("utf-8"), hashlib.sha256).hexdigest()[:16]
+        if not hmac.compare_digest(sig.encode("ascii"), expected.encode("ascii")):
+            return "ERR auth"
+        if nonce <= self.last_nonce:
+            return "ERR nonce"
+        self.last_nonce = nonce
+        self._save_nonce()
+
+        # a failing command (e.g. PROFILE hitting OSError) must not reach the main loop
+        try:
+            return self._dispatch(cmd)
+        except Exception as e:
+            print(f"❌ Ошибка команды {cmd!r}: {e}")
+            return f"ERR failed {type(e).__name__}"
+
+    def _dispatch(self, cmd):
+        parts = cmd.strip().split(None, 1)
+        op = parts[0].upper() if parts else ""
+        if op in self.commands:
+            return self.commands[op](parts[1] if len(parts) > 1 else "")
+        if op == "GET":
+            if len(parts) == 1:
+                return "OK " + " ".join(self._format(n) for n in self.tunables)
+            if parts[1] not in self.tunables:
+                return f"ERR unknown {parts[1]}"
+            return "OK " + self._format(parts[1])
+        if op == "SET" and len(parts) == 2:
+            changes = []
+            for item in parts[1].split(","):
+                name, _, value = item.partition("=")
+                name = name.strip()
+                if name not in self.tunables:
+                    return f"ERR unknown {name}"
+                targets, kind, lo, hi = self.tunables[name]
+                try:
+                    v = kind(value)
+                except ValueError:
+                    return f"ERR value {name}"
+                if not (lo <= v <= hi):
+                    return f"ERR range {name} [{lo}..{hi}]"
+                changes.append((name, targets, v))
+            # all-or-nothing: nothing is applied if any item is invalid
+            for name, targets, v in changes:
+                for obj, attr in targets:
+                    setattr(obj, attr, v)
+            applied = " ".join(self._format(name) for name, _, _ in changes)
+            print(f"🔧 Параметры изменены: {applied}")
+            return "OK " + applied
+        return "ERR command"
+
+    def _load_nonce(self):
+        try:
+            with open(self.nonce_path) as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _save_nonce(self):
+        # temp file + fsync of the file and its directory: after a power cut the nonce is
+        # either the old or the new value, and an accepted nonce never rolls back
+        tmp = self.nonce_path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                f.write(str(self.last_nonce))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.nonce_path)
+            dir_fd = os.open(os.path.dirname(os.path.abspath(self.nonce_path)), os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)  # the rename itself
+            finally:
+                os.close(dir_fd)
+        except OSError as e:
+            print(f"⚠ nonce не сохранен ({self.nonce_path}): {e}")
+
+    def _format(self, name):
+        obj, attr = self.tunables[name][0][0]
+        return f"{name}={getattr(obj, attr)}"
+
+class RuntimeParams:
+    def __init__(self, conf_th=0.5, iou_th=0.45, travel_direction=1):
+        self.conf_th = conf_th
+        self.iou_th = iou_th
+        self.travel_direction = travel_direction  # 1 = вперед, -1 = задний ход, 0 = без приоритета (вход заднего хода главнее)
 
 # =========================
 # Touch calibration (simple scaling)
@@ -103,24 +972,94 @@ class TouchCalibrator:
         return display_x, display_y
 
 # =========================
-# Geometry: point in convex quad
+# Motion gate: skip inference while the zone region is static
 # =========================
-def point_in_quad(px, py, quad):
-    def cross(ax, ay, bx, by, cx, cy):
-        return (bx-ax)*(cy-ay) - (by-ay)*(cx-ax)
-
-    x1,y1 = quad[0]
-    x2,y2 = quad[1]
-    x3,y3 = quad[2]
-    x4,y4 = quad[3]
-
-    c1 = cross(x1,y1, x2,y2, px,py)
-    c2 = cross(x2,y2, x3,y3, px,py)
-    c3 = cross(x3,y3, x4,y4, px,py)
-    c4 = cross(x4,y4, x1,y1, px,py)
+class MotionGate:
+    def __init__(self, grid_w=16, grid_h=12, threshold=4.0, max_skip=5, window=100):
+        self.grid_w = grid_w          # размер уменьшенной копии зоны (блоки)
+        self.grid_h = grid_h
+        self.threshold = threshold    # разница яркости одного блока (0..255), выше - зона изменилась
+        self.max_skip = max_skip      # максимум кадров подряд без инференса
+        self.window = window          # окно для подсчета доли пропусков
+        self.ref = None               # сигнатура последнего кадра с инференсом
+        self._candidate = None        # сигнатура кадра, ожидающего инференса
+        self.skipped_in_row = 0
+        self.last_diff = 0.0
+        self.frames = 0
+        self.skipped = 0
+        self.skip_ratio = 0.0
+
+    def _signature(self, img, x, y, w, h):
+        # каждый пиксель уменьшенной копии = среднее по блоку зоны
+        # зона может уйти за край кадра при большом угле: берется только видимая часть
+        W, H = img.width(), img.height()
+        x2 = min(x + w, W)
+        y2 = min(y + h, H)
+        if x >= W or y >= H or x2 <= 0 or y2 <= 0:
+            return None  # зона целиком за кадром - сравнивать нечего
+        x = max(0, x)
+        y = max(0, y)
+        # FIT_FILL: вся зона растягивается на сетку, без черных полей по краям
+        small = img.crop(x, y, x2 - x, y2 - y).resize(self.grid_w, self.grid_h, object_fit=image.Fit.FIT_FILL,
+                                            method=image.ResizeMethod.AREA)
+        return small.to_format(image.Format.FMT_GRAYSCALE).to_bytes()
+
+    def should_skip(self, img, x, y, w, h):
+        sig = self._signature(img, x, y, w, h)
+        skip = False
+        if sig is not None and self.ref is not None and len(sig) == len(self.ref) and self.skipped_in_row < self.max_skip:
+            # максимум по блокам, а не среднее: человек в одном блоке из 192 не должен растворяться
+            worst = 0
+            for a, b in zip(sig, self.ref):
+                d = a - b if a > b else b - a
+                if d > worst:
+                    worst = d
+            self.last_diff = worst
+            skip = worst < self.threshold
+
+        if skip:
+            self.skipped_in_row += 1
+            self.skipped += 1
+        else:
+            self._candidate = sig
+
+        self.frames += 1
+        if self.frames >= self.window:
+            self.skip_ratio = self.skipped / self.frames
+            self.frames = 0
+            self.skipped = 0
+        return skip
+
+    def mark_inferred(self):
+        # опорный кадр обновляется только когда реально был инференс
+        # (планировщик может отложить инференс камеры на следующий такт)
+        if self._candidate is not None:
+            self.ref = self._candidate
+            self._candidate = None
+        self.skipped_in_row = 0
 
-    return (c1 >= 0 and c2 >= 0 and c3 >= 0 and c4 >= 0) or \
-           (c1 <= 0 and c2 <= 0 and c3 <= 0 and c4 <= 0)
+# =========================
+# Geometry: convex quad as 4 edge half-planes
+# =========================
+def quad_edge_coefficients(quad, out, offset):
+    """
+    Writes a,b,c for the 4 edges of a convex quad into out[offset:offset+12]:
+    point (px,py) is inside when a*px + b*py + c >= 0 for every edge.
+    Same test as the cross products (P2-P1) x (P-P1), signs normalized by winding.
+    """
+    area2 = 0
+    for i in range(4):
+        x1, y1 = quad[i]
+        x2, y2 = quad[(i + 1) % 4]
+        area2 += x1 * y2 - x2 * y1
+    sign = -1 if area2 < 0 else 1
+    for i in range(4):
+        x1, y1 = quad[i]
+        x2, y2 = quad[(i + 1) % 4]
+        k = offset + i * 3
+        out[k] = sign * (y1 - y2)
+        out[k + 1] = sign * (x2 - x1)
+        out[k + 2] = sign * ((y2 - y1) * x1 - (x2 - x1) * y1)
 
 def clamp(v, lo, hi):
     return lo if v < lo else hi if v > hi else v
@@ -129,9 +1068,11 @@ def clamp(v, lo, hi):
 # ZoneConfig: symmetric trapezoid with two LEFT handles (B=top-left, A=bottom-left)
 # =========================
 class ZoneConfig:
-    def __init__(self, width, height):
+    def __init__(self, width, height, name="stop", level=3):
         self.width = width
         self.height = height
+        self.name = name    # warn / slow / stop
+        self.level = level  # 1 = warn, 2 = slow, 3 = stop
 
         self.shift_far_k = 1.0 # коэффициэнт движения вершины
 
@@ -146,25 +1087,26 @@ class ZoneConfig:
         self.max_shift_ratio = 0.4
         self.max_steer_for_max = 30.0  # +/-30° -> max shift
 
-        # UI / edit
-        self.edit_mode = False
-        self.selected = None   # 'A' or 'B'
-        self.touch_threshold = 60
-        self.last_touch_time = 0
-        self.touch_cooldown = 70
-
-        self.obstacle_detection_enabled = True
-
         # constraints
         self.min_half_ratio = 0.06
         self.max_half_ratio = 0.49
         self.min_height_px = 40
 
-    def toggle_obstacle_detection(self):
-        self.obstacle_detection_enabled = not self.obstacle_detection_enabled
-        status = "ВКЛЮЧЕНО" if self.obstacle_detection_enabled else "ВЫКЛЮЧЕНО"
-        print(f"🎯 Обнаружение препятствий: {status}")
-        return self.obstacle_detection_enabled
+        # geometry cache: recomputed only when steering or parameters change
+        self._geom_angle = None
+        self._geom_version = -1
+        self._geom_serial = 0  # +1 per recompute: ZoneSet rebuilds its coefficients by it
+        self._trap = None
+        self._quad = None
+        self._bbox = None
+        self._handles = None
+
+    _params_version = 0  # bumped on every public attribute change (tuning, touch drag)
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name[0] != "_":
+            object.__setattr__(self, "_params_version", self._params_version + 1)
 
     def _steer_norm(self, steering_angle):
         return clamp(steering_angle / self.max_steer_for_max, -1.0, 1.0)
@@ -190,7 +1132,24 @@ class ZoneConfig:
 
         return cx, yA, yB, near_half, far_half
 
+    def _update_geometry(self, steering_angle):
+        if steering_angle == self._geom_angle and self._params_version == self._geom_version:
+            return False
+        A, B, C, D = self._compute_trapezoid(steering_angle)
+        self._trap = (A, B, C, D)
+        self._quad = (D, C, B, A)  # polygon for quad_edge_coefficients: D->C->B->A
+        self._bbox = (min(A[0], B[0], C[0], D[0]), B[1], max(A[0], B[0], C[0], D[0]), A[1])  # B/C сверху, A/D снизу
+        self._handles = {"A": D, "B": C}
+        self._geom_angle = steering_angle
+        self._geom_version = self._params_version
+        self._geom_serial += 1
+        return True
+
     def get_trapezoid(self, steering_angle=0.0):
+        self._update_geometry(steering_angle)
+        return self._trap
+
+    def _compute_trapezoid(self, steering_angle):
         """
         Returns A,B,C,D in your naming:
           A = right-bottom
@@ -222,20 +1181,21 @@ class ZoneConfig:
 
         return clamp_pt(A), clamp_pt(B), clamp_pt(C), clamp_pt(D)
 
+    # cached objects below are shared between calls: read-only for callers
     def get_quad_for_tests(self, steering_angle=0.0):
-        A, B, C, D = self.get_trapezoid(steering_angle)
-        # polygon for point_in_quad: D->C->B->A
-        return [D, C, B, A], (A, B, C, D)
+        self._update_geometry(steering_angle)
+        return self._quad, self._trap
+
+    def get_bbox(self, steering_angle=0.0):
+        self._update_geometry(steering_angle)
+        return self._bbox
 
     # ---- handles: two points on LEFT (B=top-left (C), A=bottom-left (D)) ----
     def get_left_handles(self, steering_angle=0.0):
-        A, B, C, D = self.get_trapezoid(steering_angle)
         # handle A = left-bottom corner D
         # handle B = left-top corner C
-        return {
-            "A": (D[0], D[1]),
-            "B": (C[0], C[1]),
-        }
+        self._update_geometry(steering_angle)
+        return self._handles
 
     # ---- update rules per your requirements ----
     def _set_near_from_x(self, x):
@@ -266,6 +1226,112 @@ class ZoneConfig:
         self.yB_ratio = y / H
         print(f"📐 yB (BC по вертикали) = {y}px  ratio={self.yB_ratio:.3f}")
 
+# =========================
+# ZoneSet: nested zones of one camera (warn / slow / stop) + touch UI
+# =========================
+class ZoneSet:
+    """
+    All zones are checked in one pass over the detections against a flat table of
+    edge coefficients (12 per zone), rebuilt only for zones whose geometry changed
+    (by the zone's _geom_serial, whoever triggered the recompute: get_bbox, touch, tuning).
+    The zone with the highest level is the "stop" zone: it drives OBSTACLE / COUNT and
+    FrameResult.in_zone / zone_count / class_counts. Other levels: counts, det_levels.
+    """
+    def __init__(self, width, height, zones):
+        self.width = width
+        self.height = height
+        self.zones = zones
+        self.n = len(zones)
+        self.levels = array("B", [z.level for z in zones])
+        self.stop_index = max(range(self.n), key=lambda i: zones[i].level)
+
+        # per-frame result
+        self.counts = array("H", [0]) * self.n  # detections inside each zone
+        self.level = 0                          # highest occupied level (0 = clear)
+        self.occupied = 0                       # bit i = zone i has a detection
+        self.stop_count = 0
+        self.det_levels = bytearray(64)         # highest zone level of each stored detection
+        self._coef = array("d", [0.0]) * (12 * self.n)
+        self._coef_serial = array("L", [0]) * self.n  # zone geometry the coefficients were built from
+
+        # UI / edit
+        self.edit_mode = False
+        self.active = self.stop_index  # zone edited by the handles
+        self.selected = None   # 'A' or 'B'
+        self.touch_threshold = 60
+        self.last_touch_time = 0
+        self.touch_cooldown = 70
+
+        self.obstacle_detection_enabled = True
+
+    def toggle_obstacle_detection(self):
+        self.obstacle_detection_enabled = not self.obstacle_detection_enabled
+        status = "ВКЛЮЧЕНО" if self.obstacle_detection_enabled else "ВЫКЛЮЧЕНО"
+        print(f"🎯 Обнаружение препятствий: {status}")
+        return self.obstacle_detection_enabled
+
+    def get_bbox(self, steering_angle=0.0):
+        # union of all zones: the motion gate watches everything that can raise a level
+        x1, y1, x2, y2 = self.zones[0].get_bbox(steering_angle)
+        for z in self.zones:
+            bx1, by1, bx2, by2 = z.get_bbox(steering_angle)
+            x1 = min(x1, bx1)
+            y1 = min(y1, by1)
+            x2 = max(x2, bx2)
+            y2 = max(y2, by2)
+        return x1, y1, x2, y2
+
+    def evaluate(self, objs, result, class_names, steering_angle):
+        for zi in range(self.n):
+            z = self.zones[zi]
+            z._update_geometry(steering_angle)
+            if z._geom_serial != self._coef_serial[zi]:
+                quad_edge_coefficients(z._quad, self._coef, zi * 12)
+                self._coef_serial[zi] = z._geom_serial
+            self.counts[zi] = 0
+        if len(self.det_levels) < result.capacity:
+            self.det_levels = bytearray(result.capacity)
+
+        coef = self._coef
+        counts = self.counts
+        levels = self.levels
+        det_levels = self.det_levels
+        stop = self.stop_index
+        n = self.n
+        result.reset()
+        for o in objs:
+            if o.class_id not in class_names:
+                continue
+            px = o.x + o.w // 2
+            py = o.y + o.h // 2
+            best = 0
+            in_stop = 0
+            k = 0
+            for zi in range(n):
+                if (coef[k] * px + coef[k + 1] * py + coef[k + 2] >= 0 and
+                        coef[k + 3] * px + coef[k + 4] * py + coef[k + 5] >= 0 and
+                        coef[k + 6] * px + coef[k + 7] * py + coef[k + 8] >= 0 and
+                        coef[k + 9] * px + coef[k + 10] * py + coef[k + 11] >= 0):
+                    counts[zi] += 1
+                    if levels[zi] > best:
+                        best = levels[zi]
+                    if zi == stop:
+                        in_stop = 1
+                k += 12
+            i = result.add(o, in_stop)  # warn / slow hits are not obstacles
+            if i >= 0:
+                det_levels[i] = best
+
+        self.level = 0
+        self.occupied = 0
+        for zi in range(n):
+            if counts[zi] > 0:
+                self.occupied |= 1 << zi
+                if levels[zi] > self.level:
+                    self.level = levels[zi]
+        self.stop_count = counts[self.stop_index]
+        return self.level
+
     def handle_touch(self, x, y, pressed, steering_angle=0.0):
         now = time.ticks_ms()
         if now - self.last_touch_time < self.touch_cooldown:
@@ -300,8 +1366,16 @@ class ZoneConfig:
             if det_x <= x <= det_x + btn_w and btn_y <= y <= btn_y + btn_h:
                 self.toggle_obstacle_detection()
                 return True
+            # ZONE button (center top) picks which zone the handles edit
+            zone_x = self.width // 2 - 50
+            if self.n > 1 and zone_x <= x <= zone_x + 100 and btn_y <= y <= btn_y + btn_h:
+                self.active = (self.active + 1) % self.n
+                self.selected = None
+                print(f"📐 Редактируется зона {self.zones[self.active].name}")
+                return True
 
-        handles = self.get_left_handles(steering_angle)
+        zone = self.zones[self.active]
+        handles = zone.get_left_handles(steering_angle)
 
         # pick nearest handle
         nearest = None
@@ -323,23 +1397,181 @@ class ZoneConfig:
         # apply drag logic even if pressed==0 (на некоторых прошивках так идет движение)
         if self.selected == "A":
             # X -> AD, Y -> AB and vertical position of AD
-            self._set_near_from_x(x)
-            self._set_yA_from_y(y)
+            zone._set_near_from_x(x)
+            zone._set_yA_from_y(y)
             return True
 
         if self.selected == "B":
             # X -> BC, Y -> AB and vertical position of BC
-            self._set_far_from_x(x)
-            self._set_yB_from_y(y)
+            zone._set_far_from_x(x)
+            zone._set_yB_from_y(y)
             return True
 
         return False
 
 # =========================
-# Model / Camera / Display
+# Simulated camera (same interface as camera.Camera, for tests without sensors)
+# =========================
+class SimulatedCamera:
+    def __init__(self, width, height, fmt=image.Format.FMT_RGB888, speed_px=4):
+        self._w = width
+        self._h = height
+        self._fmt = fmt
+        self._speed = speed_px
+        self._x = 0
+
+    def width(self):
+        return self._w
+
+    def height(self):
+        return self._h
+
+    def read(self):
+        # black frame with a white box sliding left->right: motion gate / zone see changes
+        img = image.Image(self._w, self._h, self._fmt)
+        img.draw_rect(0, 0, self._w, self._h, color=image.COLOR_BLACK, thickness=-1)
+        box_w, box_h = self._w // 6, self._h // 3
+        img.draw_rect(self._x, self._h // 2, box_w, box_h, color=image.COLOR_WHITE, thickness=-1)
+        self._x = (self._x + self._speed) % max(1, self._w - box_w)
+        return img
+
+# =========================
+# Camera source: camera + own zones + own UDP channel
+# =========================
+class CameraSource:
+    def __init__(self, name, cam, channel, facing, zones, motion_gate):
+        self.name = name
+        self.cam = cam
+        self.channel = channel
+        self.facing = facing            # 1 = смотрит вперед, -1 = назад
+        self.zones = zones              # ZoneSet: warn / slow / stop
+        self.motion_gate = motion_gate
+
+        self.img = None
+        self.objs = []                  # последние детекции (переиспользуются между инференсами)
+        self.result = FrameResult()     # детекции нужных классов + уровень зоны
+        self.has_obstacle = False
+        self.needs_inference = False
+        self.scheduled = False
+        self.credit = 0.0               # для взвешенного round-robin планировщика
+
+        self.last_obstacle_print = 0
+        self.inferences = 0
+        self.infer_rate = 0.0           # инференсов в секунду
+        self._rate_count = 0
+        self._rate_t0 = time.ticks_ms()
+
+    def count_inference(self):
+        self.inferences += 1
+        self._rate_count += 1
+        now = time.ticks_ms()
+        if now - self._rate_t0 >= 1000:
+            self.infer_rate = self._rate_count * 1000.0 / (now - self._rate_t0)
+            self._rate_count = 0
+            self._rate_t0 = now
+
+# =========================
+# Travel direction: which camera gets the inference priority
+# =========================
+class TravelDirection:
+    """
+    1 = forward, -1 = reverse, 0 = no priority.
+    Reverse comes from a reverse-gear input (GPIO, e.g. the reverse light signal
+    through an optocoupler), standstill from the PGN speed; otherwise the manual
+    value (RuntimeParams.travel_direction, settable over the control port).
+    """
+    def __init__(self, reverse_pin=None, active_low=True, stop_speed_kmh=0.5):
+        self.active_low = active_low
+        self.stop_speed_kmh = stop_speed_kmh
+        self.reverse_input = None
+        if reverse_pin:
+            try:
+                pinmap.set_pin_function(reverse_pin, "GPIO" + reverse_pin)
+                self.reverse_input = gpio.GPIO("GPIO" + reverse_pin, gpio.Mode.IN)
+                print(f"↩ Вход заднего хода: {reverse_pin}")
+            except Exception as e:
+                print(f"❌ Вход заднего хода {reverse_pin}: {e}")
+
+    def reverse_engaged(self):
+        if self.reverse_input is None:
+            return None
+        return (self.reverse_input.value() == 0) == self.active_low
+
+    def current(self, manual, angle_receiver):
+        reverse = self.reverse_engaged()
+        if reverse is not None:
+            return -1 if reverse else 1
+        # PGN 254 speed has no sign: it only tells that the tractor stands still
+        if angle_receiver.mode == "pgn" and angle_receiver.last_set_ms and \
+                angle_receiver.speed_kmh < self.stop_speed_kmh:
+            return 0
+        return manual
+
+# =========================
+# Inference scheduler: one detector shared by all cameras
+# =========================
+class InferenceScheduler:
+    """
+    Smooth weighted round-robin: every tick each camera waiting for inference
+    gets credit = its weight, the `batch_size` richest run and share the total.
+    The camera facing the direction of travel has weight `travel_weight`,
+    the others 1, so no camera starves. A camera can't run more than once per
+    tick, so when its weight asks for more than that its credit would grow
+    forever: credits are clamped to +/-total.
+    """
+    def __init__(self, detector, sources, batch_size=1, travel_weight=3):
+        self.detector = detector
+        self.sources = sources
+        self.batch_size = batch_size
+        self.travel_weight = travel_weight
+        self.batch = [None] * len(sources)  # preallocated, valid up to batch_len
+        self.batch_len = 0
+
+    def select(self, travel_direction):
+        total = 0
+        for s in self.sources:
+            if s.needs_inference:
+                w = self.travel_weight if s.facing == travel_direction else 1
+                s.credit += w
+                total += w
+
+        n = 0
+        while n < self.batch_size:
+            best = None
+            for s in self.sources:
+                if s.needs_inference and not s.scheduled and (best is None or s.credit > best.credit):
+                    best = s
+            if best is None:
+                break
+            best.scheduled = True
+            self.batch[n] = best
+            n += 1
+
+        for i in range(n):
+            self.batch[i].credit -= total / n
+        for s in self.sources:
+            if s.credit > total:
+                s.credit = total
+            elif s.credit < -total:
+                s.credit = -total
+        self.batch_len = n
+        return n
+
+    def run(self, travel_direction, conf_th, iou_th):
+        # NPU API takes one image per call: the batch runs back-to-back, then zones are evaluated
+        n = self.select(travel_direction)
+        for i in range(n):
+            s = self.batch[i]
+            s.objs = self.detector.detect(s.img, conf_th=conf_th, iou_th=iou_th)
+            s.motion_gate.mark_inferred()
+            s.count_inference()
+            s.scheduled = False
+        return n
+
+# =========================
+# Model / Cameras / Display
 # =========================
 detector = nn.YOLOv5(model="/root/models/yolov5s.mud", dual_buff=True)
-cam = camera.Camera(detector.input_width(), detector.input_height(), detector.input_format())
 disp = display.Display()
 
 class_names = {
@@ -347,47 +1579,240 @@ class_names = {
     7: "Truck", 17: "Horse", 18: "Sheep", 19: "Cow"
 }
 
+# colors / labels prepared once instead of per frame
+class_colors = {}
+for cid in class_names:
+    if cid == 0:
+        class_colors[cid] = image.COLOR_GREEN
+    elif cid in [1, 2, 3, 7]:
+        class_colors[cid] = image.COLOR_BLUE
+    else:
+        class_colors[cid] = image.COLOR_YELLOW
+score_labels = {cid: tuple(f"{name}:{p / 100:.2f}" for p in range(101)) for cid, name in class_names.items()}
+
+# device: None = основная камера, "sim" = симулятор, иначе путь устройства (/dev/videoN)
+# facing: 1 = смотрит вперед, -1 = назад. Канал UDP = индекс в списке.
+CAMERA_SOURCES = [
+    {"name": "front", "device": None, "facing": 1},
+    # {"name": "rear", "device": "sim", "facing": -1},
+]
+
+# Вложенные зоны каждой камеры, от дальней/широкой к ближней.
+# level: 1 = предупреждение, 2 = замедление, 3 = стоп (OBSTACLE/COUNT считаются по зоне стоп).
+# Остальные ключи - начальные параметры ZoneConfig. Одна зона = прежнее поведение и прежнее
+# сообщение ESP32; с несколькими зонами к нему добавляется ":LEVEL:l:ZONES:a,b,c" -
+# включать (ZONE_PRESETS = GRADED_ZONE_PRESETS), только если прошивка ESP32 это понимает.
+GRADED_ZONE_PRESETS = [
+    {"name": "warn", "level": 1, "yB_ratio": 0.10, "near_half_ratio": 0.40, "far_half_ratio": 0.24, "shift_far_k": 1.3},
+    {"name": "slow", "level": 2, "yB_ratio": 0.20, "near_half_ratio": 0.35, "far_half_ratio": 0.18},
+    {"name": "stop", "level": 3},
+]
+ZONE_PRESETS = [
+    {"name": "stop", "level": 3},
+]
+zone_colors = {1: image.COLOR_YELLOW, 2: image.COLOR_ORANGE, 3: image.COLOR_RED}
+
+def make_zones(width, height):
+    zones = []
+    for preset in ZONE_PRESETS:
+        z = ZoneConfig(width, height, preset["name"], preset["level"])
+        for k, v in preset.items():
+            if k not in ("name", "level"):
+                setattr(z, k, v)
+        zones.append(z)
+    return ZoneSet(width, height, zones)
+
 # =========================
 # Wi-Fi
 # =========================
 wifi_manager = WiFiManager()
 SSID = "AOG4"
 PASSWORD = "12345678"
+UDP_SEND_SEQ = False  # True - ":SEQ:n" in every message, for AOG_Simulator.py against the real camera
+wifi_manager.send_seq = UDP_SEND_SEQ
 wifi_connected = wifi_manager.connect(SSID, PASSWORD)
 
+# =========================
+# Motion gate
+# =========================
+MOTION_GATE_ENABLED = True
+MOTION_THRESHOLD = 12.0  # разница яркости самого изменившегося блока, ниже - кадр считается тем же
+MOTION_MAX_SKIP = 5     # не реже чем раз в 6 кадров - свежий инференс
+
+# =========================
+# Inference scheduler
+# =========================
+SCHED_BATCH = 1          # сколько камер обрабатывать детектором за один такт
+SCHED_TRAVEL_WEIGHT = 3  # доля инференсов камеры по направлению движения
+REVERSE_GPIO = None      # e.g. "A19": reverse-gear input, travel direction follows it
+REVERSE_ACTIVE_LOW = True
+
+# =========================
+# Preview stream (encoding + network in background threads)
+# =========================
+STREAM_ENABLED = False
+STREAM_PORT = 8080
+STREAM_FPS = 5
+STREAM_QUALITY = 60
+preview_streamer = PreviewStreamer(STREAM_PORT, STREAM_FPS, STREAM_QUALITY)
+if STREAM_ENABLED:
+    preview_streamer.start()
+
+# =========================
+# Shared-memory export: every frame of every camera (reader: AOG_ShmReader.py)
+# =========================
+SHM_EXPORT_ENABLED = False
+SHM_PATH = "/dev/shm/aog_detections"
+SHM_SLOTS = 16
+shm_export = None
+
+# =========================
+# Obstacle snapshots (JPEG + JSON sidecar), written in background
+# =========================
+SNAPSHOT_ENABLED = False
+SNAPSHOT_DIR = "/root/snapshots"
+SNAPSHOT_INTERVAL_MS = 2000  # while the obstacle persists
+SNAPSHOT_QUOTA_MB = 200      # oldest snapshots deleted first
+snapshot_recorder = None
+if SNAPSHOT_ENABLED:
+    snapshot_recorder = SnapshotRecorder(SNAPSHOT_DIR, SNAPSHOT_INTERVAL_MS, quota_mb=SNAPSHOT_QUOTA_MB)
+    if not snapshot_recorder.start():
+        snapshot_recorder = None
+
+# =========================
+# Allocation check (tracemalloc report in console)
+# =========================
+ALLOC_CHECK = False
+alloc_probe = AllocProbe() if ALLOC_CHECK else None
+
 # =========================
 # Angle receiver
 # =========================
-angle_receiver = AngleReceiver()
+# "text": ANGLE:x relayed by the ESP32 on 8889
+# "pgn":  AgIO broadcasts directly - PGN 254 steer data on 8888, PGN 253 autosteer status on 9999
+ANGLE_INPUT = "text"
+ANGLE_PGN_SOURCE = "actual"  # "actual" (PGN 253, falls back to set) or "set" (PGN 254)
+ANGLE_PGN_SIGN = 1           # -1 if the zone bends the wrong way compared to the text mode
+angle_receiver = AngleReceiver(mode=ANGLE_INPUT, angle_source=ANGLE_PGN_SOURCE, angle_sign=ANGLE_PGN_SIGN)
+
+# =========================
+# Cameras + zones + touch calibrator
+# =========================
+sources = []
+for i, cfg in enumerate(CAMERA_SOURCES):
+    w, h, fmt = detector.input_width(), detector.input_height(), detector.input_format()
+    if cfg["device"] == "sim":
+        cam = SimulatedCamera(w, h, fmt)
+    elif cfg["device"] is None:
+        cam = camera.Camera(w, h, fmt)
+    else:
+        cam = camera.Camera(w, h, fmt, device=cfg["device"])
+    gate = MotionGate(threshold=MOTION_THRESHOLD, max_skip=MOTION_MAX_SKIP)
+    sources.append(CameraSource(cfg["name"], cam, i, cfg["facing"], make_zones(cam.width(), cam.height()), gate))
+    print(f"📷 Камера {i} '{cfg['name']}': {cam.width()}x{cam.height()} facing={cfg['facing']}")
+
+if SHM_EXPORT_ENABLED:
+    shm_export = DetectionExport(SHM_PATH, SHM_SLOTS * len(sources), max_dets=sources[0].result.capacity,
+                                 max_zones=len(ZONE_PRESETS))
+    if not shm_export.open():
+        shm_export = None
+
+travel = TravelDirection(REVERSE_GPIO, REVERSE_ACTIVE_LOW)
+scheduler = InferenceScheduler(detector, sources, SCHED_BATCH, SCHED_TRAVEL_WEIGHT)
+multi_cam = len(sources) > 1
+shown = 0  # индекс камеры на экране (кнопка CAM)
+touch_calibrator = TouchCalibrator(sources[0].cam.width(), sources[0].cam.height())
 
 # =========================
-# Zone + touch calibrator
+# Loop profiler: PROF button on screen or PROFILE command on the control port
 # =========================
-zone_config = ZoneConfig(cam.width(), cam.height())
-touch_calibrator = TouchCalibrator(cam.width(), cam.height())
+PROFILE_MODE = "sample"        # "sample" (stacks, .folded) or "cprofile" (.pstats)
+PROFILE_FRAMES = 300
+PROFILE_DIR = "/root/profiles"
+profiler = LoopProfiler(PROFILE_DIR, PROFILE_FRAMES, mode=PROFILE_MODE)
+prof_button = (0, 40, 48, 26)  # x, y, w, h - left, under EDIT
+
+def profile_command(arg):
+    if not profiler.start(arg.strip().lower() or None):
+        return "ERR busy" if profiler.active else f"ERR {profiler.error}"
+    return f"OK profile frames={profiler.frames} file={profiler.path}"
 
-print(f"📱 Разрешение: {cam.width()}x{cam.height()}")
+# =========================
+# Runtime tuning (control port next to the angle port 8889)
+# =========================
+runtime_params = RuntimeParams(conf_th=0.5, iou_th=0.45, travel_direction=1)
+CONTROL_ENABLED = False
+CONTROL_PORT = 8890
+CONTROL_SECRET = "change-me"  # shared with AOG_Tune.py
+tuning = None
+if CONTROL_ENABLED:
+    tuning = TuningControl(CONTROL_SECRET, CONTROL_PORT)
+    tuning.register("conf_th", [(runtime_params, "conf_th")], float, 0.05, 0.95)
+    tuning.register("iou_th", [(runtime_params, "iou_th")], float, 0.05, 0.95)
+    tuning.register("travel_direction", [(runtime_params, "travel_direction")], int, -1, 1)
+    # zone / touch / motion parameters: "name" sets every camera and zone,
+    # "<zone>.name" one zone, "<camera>.name" / "<camera>.<zone>.name" one camera
+    zone_tunables = [
+        ("max_shift_ratio", float, 0.0, 0.5),
+        ("max_steer_for_max", float, 5.0, 90.0),
+        ("shift_far_k", float, 0.0, 3.0),
+    ]
+    for name, kind, lo, hi in zone_tunables:
+        tuning.register(name, [(z, name) for s in sources for z in s.zones.zones], kind, lo, hi)
+        for zi, preset in enumerate(ZONE_PRESETS):
+            if len(ZONE_PRESETS) > 1:
+                tuning.register(f"{preset['name']}.{name}", [(s.zones.zones[zi], name) for s in sources], kind, lo, hi)
+            if multi_cam:
+                for s in sources:
+                    prefix = f"{s.name}.{preset['name']}" if len(ZONE_PRESETS) > 1 else s.name
+                    tuning.register(f"{prefix}.{name}", [(s.zones.zones[zi], name)], kind, lo, hi)
+    for name, kind, lo, hi in (("touch_threshold", int, 10, 200), ("touch_cooldown", int, 0, 1000)):
+        tuning.register(name, [(s.zones, name) for s in sources], kind, lo, hi)
+    tuning.register("motion_threshold", [(s.motion_gate, "threshold") for s in sources], float, 0.0, 255.0)
+    tuning.register("motion_max_skip", [(s.motion_gate, "max_skip") for s in sources], int, 0, 100)
+    tuning.register_command("PROFILE", profile_command)
+    print(f"🔧 Порт управления параметрами: {CONTROL_PORT}")
+
+print(f"📱 Разрешение: {sources[0].cam.width()}x{sources[0].cam.height()}")
 print("✅ Запуск: детекция + симметричная трапеция + две точки слева")
 
 touch_count = 0
-last_obstacle_print = 0
 last_angle_print = 0
+last_rate_print = 0
+last_rate_update = 0
+rates_text = ""
 steering_angle = 0.0
+stats_time = -1000
+stats_src = None
+stats = ""
+
+# everything created during init goes to the permanent generation: GC stops rescanning it
+gc.collect()
+gc.freeze()
 
 # =========================
 # Main loop
 # =========================
 while not app.need_exit():
-    img = cam.read()
-    objs = detector.detect(img, conf_th=0.5, iou_th=0.45)
-    target_objects = [o for o in objs if o.class_id in class_names]
+    # read every camera; inference only where the zone region changed (or max_skip reached)
+    for src in sources:
+        src.img = src.cam.read()
+        bx1, by1, bx2, by2 = src.zones.get_bbox(steering_angle)
+        src.needs_inference = not (MOTION_GATE_ENABLED and
+                                   src.motion_gate.should_skip(src.img, bx1, by1, bx2 - bx1, by2 - by1))
+    direction = travel.current(runtime_params.travel_direction, angle_receiver)
+    scheduler.run(direction, runtime_params.conf_th, runtime_params.iou_th)
 
     # angle
     if angle_receiver.receive_angle():
         steering_angle = angle_receiver.current_angle
         now = time.ticks_ms()
         if now - last_angle_print > 1000:
-            print(f"📥 Угол от ESP32: {steering_angle:.1f}°")
+            if angle_receiver.mode == "pgn":
+                print(f"📥 PGN: угол {steering_angle:.1f}° (set {angle_receiver.set_angle:.1f}°, "
+                      f"actual {angle_receiver.actual_angle:.1f}°), {angle_receiver.speed_kmh:.1f} км/ч")
+            else:
+                print(f"📥 Угол от ESP32: {steering_angle:.1f}°")
             last_angle_print = now
 
     # touch
@@ -402,71 +1827,105 @@ while not app.need_exit():
                 if touch_count <= 6:
                     print(f"👆 Touch#{touch_count}: raw({raw_x},{raw_y}) -> ({x},{y}) pressed={pressed}")
 
-                zone_config.handle_touch(x, y, pressed, steering_angle)
+                # CAM button (center top) switches the camera on screen
+                cam_btn_x = sources[shown].zones.width // 2 - 40
+                bx, by, bw, bh = prof_button
+                if (multi_cam and pressed == 1 and not sources[shown].zones.edit_mode and
+                        cam_btn_x <= x <= cam_btn_x + 80 and 0 <= y <= 32):
+                    shown = (shown + 1) % len(sources)
+                    print(f"📷 На экране камера {shown} '{sources[shown].name}'")
+                # PROF button (left, under EDIT) starts the loop profiler
+                elif (pressed == 1 and not sources[shown].zones.edit_mode and
+                        bx <= x <= bx + bw and by <= y <= by + bh):
+                    profiler.start()
+                else:
+                    sources[shown].zones.handle_touch(x, y, pressed, steering_angle)
         except Exception as e:
             print(f"❌ Ошибка TouchScreen: {e}")
 
-    quad, (A, B, C, D) = zone_config.get_quad_for_tests(steering_angle)
+    # zones + UDP for every camera
+    for src in sources:
+        zs = src.zones
+
+        # all zones in one pass; FrameResult counts the stop zone, zs.counts / zs.det_levels every level
+        res = src.result
+        zs.evaluate(src.objs, res, class_names, steering_angle)
 
-    # objects in zone
-    objects_in_zone = []
-    for o in target_objects:
-        cx = o.x + o.w // 2
-        cy = o.y + o.h // 2
-        if point_in_quad(cx, cy, quad):
-            objects_in_zone.append(o)
+        src.has_obstacle = (zs.stop_count > 0) and zs.obstacle_detection_enabled
 
-    has_obstacle = (len(objects_in_zone) > 0) and zone_config.obstacle_detection_enabled
+        # send UDP
+        if wifi_connected and zs.obstacle_detection_enabled:
+            wifi_manager.send_obstacle_data(src.has_obstacle, zs.stop_count, steering_angle,
+                                            src.channel if multi_cam else None, zs)
 
-    # send UDP
-    if wifi_connected and zone_config.obstacle_detection_enabled:
-        wifi_manager.send_obstacle_data(has_obstacle, len(objects_in_zone), steering_angle)
+        # frame to shared memory: every zone (A,B,C,D) with its count, then detections
+        if shm_export:
+            shm_export.begin()
+            for zi in range(zs.n):
+                shm_export.zone(zs.levels[zi], zs.counts[zi], zs.zones[zi].get_trapezoid(steering_angle))
+            shm_export.end(res, steering_angle, src.has_obstacle, zs.stop_count, zs.level, src.channel, zs.det_levels)
 
-    # print throttled
+        # print throttled
+        now = time.ticks_ms()
+        if src.has_obstacle and now - src.last_obstacle_print > 2000:
+            detected = [f"{class_names[cid]}:{res.class_counts[cid]}" for cid in class_names if res.class_counts[cid] > 0]
+            status = "📡 UDP OK" if wifi_connected else "❌ Wi-Fi OFF"
+            cam_txt = f"[{src.name}] " if multi_cam else ""
+            print(f"🚨 {cam_txt}ПРЕПЯТСТВИЕ: {', '.join(detected)} | angle={steering_angle:.1f}° | {status}")
+            src.last_obstacle_print = now
+
+    # per-camera throughput (text rebuilt once a second)
     now = time.ticks_ms()
-    if has_obstacle and now - last_obstacle_print > 2000:
-        detected = []
-        for cid in class_names:
-            cnt = 0
-            for o in objects_in_zone:
-                if o.class_id == cid:
-                    cnt += 1
-            if cnt > 0:
-                detected.append(f"{class_names[cid]}:{cnt}")
-        status = "📡 UDP OK" if wifi_connected else "❌ Wi-Fi OFF"
-        print(f"🚨 ПРЕПЯТСТВИЕ: {', '.join(detected)} | angle={steering_angle:.1f}° | {status}")
-        last_obstacle_print = now
+    if multi_cam and now - last_rate_update > 1000:
+        rates_text = " ".join(f"{s.name}:{s.infer_rate:.1f}/s" for s in sources)
+        last_rate_update = now
+    if multi_cam and now - last_rate_print > 5000:
+        print(f"⏱ Инференс по камерам: {rates_text}")
+        last_rate_print = now
+
+    # the rest draws the camera on screen
+    src = sources[shown]
+    img = src.img
+    zones = src.zones
+    res = src.result
+    has_obstacle = src.has_obstacle
 
     # draw detections
-    for o in target_objects:
-        if o.class_id == 0:
-            color = image.COLOR_GREEN
-        elif o.class_id in [1, 2, 3, 7]:
-            color = image.COLOR_BLUE
+    for i in range(res.count):
+        cid = res.class_id[i]
+        color = class_colors[cid]
+        img.draw_rect(res.x[i], res.y[i], res.w[i], res.h[i], color=color, thickness=2)
+        label = score_labels[cid][int(res.score[i] * 100 + 0.5)]
+        img.draw_string(res.x[i], max(0, res.y[i] - 15), label, color=color, scale=1.2)
+
+    # zones: occupied ones in the color of their level, in ZONE_PRESETS order (stop last, on top)
+    for zi in range(zones.n):
+        z = zones.zones[zi]
+        A, B, C, D = z.get_trapezoid(steering_angle)
+        thick = 3 if zi == zones.stop_index else 2
+        if not zones.obstacle_detection_enabled:
+            zone_color = image.COLOR_GRAY
+        elif zones.edit_mode:
+            zone_color = image.COLOR_GREEN if zi == zones.active else image.COLOR_GRAY
+            thick = 3 if zi == zones.active else 1
+        elif zones.counts[zi] > 0:
+            zone_color = zone_colors.get(z.level, image.COLOR_RED)
         else:
-            color = image.COLOR_YELLOW
-        img.draw_rect(o.x, o.y, o.w, o.h, color=color, thickness=2)
-        img.draw_string(o.x, max(0, o.y - 15), f"{class_names[o.class_id]}:{o.score:.2f}", color=color, scale=1.2)
-
-    # zone color
-    if zone_config.obstacle_detection_enabled:
-        zone_color = image.COLOR_RED if has_obstacle else image.COLOR_GREEN
-        if zone_config.edit_mode:
             zone_color = image.COLOR_GREEN
-    else:
-        zone_color = image.COLOR_GRAY
-
-    # draw trapezoid edges: AB, BC, CD, DA
-    img.draw_line(A[0], A[1], B[0], B[1], color=zone_color, thickness=3)  # AB (right)
-    img.draw_line(B[0], B[1], C[0], C[1], color=zone_color, thickness=3)  # BC (top)
-    img.draw_line(C[0], C[1], D[0], D[1], color=zone_color, thickness=3)  # CD (left)
-    img.draw_line(D[0], D[1], A[0], A[1], color=zone_color, thickness=3)  # DA (bottom)
 
-    # draw LEFT handles in edit mode
-    if zone_config.edit_mode:
-        handles = zone_config.get_left_handles(steering_angle)
+        # draw trapezoid edges: AB, BC, CD, DA
+        img.draw_line(A[0], A[1], B[0], B[1], color=zone_color, thickness=thick)  # AB (right)
+        img.draw_line(B[0], B[1], C[0], C[1], color=zone_color, thickness=thick)  # BC (top)
+        img.draw_line(C[0], C[1], D[0], D[1], color=zone_color, thickness=thick)  # CD (left)
+        img.draw_line(D[0], D[1], A[0], A[1], color=zone_color, thickness=thick)  # DA (bottom)
+        if zones.n > 1:
+            img.draw_string(B[0] + 4, B[1] + 2, z.name, color=zone_color, scale=0.6)
+
+    # draw LEFT handles of the edited zone in edit mode
+    if zones.edit_mode:
+        handles = zones.zones[zones.active].get_left_handles(steering_angle)
         for k, (hx, hy) in handles.items():
-            is_sel = (zone_config.selected == k)
+            is_sel = (zones.selected == k)
             c = image.COLOR_RED if is_sel else image.COLOR_YELLOW
             img.draw_rect(hx - 20, hy - 20, 40, 40, color=c, thickness=2)
             img.draw_rect(hx - 16, hy - 16, 32, 32, color=c, thickness=-1)
@@ -476,35 +1935,95 @@ while not app.need_exit():
     btn_w, btn_h = 120, 32
     btn_y = 0
 
-    edit_text = "EDIT" if not zone_config.edit_mode else "SAVE"
-    edit_color = image.COLOR_BLUE if not zone_config.edit_mode else image.COLOR_GREEN
+    edit_text = "EDIT" if not zones.edit_mode else "SAVE"
+    edit_color = image.COLOR_BLUE if not zones.edit_mode else image.COLOR_GREEN
     img.draw_rect(0, btn_y, btn_w, btn_h, color=edit_color, thickness=3)
     img.draw_string(12, btn_y + 9, edit_text, color=edit_color, scale=0.9)
 
-    det_text = "DETECT ON" if zone_config.obstacle_detection_enabled else "DETECT OFF"
-    det_color = image.COLOR_GREEN if zone_config.obstacle_detection_enabled else image.COLOR_RED
-    det_x = zone_config.width - btn_w
+    det_text = "DETECT ON" if zones.obstacle_detection_enabled else "DETECT OFF"
+    det_color = image.COLOR_GREEN if zones.obstacle_detection_enabled else image.COLOR_RED
+    det_x = zones.width - btn_w
     img.draw_rect(det_x, btn_y, btn_w, btn_h, color=det_color, thickness=3)
     img.draw_string(det_x + 6, btn_y + 9, det_text, color=det_color, scale=0.7)
 
+    if zones.edit_mode and zones.n > 1:
+        # ZONE button replaces CAM while editing: picks the zone the handles move
+        zone_btn_x = zones.width // 2 - 50
+        img.draw_rect(zone_btn_x, btn_y, 100, btn_h, color=image.COLOR_GREEN, thickness=3)
+        img.draw_string(zone_btn_x + 6, btn_y + 9, "ZONE:" + zones.zones[zones.active].name.upper(),
+                        color=image.COLOR_GREEN, scale=0.7)
+    elif multi_cam:
+        cam_btn_x = zones.width // 2 - 40
+        img.draw_rect(cam_btn_x, btn_y, 80, btn_h, color=image.COLOR_WHITE, thickness=3)
+        img.draw_string(cam_btn_x + 6, btn_y + 9, src.name[:8].upper(), color=image.COLOR_WHITE, scale=0.7)
+
+    if not zones.edit_mode:
+        bx, by, bw, bh = prof_button
+        prof_color = image.COLOR_RED if profiler.active else image.COLOR_WHITE
+        img.draw_rect(bx, by, bw, bh, color=prof_color, thickness=2)
+        img.draw_string(bx + 6, by + 7, "PROF", color=prof_color, scale=0.7)
+
     # stats
     wifi_status = "Wi-Fi:ON" if wifi_connected else "Wi-Fi:OFF"
-    det_status = "DET:ON" if zone_config.obstacle_detection_enabled else "DET:OFF"
-    stats = f"Obj:{len(target_objects)} In:{len(objects_in_zone)} Ang:{steering_angle:.1f} {wifi_status} {det_status}"
-    y_pos = zone_config.height - 14
+    det_status = "DET:ON" if zones.obstacle_detection_enabled else "DET:OFF"
+    if now - stats_time >= 200 or src is not stats_src:  # rebuilt 5 times a second, not every frame
+        stats = f"Obj:{res.count} In:{zones.stop_count} Lv:{zones.level} Ang:{steering_angle:.1f} Skip:{src.motion_gate.skip_ratio * 100:.0f}% {wifi_status} {det_status}"
+        if multi_cam:
+            stats += " " + rates_text
+        stats_time = now
+        stats_src = src
+    y_pos = zones.height - 14
     img.draw_rect(0, y_pos - 2, len(stats) * 6 + 14, 18, color=image.COLOR_BLACK, thickness=-1)
     img.draw_string(4, y_pos, stats, color=image.COLOR_WHITE, scale=0.7)
 
     # obstacle banner
-    if zone_config.obstacle_detection_enabled and has_obstacle:
-        img.draw_rect(cam.width() // 2 - 110, 45, 220, 28, color=image.COLOR_RED, thickness=-1)
-        img.draw_string(cam.width() // 2 - 100, 52, "OBSTACLE!", color=image.COLOR_WHITE, scale=0.9)
+    if zones.obstacle_detection_enabled and has_obstacle:
+        img.draw_rect(zones.width // 2 - 110, 45, 220, 28, color=image.COLOR_RED, thickness=-1)
+        img.draw_string(zones.width // 2 - 100, 52, "OBSTACLE!", color=image.COLOR_WHITE, scale=0.9)
         send_txt = "SENT" if wifi_connected else "Wi-Fi ERR"
         send_color = image.COLOR_GREEN if wifi_connected else image.COLOR_RED
-        img.draw_string(cam.width() // 2 - 35, 76, send_txt, color=send_color, scale=0.8)
+        img.draw_string(zones.width // 2 - 35, 76, send_txt, color=send_color, scale=0.8)
+
+    elif zones.obstacle_detection_enabled and zones.level > 0:
+        # only outer zones occupied: warning, no OBSTACLE sent
+        lvl_text = "SLOW" if zones.level >= 2 else "WARN"
+        lvl_color = zone_colors.get(zones.level, image.COLOR_YELLOW)
+        img.draw_rect(zones.width // 2 - 60, 45, 120, 28, color=lvl_color, thickness=-1)
+        img.draw_string(zones.width // 2 - 30, 52, lvl_text, color=image.COLOR_BLACK, scale=0.9)
+
+    if not zones.obstacle_detection_enabled:
+        img.draw_rect(zones.width // 2 - 150, 45, 300, 28, color=image.COLOR_GRAY, thickness=-1)
+        img.draw_string(zones.width // 2 - 140, 52, "DETECTION DISABLED", color=image.COLOR_WHITE, scale=0.8)
+
+    # obstacle snapshots: the shown camera is annotated, the others are saved as read
+    if snapshot_recorder:
+        for s in sources:
+            if snapshot_recorder.due(s.has_obstacle, s.channel):
+                zs = s.zones
+                snapshot_recorder.submit(s.img, {
+                    "camera": s.name,
+                    "channel": s.channel,
+                    "annotated": s is src,
+                    "angle": round(steering_angle, 1),
+                    "count": zs.stop_count,
+                    "level": zs.level,
+                    "zones": [{"name": z.name, "level": z.level, "count": zs.counts[zi],
+                               "points": [list(p) for p in z.get_trapezoid(steering_angle)]}
+                              for zi, z in enumerate(zs.zones)],
+                    "detections": SnapshotRecorder.detections(s.result, class_names, zs.det_levels),
+                }, s.channel)
+
+    preview_streamer.offer(img)
+    disp.show(img)
 
-    if not zone_config.obstacle_detection_enabled:
-        img.draw_rect(cam.width() // 2 - 150, 45, 300, 28, color=image.COLOR_GRAY, thickness=-1)
-        img.draw_string(cam.width() // 2 - 140, 52, "DETECTION DISABLED", color=image.COLOR_WHITE, scale=0.8)
+    # tuning commands: applied between frames
+    if tuning:
+        try:
+            tuning.poll()
+        except Exception as e:
+            print(f"❌ Ошибка команд настройки: {e}")
 
-    disp.show(img)
+    if alloc_probe:
+        alloc_probe.on_frame()
+
+    profiler.on_frame()
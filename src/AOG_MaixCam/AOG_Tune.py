@@ -0,0 +1,60 @@
+# Клиент порта управления параметрами камеры (TuningControl в AOG_MaixCam.py / AOG_Trapez.py)
+# Запуск на ноутбуке / планшете в той же сети, обычный CPython:
+#   python AOG_Tune.py --host 192.168.4.2 --secret change-me get
+#   python AOG_Tune.py --host 192.168.4.2 --secret change-me get conf_th
+#   python AOG_Tune.py --host 192.168.4.2 --secret change-me set conf_th=0.4,iou_th=0.5
+
+import argparse
+import hashlib
+import hmac
+import socket
+import time
+
+
+def sign_command(secret, command, nonce=None):
+    """Пакет "<nonce>:<команда>:<подпись>" в формате TuningControl"""
+    if nonce is None:
+        nonce = int(time.time() * 1000)  # растущее значение между запусками клиента
+    body = f"{nonce}:{command}"
+    sig = hmac.new(secret.encode("utf-8"), body.encode("utf-8"), hashlib.sha256).hexdigest()[:16]
+    return f"{body}:{sig}".encode("utf-8")
+
+
+def send_command(host, port, secret, command, timeout=1.0):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(timeout)
+    try:
+        sock.sendto(sign_command(secret, command), (host, port))
+        data, _ = sock.recvfrom(2048)
+        return data.decode("utf-8")
+    except socket.timeout:
+        return None
+    finally:
+        sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Настройка параметров камеры на ходу")
+    parser.add_argument("--host", required=True, help="IP камеры")
+    parser.add_argument("--port", type=int, default=8890)
+    parser.add_argument("--secret", required=True, help="CONTROL_SECRET из скрипта камеры")
+    parser.add_argument("op", choices=["get", "set"])
+    parser.add_argument("args", nargs="?", default="", help="имя для get, имя=значение[,...] для set")
+    a = parser.parse_args()
+
+    command = f"{a.op.upper()} {a.args}".strip()
+    reply = send_command(a.host, a.port, a.secret, command)
+    if reply is None:
+        print("❌ Нет ответа от камеры")
+        raise SystemExit(1)
+    # "OK a=1 b=2" -> по одному параметру в строке
+    status, _, rest = reply.partition(" ")
+    if status != "OK":
+        print(f"❌ {reply}")
+        raise SystemExit(1)
+    for item in rest.split():
+        print(item)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+# Тесты чистой логики скриптов камеры на обычном ПК: классы берутся из AOG_MaixCam.py /
+# AOG_Trapez.py через AOG_ScriptLoader, без maix. Запуск из корня репозитория: python -m pytest -q
+
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCRIPTS = ("AOG_MaixCam.py", "AOG_Trapez.py")
+
+
+class FakeClock:
+    """Вместо maix.time: ticks_ms() задается тестом"""
+    def __init__(self, ms=0):
+        self.ms = ms
+
+    def ticks_ms(self):
+        return self.ms
+
+
+def obj(x, y, w=10, h=10, class_id=0, score=0.9):
+    return types.SimpleNamespace(x=x, y=y, w=w, h=h, class_id=class_id, score=score)
@@ -0,0 +1,97 @@
+# Основной цикл в установившемся режиме не должен выделять память: tracemalloc на обычном ПК
+# для FrameResult, ZoneSet.evaluate и отправки UDP (как AllocProbe на камере, но в тестах).
+import tracemalloc
+import types
+
+import pytest
+
+from AOG_ScriptLoader import load_definitions
+from conftest import SCRIPTS, obj
+
+network = types.SimpleNamespace(wifi=types.SimpleNamespace(Wifi=lambda: None))
+trapez = load_definitions("AOG_Trapez.py", ["FrameResult", "ZoneConfig", "ZoneSet", "quad_edge_coefficients",
+                                            "clamp", "GRADED_ZONE_PRESETS"])
+OBJS = [obj(20 + 37 * i % 280, 10 + 23 * i % 200, class_id=i % 3) for i in range(12)]
+ANGLES = [0.0, 12.5, -7.5, 30.0]
+
+
+FRAMES = 500
+
+
+def measure(step, warmup=50, frames=FRAMES):
+    """-> (прирост памяти из скриптов камеры, макс. пик временных объектов за кадр), байт"""
+    for i in range(warmup):
+        step(i)
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        peak_max = 0
+        for i in range(frames):
+            tracemalloc.reset_peak()
+            cur = tracemalloc.get_traced_memory()[0]
+            step(i)
+            peak_max = max(peak_max, tracemalloc.get_traced_memory()[1] - cur)
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    own = (tracemalloc.Filter(True, "*AOG_*.py"),)
+    growth = sum(s.size_diff for s in after.filter_traces(own).compare_to(before.filter_traces(own), "filename"))
+    return growth, peak_max
+
+
+@pytest.mark.parametrize("script", SCRIPTS)
+def test_frame_result_steady_state(script):
+    res = load_definitions(script, ["FrameResult"]).FrameResult()
+
+    def step(i):
+        res.reset()
+        for k, o in enumerate(OBJS):
+            res.add(o, (i + k) % 2)
+    growth, peak = measure(step)
+    assert growth < FRAMES  # меньше байта на кадр: разовые кэши, а не утечка
+    assert peak < 256
+
+
+def test_zone_set_evaluate_steady_state():
+    zones = []
+    for preset in trapez.GRADED_ZONE_PRESETS:
+        z = trapez.ZoneConfig(320, 224, preset["name"], preset["level"])
+        for k, v in preset.items():
+            if k not in ("name", "level"):
+                setattr(z, k, v)
+        zones.append(z)
+    zs = trapez.ZoneSet(320, 224, zones)
+    res = trapez.FrameResult()
+    names = {0: "a", 1: "b", 2: "c"}
+
+    def step(i):
+        zs.evaluate(OBJS, res, names, ANGLES[(i // 50) % len(ANGLES)])  # угол меняется изредка
+    growth, peak = measure(step)
+    assert growth < FRAMES
+    assert peak < 2048  # кадры со сменой угла: пересчет трапеций
+
+
+@pytest.mark.parametrize("script", SCRIPTS)
+def test_udp_send_steady_state(script):
+    defs = load_definitions(script, ["ObstaclePacket", "WiFiManager"], network=network)
+    wifi = defs.WiFiManager()
+    wifi.connected = True
+    wifi.send_seq = True
+    wifi.udp_socket = types.SimpleNamespace(sendto=lambda data, addr: None)
+    rebuilt = []
+    set_message = defs.ObstaclePacket.set_message
+    defs.ObstaclePacket.set_message = lambda self, msg: rebuilt.append(msg) or set_message(self, msg)
+    multi = script == "AOG_Trapez.py"
+
+    def step(i):
+        if multi:  # две камеры по очереди: у каждого канала свой пакет
+            wifi.send_obstacle_data(True, 1, 12.5, i % 2)
+        else:
+            wifi.send_obstacle_data(True, 1, 12.5)
+    try:
+        growth, peak = measure(step)
+    finally:
+        defs.ObstaclePacket.set_message = set_message
+    assert len(rebuilt) == (2 if multi else 1)
+    assert growth < FRAMES
+    assert peak < 128  # только int номера SEQ
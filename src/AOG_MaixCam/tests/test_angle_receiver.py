@@ -0,0 +1,39 @@
+import pytest
+
+from AOG_ScriptLoader import load_definitions
+from AOG_Simulator import FROM_AUTOSTEER, pgn_packet, steer_data_packet
+from conftest import SCRIPTS, FakeClock
+
+
+@pytest.fixture(params=SCRIPTS)
+def receiver(request):
+    AngleReceiver = load_definitions(request.param, ["AngleReceiver"], time=FakeClock(500)).AngleReceiver
+    r = AngleReceiver(listen_port=0, angle_source="set")
+    yield r
+    r.udp_socket.close()
+
+
+def parse(r, packet):
+    r._buf[:len(packet)] = packet
+    return r._parse_pgn(len(packet))
+
+
+def test_steer_data_sets_angle_and_speed(receiver):
+    assert parse(receiver, steer_data_packet(-12.5, speed_kmh=7.5))
+    assert receiver.current_angle == -12.5 and receiver.speed_kmh == 7.5
+    assert receiver.crc_errors == 0
+
+
+def test_crc_wraps_to_one_byte(receiver):
+    packet = pgn_packet(253, FROM_AUTOSTEER.pack(-3000, 0x7FFF, 0x7FFF, 0xFF, 0xFF), src=0xFF)
+    assert sum(packet[2:-1]) > 0xFF
+    receiver.angle_source = "actual"
+    assert parse(receiver, packet)
+    assert receiver.current_angle == -30.0
+
+
+def test_bad_crc_is_counted(receiver):
+    packet = bytearray(steer_data_packet(5.0))
+    packet[-1] ^= 0x01
+    assert not parse(receiver, bytes(packet))
+    assert receiver.crc_errors == 1 and receiver.current_angle == 0.0
@@ -0,0 +1,42 @@
+import pytest
+
+from AOG_ScriptLoader import load_definitions
+from conftest import SCRIPTS, obj
+
+
+@pytest.fixture(params=SCRIPTS)
+def FrameResult(request):
+    return load_definitions(request.param, ["FrameResult"]).FrameResult
+
+
+def test_counts_in_zone_objects(FrameResult):
+    res = FrameResult(capacity=8, num_classes=4)
+    res.add(obj(0, 0, class_id=1), 1)
+    res.add(obj(5, 5, class_id=1), 0)
+    res.add(obj(9, 9, class_id=2), 1)
+    assert res.count == 3
+    assert res.zone_count == 2
+    assert list(res.class_counts) == [0, 1, 1, 0]
+
+
+def test_reset_clears_only_used_entries(FrameResult):
+    res = FrameResult(capacity=8, num_classes=4)
+    res.add(obj(0, 0, class_id=3), 1)
+    res.reset()
+    assert res.count == 0 and res.zone_count == 0
+    assert list(res.class_counts) == [0, 0, 0, 0]
+    assert not any(res.in_zone)
+
+
+def test_in_zone_hits_counted_past_capacity(FrameResult):
+    res = FrameResult(capacity=2, num_classes=4)
+    for i in range(5):
+        res.add(obj(i, i, class_id=i % 2), 1)
+    assert res.count == 2            # сохранено только capacity
+    assert res.dropped == 3
+    assert res.zone_count == 5       # но ни одно попадание в зону не потеряно
+    assert list(res.class_counts) == [3, 2, 0, 0]
+
+    res.reset()
+    assert res.dropped == 0 and res.zone_count == 0
+    assert list(res.class_counts) == [0, 0, 0, 0]
@@ -0,0 +1,85 @@
+import types
+
+import pytest
+
+from AOG_ScriptLoader import load_definitions
+from conftest import SCRIPTS
+
+
+class Img:
+    """Кадр 320x224: crop запоминает область, дальше цепочка resize/to_format/to_bytes"""
+    def __init__(self, width=320, height=224):
+        self.size = (width, height)
+        self.crops = []
+
+    def width(self):
+        return self.size[0]
+
+    def height(self):
+        return self.size[1]
+
+    def crop(self, x, y, w, h):
+        assert 0 <= x and 0 <= y and w > 0 and h > 0
+        assert x + w <= self.size[0] and y + h <= self.size[1]
+        self.crops.append((x, y, w, h))
+        return self
+
+    def resize(self, w, h, **kw):
+        return self
+
+    def to_format(self, fmt):
+        return self
+
+    def to_bytes(self):
+        return bytes(192)
+
+
+image = types.SimpleNamespace(Fit=types.SimpleNamespace(FIT_FILL=0), ResizeMethod=types.SimpleNamespace(AREA=0),
+                              Format=types.SimpleNamespace(FMT_GRAYSCALE=0))
+
+
+def make_gate(script, **kw):
+    MotionGate = load_definitions(script, ["MotionGate"]).MotionGate
+    gate = MotionGate(**kw)
+    sigs = []
+    gate._signature = lambda img, x, y, w, h: sigs.pop(0)  # сигнатура без камеры
+    return gate, sigs
+
+
+@pytest.mark.parametrize("script", SCRIPTS)
+def test_change_in_one_block_is_not_skipped(script):
+    gate, sigs = make_gate(script, threshold=12.0, max_skip=5)
+    still = bytes([50] * 192)
+    person = bytearray(still)
+    person[77] = 150  # один блок из 192 изменился на 100
+    sigs += [still, still, bytes(person)]
+    assert gate.should_skip(None, 0, 0, 1, 1) is False  # первый кадр - всегда инференс
+    gate.mark_inferred()
+    assert gate.should_skip(None, 0, 0, 1, 1) is True
+    assert gate.should_skip(None, 0, 0, 1, 1) is False
+    assert gate.last_diff == 100
+
+
+@pytest.mark.parametrize("script", SCRIPTS)
+def test_small_noise_is_skipped_until_max_skip(script):
+    gate, sigs = make_gate(script, threshold=12.0, max_skip=2)
+    base = bytes([50] * 192)
+    noisy = bytes(50 + (i % 5) for i in range(192))
+    sigs += [base, noisy, noisy, noisy]
+    gate.should_skip(None, 0, 0, 1, 1)
+    gate.mark_inferred()
+    assert [gate.should_skip(None, 0, 0, 1, 1) for _ in range(3)] == [True, True, False]
+
+
+@pytest.mark.parametrize("script", SCRIPTS)
+def test_zone_off_screen_is_clipped_or_inferred(script):
+    gate = load_definitions(script, ["MotionGate"], image=image).MotionGate(max_skip=5)
+    img = Img()
+    # x1_ratio=0.85, x2_ratio=1.0 при 45° в AOG_MaixCam: (368, 44, 464, 201) - целиком за кадром
+    for _ in range(3):
+        assert gate.should_skip(img, 368, 44, 96, 157) is False
+        gate.mark_inferred()
+    assert img.crops == []
+    # частично за кадром: обрезается по краю
+    gate.should_skip(img, 300, -10, 96, 157)
+    assert img.crops == [(300, 0, 20, 147)]
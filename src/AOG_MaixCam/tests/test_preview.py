@@ -0,0 +1,54 @@
+import socket
+import threading
+
+import pytest
+
+from AOG_ScriptLoader import load_definitions
+from conftest import SCRIPTS, FakeClock
+
+
+@pytest.fixture(params=SCRIPTS)
+def streamer(request):
+    PreviewStreamer = load_definitions(request.param, ["PreviewStreamer"], time=FakeClock()).PreviewStreamer
+    s = PreviewStreamer(port=0)
+    s._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s._server.bind(("127.0.0.1", 0))
+    s._server.listen(1)
+    s._running = True
+    yield s
+    s._running = False
+    s._server.close()
+
+
+def run_accept_loop(streamer):
+    t = threading.Thread(target=streamer._accept_loop, daemon=True)
+    t.start()
+    return t
+
+
+def test_accept_loop_exits_when_socket_closed(streamer):
+    streamer._server.close()          # accept падает с EBADF: поток завершается, а не крутится
+    t = run_accept_loop(streamer)
+    t.join(timeout=2.0)
+    assert not t.is_alive()
+
+
+def test_accept_error_while_stopping_ends_loop(streamer):
+    class Failing:
+        calls = 0
+
+        def accept(self):
+            Failing.calls += 1
+            streamer._running = False
+            raise OSError(24, "Too many open files")
+
+        def fileno(self):
+            return 5
+
+        def close(self):
+            pass
+    streamer._server.close()
+    streamer._server = Failing()
+    t = run_accept_loop(streamer)
+    t.join(timeout=2.0)
+    assert not t.is_alive() and Failing.calls == 1
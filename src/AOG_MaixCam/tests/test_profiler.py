@@ -0,0 +1,46 @@
+import threading
+import time
+
+import pytest
+
+from AOG_ScriptLoader import load_definitions
+from conftest import SCRIPTS
+
+
+@pytest.fixture(params=SCRIPTS)
+def LoopProfiler(request):
+    return load_definitions(request.param, ["LoopProfiler"]).LoopProfiler
+
+
+def samplers():
+    return [t for t in threading.enumerate() if t.name.endswith("(_sample_loop)")]
+
+
+def wait_for(cond, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not cond() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return cond()
+
+
+def test_restart_right_after_stop_keeps_one_sampler(LoopProfiler, tmp_path):
+    profiler = LoopProfiler(str(tmp_path), frames=1, interval_ms=50)
+    assert profiler.start()
+    first = profiler.path
+    profiler.on_frame()                 # кадры кончились - поток еще может спать
+    assert profiler.start()
+    assert wait_for(lambda: len(samplers()) == 1)
+    profiler.on_frame()
+    assert wait_for(lambda: not samplers())
+    assert (tmp_path / first.rsplit("/", 1)[1]).exists()
+
+
+def test_start_error_is_returned_not_raised(LoopProfiler, tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    profiler = LoopProfiler(str(blocker / "profiles"), frames=1)
+    assert not profiler.start()
+    assert not profiler.active
+    assert profiler.error
+    assert not profiler.start("flame")
+    assert profiler.error == "mode"
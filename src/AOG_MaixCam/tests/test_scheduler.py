@@ -0,0 +1,81 @@
+import types
+from collections import Counter
+
+from AOG_ScriptLoader import load_definitions
+from conftest import FakeClock
+
+defs = load_definitions("AOG_Trapez.py", ["FrameResult", "CameraSource", "InferenceScheduler", "TravelDirection"],
+                        time=FakeClock())
+
+
+class Gate:
+    def mark_inferred(self):
+        pass
+
+
+class Detector:
+    def __init__(self):
+        self.calls = []
+
+    def detect(self, img, conf_th, iou_th):
+        self.calls.append(img)
+        return []
+
+
+def make(facings, batch_size=1, travel_weight=3):
+    sources = [defs.CameraSource(f"cam{i}", None, i, f, None, Gate()) for i, f in enumerate(facings)]
+    for s in sources:
+        s.img = s.name
+    detector = Detector()
+    return sources, detector, defs.InferenceScheduler(detector, sources, batch_size, travel_weight)
+
+
+def run(sources, scheduler, ticks, direction=1):
+    for _ in range(ticks):
+        for s in sources:
+            s.needs_inference = True
+        scheduler.run(direction, 0.5, 0.45)
+
+
+def test_shares_follow_weights():
+    sources, detector, scheduler = make([1, -1, -1])
+    run(sources, scheduler, 1000)
+    counts = Counter(detector.calls)
+    assert counts == {"cam0": 600, "cam1": 200, "cam2": 200}
+
+
+def test_credits_stay_bounded_with_batch():
+    # weights 3/1/1 with 2 slots: front is capped at one run per tick
+    sources, detector, scheduler = make([1, -1, -1], batch_size=2)
+    run(sources, scheduler, 1000)
+    assert all(abs(s.credit) <= 5 for s in sources)
+    counts = Counter(detector.calls)
+    assert counts["cam0"] == 1000
+    assert abs(counts["cam1"] - counts["cam2"]) <= 1
+
+
+def test_reverse_gives_priority_to_rear_camera():
+    sources, detector, scheduler = make([1, -1])
+    run(sources, scheduler, 400, direction=-1)
+    counts = Counter(detector.calls)
+    assert counts == {"cam0": 100, "cam1": 300}
+
+
+def test_only_waiting_cameras_run():
+    sources, detector, scheduler = make([1, -1])
+    sources[0].needs_inference = False
+    sources[1].needs_inference = True
+    assert scheduler.run(1, 0.5, 0.45) == 1
+    assert detector.calls == ["cam1"]
+
+
+def test_travel_direction_sources():
+    travel = defs.TravelDirection()  # без входа заднего хода
+    text = types.SimpleNamespace(mode="text")
+    pgn = types.SimpleNamespace(mode="pgn", last_set_ms=100, speed_kmh=0.0)
+    assert travel.current(1, text) == 1
+    assert travel.current(1, pgn) == 0       # стоит - без приоритета
+    pgn.speed_kmh = 6.0
+    assert travel.current(-1, pgn) == -1     # едет - ручное значение
+    travel.reverse_input = types.SimpleNamespace(value=lambda: 0)  # active low: включен
+    assert travel.current(1, text) == -1
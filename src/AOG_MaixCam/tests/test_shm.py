@@ -0,0 +1,96 @@
+from AOG_ScriptLoader import load_definitions
+from AOG_ShmReader import ShmReader
+from conftest import obj
+
+defs = load_definitions("AOG_Trapez.py", ["DetectionExport", "FrameResult"])
+
+
+def writer(path, slots=4):
+    export = defs.DetectionExport(str(path), slots=slots, max_dets=4, max_zones=1)
+    assert export.open()
+    return export
+
+
+def write(export, n, angle=0.0):
+    result = defs.FrameResult()
+    result.add(obj(10, 20, class_id=2), 1)
+    for _ in range(n):
+        export.begin()
+        export.zone(3, 1, ((0, 0), (1, 0), (1, 1), (0, 1)))
+        export.end(result, angle, True, 1, 3)
+
+
+def follow(reader, seq):
+    frames = reader.poll(seq)
+    return frames, (frames[-1].seq if frames else seq)
+
+
+def test_poll_reads_in_order_and_counts_lost(tmp_path):
+    export = writer(tmp_path / "ring")
+    reader = ShmReader(str(tmp_path / "ring"))
+    write(export, 2, angle=5.0)
+    frames, seq = follow(reader, 0)
+    assert [f.seq for f in frames] == [1, 2]
+    assert frames[0].angle == 5.0 and frames[0].dets[0][4] == 2
+    write(export, 6)                     # кольцо на 4 слота: 3 и 4 перезаписаны
+    frames, seq = follow(reader, seq)
+    assert [f.seq for f in frames] == [5, 6, 7, 8]
+    assert reader.lost == 2
+    assert reader.poll(seq) == []
+
+
+def test_writer_restart_with_fewer_frames(tmp_path):
+    export = writer(tmp_path / "ring")
+    reader = ShmReader(str(tmp_path / "ring"))
+    write(export, 3)
+    _, seq = follow(reader, 0)
+    assert seq == 3
+
+    export = writer(tmp_path / "ring")   # камера перезапущена: seq снова с 1
+    assert reader.poll(seq) == []        # кадров еще нет
+    write(export, 2)
+    frames, seq = follow(reader, seq)
+    assert [f.seq for f in frames] == [1, 2]
+    assert reader.restarts == 1
+    write(export, 1)
+    frames, seq = follow(reader, seq)
+    assert [f.seq for f in frames] == [3]
+
+
+def test_writer_restart_that_already_passed_last_seq(tmp_path):
+    export = writer(tmp_path / "ring", slots=4)
+    reader = ShmReader(str(tmp_path / "ring"))
+    write(export, 2)
+    _, seq = follow(reader, 0)
+
+    export = writer(tmp_path / "ring", slots=8)  # другое кольцо, seq уже дальше прочитанного
+    write(export, 5)
+    frames, seq = follow(reader, seq)
+    assert [f.seq for f in frames] == [1, 2, 3, 4, 5]
+    assert reader.slots == 8 and reader.restarts == 1
+
+
+def test_writer_restart_with_smaller_ring_keeps_file_size(tmp_path):
+    path = tmp_path / "ring"
+    writer(path, slots=8)
+    reader = ShmReader(str(path))
+    size = path.stat().st_size
+    old_mm = reader.mm
+
+    export = writer(path, slots=4)  # кольцо меньше, но файл не укорочен: старое отображение цело
+    assert path.stat().st_size == size
+    assert old_mm[size - 1] == 0     # при укороченном файле здесь был бы SIGBUS
+    write(export, 3)
+    frames, _ = follow(reader, 0)
+    assert [f.seq for f in frames] == [1, 2, 3]
+    assert reader.slots == 4 and reader.restarts == 1
+
+
+def test_view_is_zero_copy_slot(tmp_path):
+    export = writer(tmp_path / "ring")
+    reader = ShmReader(str(tmp_path / "ring"))
+    write(export, 1)
+    view = reader.view(1)
+    assert isinstance(view, memoryview) and len(view) == reader.slot_size
+    assert defs.DetectionExport.SEQ.unpack_from(view, 0)[0] == 1 and reader.is_current(1)
+    view.release()
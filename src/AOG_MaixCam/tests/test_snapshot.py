@@ -0,0 +1,34 @@
+import pytest
+
+from AOG_ScriptLoader import load_definitions
+from conftest import SCRIPTS
+
+
+class Img:
+    def __init__(self):
+        self.copies = 0
+
+    def copy(self):
+        self.copies += 1
+        return ("copy", self.copies)
+
+
+@pytest.fixture(params=SCRIPTS)
+def SnapshotRecorder(request):
+    return load_definitions(request.param, ["SnapshotRecorder"]).SnapshotRecorder
+
+
+def test_submit_queues_a_copy(SnapshotRecorder, tmp_path):
+    recorder = SnapshotRecorder(str(tmp_path), queue_size=1)
+    img = Img()
+    assert recorder.submit(img, {})
+    _, _, queued, meta = recorder._queue.get_nowait()
+    assert queued == ("copy", 1) and meta["onset"]
+
+
+def test_full_queue_drops_without_copy(SnapshotRecorder, tmp_path):
+    recorder = SnapshotRecorder(str(tmp_path), queue_size=1)
+    img = Img()
+    assert recorder.submit(img, {})
+    assert not recorder.submit(img, {})
+    assert img.copies == 1 and recorder.dropped == 1
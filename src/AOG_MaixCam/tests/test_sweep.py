@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+import AOG_Sweep
+from conftest import SCRIPTS
+
+CENTER = [150, 170, 10, 10, 0, 0.9]    # в зоне стоп при нулевом угле у обоих скриптов
+
+
+def session(path, frames):
+    with open(path, "w", encoding="utf-8") as f:
+        for t, ch, angle, dets, label in frames:
+            f.write(json.dumps({"t": t, "ch": ch, "angle": angle, "dets": dets, "label": label}) + "\n")
+    return str(path)
+
+
+@pytest.mark.parametrize("script", SCRIPTS)
+def test_toggles_counted_per_stream(script, tmp_path):
+    # две камеры, препятствие все время: ни одного переключения, ни одного пропуска
+    frames = [(i * 0.1, ch, 0.0, [CENTER], 1) for ch in (0, 1) for i in range(5)]
+    AOG_Sweep._init_worker([session(tmp_path / "s.jsonl", frames)])
+    _, _, m = AOG_Sweep.evaluate((script, {}, 320, 224))
+    assert m["frames"] == 10
+    assert m["toggles"] == 0
+    assert m["events"] == 2 and m["missed"] == 0 and m["miss_frames"] == 0
+
+
+@pytest.mark.parametrize("script", SCRIPTS)
+def test_toggles_inside_one_stream(script, tmp_path):
+    labels = [1, 1, 0, 0, 1]
+    frames = [(i * 0.1, 0, 0.0, [CENTER] if lab else [], lab) for i, lab in enumerate(labels)]
+    AOG_Sweep._init_worker([session(tmp_path / "s.jsonl", frames)])
+    _, _, m = AOG_Sweep.evaluate((script, {}, 320, 224))
+    assert m["toggles"] == 2
+    assert m["events"] == 2 and m["false_alarms"] == 0
+
+
+def test_decider_follows_main_loop_order(tmp_path):
+    # область motion gate считается по углу прошлого кадра, до проверки зоны (как в основном цикле)
+    AOG_Sweep._init_worker([session(tmp_path / "s.jsonl", [])])
+    calls = []
+    ZoneSet = AOG_Sweep._defs["AOG_Trapez.py"].ZoneSet
+    get_bbox, evaluate = ZoneSet.get_bbox, ZoneSet.evaluate
+    try:
+        ZoneSet.get_bbox = lambda self, angle=0.0: calls.append(("bbox", angle)) or get_bbox(self, angle)
+        ZoneSet.evaluate = lambda self, objs, res, names, angle: calls.append(("eval", angle)) or evaluate(
+            self, objs, res, names, angle)
+        decide = AOG_Sweep._decider("AOG_Trapez.py", {}, 320, 224)
+        decide([], 10.0)
+        decide([], 20.0)
+    finally:
+        ZoneSet.get_bbox, ZoneSet.evaluate = get_bbox, evaluate
+    assert calls == [("bbox", 0.0), ("eval", 10.0), ("bbox", 10.0), ("eval", 20.0)]
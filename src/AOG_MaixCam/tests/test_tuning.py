@@ -0,0 +1,74 @@
+import os
+import types
+
+import pytest
+
+from AOG_ScriptLoader import load_definitions
+from AOG_Tune import sign_command
+from conftest import SCRIPTS
+
+SECRET = "test-secret"
+
+
+@pytest.fixture(params=SCRIPTS)
+def make(request, tmp_path):
+    TuningControl = load_definitions(request.param, ["TuningControl"]).TuningControl
+    controls = []
+
+    def make():
+        t = TuningControl(SECRET, port=0, nonce_path=str(tmp_path / "nonce"))
+        controls.append(t)
+        return t
+    yield make
+    for t in controls:
+        t.udp_socket.close()
+
+
+def test_set_and_get(make):
+    t = make()
+    params = types.SimpleNamespace(conf_th=0.5)
+    t.register("conf_th", [(params, "conf_th")], float, 0.05, 0.95)
+    assert t._handle(sign_command(SECRET, "SET conf_th=0.3", 1)) == "OK conf_th=0.3"
+    assert params.conf_th == 0.3
+    assert t._handle(sign_command(SECRET, "SET conf_th=2", 2)).startswith("ERR range")
+    assert t._handle(sign_command(SECRET, "GET conf_th", 3)) == "OK conf_th=0.3"
+
+
+def test_bad_signatures_are_rejected(make):
+    t = make()
+    packet = sign_command(SECRET, "GET", 5)
+    nonce_cmd = packet.rsplit(b":", 1)[0]
+    assert t._handle(nonce_cmd + ":абвгдежзийклмноп".encode("utf-8")) == "ERR auth"
+    assert t._handle(nonce_cmd + b":0123") == "ERR auth"
+    assert t._handle(sign_command("other", "GET", 5)) == "ERR auth"
+    assert t._handle(b"\xff\xfe") == "ERR format"
+
+
+def test_replay_rejected_after_restart(make):
+    t = make()
+    packet = sign_command(SECRET, "GET", 1000)
+    assert t._handle(packet) == "OK "
+    assert t._handle(packet) == "ERR nonce"
+    restarted = make()
+    assert restarted._handle(packet) == "ERR nonce"
+    assert restarted._handle(sign_command(SECRET, "GET", 1001)) == "OK "
+
+
+def test_failing_command_is_reported(make):
+    t = make()
+
+    def broken(arg):
+        raise OSError(28, "No space left on device")
+    t.register_command("PROFILE", broken)
+    assert t._handle(sign_command(SECRET, "PROFILE", 1)) == "ERR failed OSError"
+
+
+def test_nonce_is_fsynced_before_and_after_rename(make, monkeypatch, tmp_path):
+    t = make()
+    synced = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: synced.append(os.path.exists(tmp_path / "nonce")) or real_fsync(fd))
+    assert t._handle(sign_command(SECRET, "GET", 7)) == "OK "
+    assert synced == [False, True]  # временный файл до os.replace, затем каталог
+    assert (tmp_path / "nonce").read_text() == "7"
+    assert not (tmp_path / "nonce.tmp").exists()
@@ -0,0 +1,49 @@
+import types
+
+import pytest
+
+from AOG_ScriptLoader import load_definitions
+from conftest import SCRIPTS
+
+network = types.SimpleNamespace(wifi=types.SimpleNamespace(Wifi=lambda: None))
+
+
+class Socket:
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, data, addr):
+        self.sent.append(bytes(data))
+
+
+@pytest.fixture(params=SCRIPTS)
+def wifi(request):
+    w = load_definitions(request.param, ["ObstaclePacket", "WiFiManager"], network=network).WiFiManager()
+    w.connected = True
+    w.udp_socket = Socket()
+    return w
+
+
+def test_default_message_has_no_seq(wifi):
+    wifi.send_obstacle_data(True, 2, 12.54)
+    wifi.send_obstacle_data(False, 0, -3.0)
+    assert wifi.udp_socket.sent == [b"OBSTACLE:1:COUNT:2:ANGLE:12.5",
+                                    b"OBSTACLE:0:COUNT:0:ANGLE:-3.0"]
+
+
+def test_seq_suffix_when_enabled(wifi):
+    wifi.send_seq = True
+    wifi.send_obstacle_data(True, 2, 12.54)
+    wifi.send_obstacle_data(False, 0, -3.0)
+    assert wifi.udp_socket.sent == [b"OBSTACLE:1:COUNT:2:ANGLE:12.5:SEQ:1",
+                                    b"OBSTACLE:0:COUNT:0:ANGLE:-3.0:SEQ:2"]
+
+
+def test_seq_digits_and_wrap(wifi):
+    wifi.send_seq = True
+    for seq in (9, 99, 9999, 65535):
+        wifi.seq = seq - 1
+        wifi.send_obstacle_data(False, 0, 0.0)
+        assert wifi.udp_socket.sent[-1] == b"OBSTACLE:0:COUNT:0:ANGLE:0.0:SEQ:%d" % seq
+    wifi.send_obstacle_data(False, 0, 0.0)
+    assert wifi.udp_socket.sent[-1].endswith(b":SEQ:0")
@@ -0,0 +1,88 @@
+import pytest
+
+from AOG_ScriptLoader import load_definitions
+from conftest import obj
+
+maixcam = load_definitions("AOG_MaixCam.py", ["ZoneConfig"])
+trapez = load_definitions("AOG_Trapez.py", ["FrameResult", "ZoneConfig", "ZoneSet", "quad_edge_coefficients",
+                                            "clamp", "make_zones", "ZONE_PRESETS", "GRADED_ZONE_PRESETS"])
+CLASSES = {0: "person"}
+
+
+def graded_zones(width=320, height=224):
+    zones = []
+    for preset in trapez.GRADED_ZONE_PRESETS:
+        z = trapez.ZoneConfig(width, height, preset["name"], preset["level"])
+        for k, v in preset.items():
+            if k not in ("name", "level"):
+                setattr(z, k, v)
+        zones.append(z)
+    return trapez.ZoneSet(width, height, zones)
+
+
+def test_rect_zone_follows_parameter_change():
+    zone = maixcam.ZoneConfig(320, 224)
+    before = zone.get_zone(10.0)
+    assert zone.get_zone(10.0) is before  # тот же угол и параметры - из кэша
+    zone.x1_ratio = 0.1
+    after = zone.get_zone(10.0)
+    assert after is not before and after[0] < before[0]
+
+
+def test_trapezoid_follows_parameter_change():
+    zone = trapez.ZoneConfig(320, 224)
+    assert zone._update_geometry(5.0)
+    assert not zone._update_geometry(5.0)
+    zone.shift_far_k = 1.5
+    assert zone._update_geometry(5.0)
+    assert zone._update_geometry(-5.0)
+
+
+def test_default_is_single_legacy_zone():
+    zones = trapez.make_zones(320, 224)
+    assert zones.n == 1 and zones.zones[0].name == "stop"
+
+
+@pytest.mark.parametrize("make", [trapez.make_zones, graded_zones])
+def test_bbox_before_evaluate_keeps_coefficients_fresh(make):
+    # основной цикл сначала вызывает get_bbox (motion gate), потом evaluate
+    zones = make(320, 224)
+    result = trapez.FrameResult()
+    center = obj(155, 180)
+    zones.get_bbox(0.0)
+    zones.evaluate([center], result, CLASSES, 0.0)
+    assert zones.stop_count == 1 and result.zone_count == 1
+
+    # угол сдвинул зону: пересчет снова съеден get_bbox, коэффициенты все равно новые
+    far_right = obj(290, 70)
+    zones.get_bbox(0.0)
+    zones.evaluate([far_right], result, CLASSES, 0.0)
+    assert zones.stop_count == 0
+    zones.get_bbox(30.0)
+    zones.evaluate([far_right], result, CLASSES, 30.0)
+    assert zones.stop_count == 1
+
+    # то же после изменения параметра (настройка по UDP)
+    for z in zones.zones:
+        z.max_shift_ratio = 0.0
+    zones.get_bbox(30.0)
+    zones.evaluate([far_right], result, CLASSES, 30.0)
+    assert zones.stop_count == 0
+
+
+def test_only_stop_zone_counts_as_obstacle():
+    zones = graded_zones()
+    result = trapez.FrameResult()
+    in_stop = obj(155, 180)
+    warn_only = obj(155, 30)
+    zones.evaluate([in_stop, warn_only], result, CLASSES, 0.0)
+
+    assert zones.level == 3
+    assert zones.stop_count == 1
+    assert result.zone_count == 1 and result.class_counts[0] == 1
+    assert list(result.in_zone[:2]) == [1, 0]
+    assert list(zones.det_levels[:2]) == [3, 1]
+    assert list(zones.counts) == [2, 1, 1]
+
+    zones.evaluate([warn_only], result, CLASSES, 0.0)
+    assert zones.level == 1 and zones.stop_count == 0 and result.zone_count == 0